@@ -0,0 +1,187 @@
+"""
+Benchmarks of rykit's own overhead: perf output parsing, command building
+and topology discovery, on synthetic perf output and fake sysfs/lscpu
+fixtures. No PMU, perf binary or root access is needed.
+
+    python benchmarks/bench_rykit.py --update-baseline   # record baseline.json
+    python benchmarks/bench_rykit.py                     # compare against it
+    python benchmarks/bench_rykit.py --quick             # small machine shapes only
+
+Each case reports the best of several repeats, its throughput and the
+peak memory allocated while it ran. A case is a regression when it is
+slower than the baseline by more than --tolerance (default 1.5x); the
+script then exits with status 1. Baselines are only comparable on the
+machine that recorded them, so baseline.json is not kept in git: record
+one with --update-baseline before comparing. Without a baseline the
+timings are only reported.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+# synthetic machines and perf output, shared with the test suite
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+
+from rykit.intel_tools import get_cha_count  # noqa: E402
+from rykit.linux_tools import parse_lscpu, parse_lscpu_cache  # noqa: E402
+from rykit.perf_interval import build_perf_interval_args, interpret_interval_line  # noqa: E402
+from rykit.perf_parse import index_perf_stat  # noqa: E402
+from rykit.perf_sample import interpret_core_events, interpret_per_core_events, interpret_per_core_matrix  # noqa: E402
+from rykit.perf_sample_intel import create_unc_cha_events, interpret_uncore_event_many  # noqa: E402
+from rykit.perf_schedule import build_perf_stat_args, schedule_events  # noqa: E402
+from rykit.topology import Topology  # noqa: E402
+from synthetic import (  # noqa: E402
+    Shape,
+    core_event_names,
+    event_codes,
+    interval_output,
+    lscpu_cache_output,
+    lscpu_output,
+    make_sysfs,
+    per_core_output,
+    uncore_output,
+)
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+SHAPES = [
+    Shape("small", 2, 16, 32, 4),
+    Shape("medium", 4, 32, 64, 16),
+    Shape("large", 8, 32, 128, 64),
+]
+
+
+class Result(NamedTuple):
+    case: str
+    seconds: float
+    items: int
+    peak_kib: float
+
+
+# harness
+
+
+def measure(case: str, fn: Callable[[], object], items: int, repeat: int) -> Result:
+    fn()  # warm caches and lazy imports
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(case, best, items, peak / 1024)
+
+
+def run_shape(shape: Shape, repeat: int, tmpdir: str) -> List[Result]:
+    rng = random.Random(0)
+    codes = event_codes(shape.events)
+    core_events = core_event_names(shape.events)
+    unc = uncore_output(shape, rng)
+    per_core = per_core_output(shape, rng)
+    intervals = interval_output(shape, rng)
+    interval_lines = intervals.splitlines()
+    sysfs = os.path.join(tmpdir, shape.name)
+    make_sysfs(sysfs, shape)
+    topo = Topology(sysfs)
+    cha_events = [e for code in codes for e in create_unc_cha_events(code, "0x1", sysfs)]
+    lscpu_text = lscpu_output(shape)
+    lscpu_cache_text = lscpu_cache_output(shape)
+    unc_lines = unc.count("\n")
+    core_lines = per_core.count("\n")
+
+    p = f"{shape.name}/"
+    return [
+        measure(p + "index_perf_stat[uncore]", lambda: index_perf_stat(unc), unc_lines, repeat),
+        measure(p + "interpret_uncore_event_many", lambda: interpret_uncore_event_many(unc, codes), unc_lines, repeat),
+        measure(p + "interpret_per_core_events", lambda: interpret_per_core_events(per_core, core_events, 0), core_lines, repeat),
+        measure(p + "interpret_per_core_matrix", lambda: interpret_per_core_matrix(per_core, core_events, topo), core_lines, repeat),
+        measure(p + "interpret_core_events", lambda: interpret_core_events(unc, cha_events), unc_lines, repeat),
+        measure(
+            p + "interpret_interval_line",
+            lambda: [interpret_interval_line(line) for line in interval_lines],
+            len(interval_lines),
+            repeat,
+        ),
+        measure(p + "get_cha_count", lambda: get_cha_count(sysfs), 1, repeat),
+        measure(
+            p + "create_unc_cha_events",
+            lambda: [create_unc_cha_events(code, "0x1", sysfs) for code in codes],
+            len(codes),
+            repeat,
+        ),
+        measure(p + "schedule_events[cha]", lambda: schedule_events(cha_events), len(cha_events), repeat),
+        measure(p + "build_perf_stat_args[cha]", lambda: build_perf_stat_args(cha_events, True), len(cha_events), repeat),
+        measure(p + "build_perf_interval_args[cha]", lambda: build_perf_interval_args(cha_events, 100, True), len(cha_events), repeat),
+        measure(p + "Topology", lambda: Topology(sysfs), len(topo.cpus), max(1, repeat // 4)),
+        measure(p + "parse_lscpu", lambda: parse_lscpu(lscpu_text), 1, repeat),
+        measure(p + "parse_lscpu_cache", lambda: parse_lscpu_cache(lscpu_cache_text), 1, repeat),
+    ]
+
+
+def report(results: List[Result], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"{'case':<48} {'time':>10} {'items/s':>12} {'peak KiB':>10} {'vs base':>8}")
+    for r in results:
+        base = baseline.get(r.case)
+        ratio = "" if base is None else f"{r.seconds / base['seconds']:.2f}x"
+        if base is not None and r.seconds > base["seconds"] * tolerance:
+            regressions.append(r.case)
+            ratio += " !"
+        rate = r.items / r.seconds if r.seconds > 0 else float("inf")
+        print(f"{r.case:<48} {r.seconds * 1e3:>8.3f}ms {rate:>12.0f} {r.peak_kib:>10.1f} {ratio:>8}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="only the small shape")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repeats per case (best is kept)")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor counted as a regression")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to compare against or update")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--filter", default="", help="only cases containing this substring")
+    args = parser.parse_args(argv)
+
+    shapes = SHAPES[:1] if args.quick else SHAPES
+    tmpdir = tempfile.mkdtemp(prefix="rykit-bench-")
+    try:
+        results = [r for shape in shapes for r in run_shape(shape, args.repeat, tmpdir) if args.filter in r.case]
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.update_baseline:
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one")
+    regressions = report(results, {} if args.update_baseline else baseline, args.tolerance)
+
+    if args.update_baseline:
+        baseline.update({r.case: {"seconds": r.seconds, "peak_kib": r.peak_kib} for r in results})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,6 @@
 def main() -> None:
-    print("Hello from rykit!")
+    # keep `import rykit` free of the sampling modules, see rykit.cli
+    import sys
+    from rykit.cli import main as cli_main
+
+    sys.exit(cli_main())
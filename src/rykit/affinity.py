@@ -0,0 +1,122 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import shutil
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+MPOL_BIND = 2
+
+# set_mempolicy syscall numbers, used when libnuma is not installed
+_SYS_SET_MEMPOLICY = {
+    "x86_64": 238,
+    "aarch64": 237,
+    "ppc64le": 261,
+    "ppc64": 261,
+    "s390x": 270,
+    "riscv64": 237,
+}
+
+
+class Pin(NamedTuple):
+    """
+    CPU affinity and memory binding to apply to a launched command.
+
+    Attributes:
+        cpus (Optional[List[int]]): CPUs the command may run on, None for no restriction.
+        mem_nodes (Optional[List[int]]): NUMA nodes memory is bound to, None for no restriction.
+    """
+
+    cpus: Optional[List[int]] = None
+    mem_nodes: Optional[List[int]] = None
+
+
+@lru_cache(maxsize=None)
+def numactl_installed() -> bool:
+    """Return whether the numactl binary is on PATH (looked up once per process)."""
+    return shutil.which("numactl") is not None
+
+
+@lru_cache(maxsize=None)
+def _set_mempolicy() -> Optional[Callable[[int, ctypes.Array, int], int]]:
+    libnuma = ctypes.util.find_library("numa")
+    if libnuma is not None:
+        try:
+            return ctypes.CDLL(libnuma, use_errno=True).set_mempolicy
+        except (OSError, AttributeError):
+            pass
+    nr = _SYS_SET_MEMPOLICY.get(platform.machine())
+    if nr is None:
+        return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    return lambda mode, mask, maxnode: libc.syscall(nr, mode, mask, maxnode)
+
+
+def native_pinning_available(pin: Pin) -> bool:
+    """
+    Return whether pin can be applied in-process, without numactl.
+
+    CPU affinity needs os.sched_setaffinity; memory binding needs
+    set_mempolicy from libnuma or a known syscall number for this arch.
+    """
+    if pin.cpus is not None and not hasattr(os, "sched_setaffinity"):
+        return False
+    if pin.mem_nodes is not None and _set_mempolicy() is None:
+        return False
+    return True
+
+
+def apply_pin(pin: Pin):
+    """
+    Apply pin to the calling process; children and exec'd programs inherit it.
+
+    Raises:
+        OSError: If the kernel rejects the affinity or memory policy.
+    """
+    if pin.cpus is not None:
+        os.sched_setaffinity(0, pin.cpus)
+    if pin.mem_nodes is not None:
+        set_mempolicy = _set_mempolicy()
+        assert set_mempolicy is not None, "set_mempolicy is not available"
+        bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+        words = (ctypes.c_ulong * (max(pin.mem_nodes) // bits + 1))()
+        for node in pin.mem_nodes:
+            words[node // bits] |= 1 << (node % bits)
+        # the kernel ignores the last bit of maxnode
+        if set_mempolicy(MPOL_BIND, words, len(words) * bits + 1) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"set_mempolicy failed: {os.strerror(errno)}")
+
+
+def pin_prefix(pin: Pin) -> str:
+    """
+    Return the numactl command prefix equivalent to pin (the fallback path).
+
+    Raises:
+        RuntimeError: If numactl is not installed.
+    """
+    if not numactl_installed():
+        raise RuntimeError("numactl should be installed")
+    prefix = "numactl "
+    if pin.mem_nodes is not None:
+        prefix += f"--membind={','.join(str(n) for n in pin.mem_nodes)} "
+    if pin.cpus is not None:
+        prefix += f"--physcpubind={','.join(str(c) for c in pin.cpus)} "
+    return prefix
+
+
+def launch_pin(pin: Optional[Pin], cmd: str) -> Tuple[str, Optional[Callable[[], None]]]:
+    """
+    Decide how to apply pin when launching cmd.
+
+    Returns:
+        (cmd, preexec_fn): cmd unchanged plus a preexec_fn applying pin in the
+            child when native pinning is available, otherwise cmd prefixed
+            with numactl and no preexec_fn.
+    """
+    if pin is None:
+        return cmd, None
+    if native_pinning_available(pin):
+        return cmd, lambda: apply_pin(pin)
+    return pin_prefix(pin) + cmd, None
@@ -0,0 +1,291 @@
+import argparse
+import csv
+import json
+import os
+import shlex
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+# Subcommand handlers import the sampling modules themselves, so `rykit topo`
+# never loads the perf machinery and `rykit stat` never loads the uncore code.
+
+FORMATS = ("ndjson", "csv")
+
+
+class RowWriter:
+    """
+    Write result rows to a stream as NDJSON or CSV as soon as they are produced.
+
+    CSV columns are taken from the first row. NaN values are written as
+    null (NDJSON) or empty fields (CSV).
+
+    Attributes:
+        fmt (str): "ndjson" or "csv".
+        out (TextIO): Destination stream.
+        flush (bool): Flush after every row, for streaming into pipes.
+    """
+
+    def __init__(self, fmt: str = "ndjson", out: Optional[TextIO] = None, flush: bool = False):
+        assert fmt in FORMATS, f"format must be one of {FORMATS} (passed {fmt})"
+        self.fmt = fmt
+        self.out = sys.stdout if out is None else out
+        self.flush = flush
+        self._csv: Optional[csv.DictWriter] = None
+
+    def write(self, row: Dict[str, Any]):
+        row = {k: None if isinstance(v, float) and v != v else v for k, v in row.items()}
+        if self.fmt == "ndjson":
+            self.out.write(json.dumps(row, separators=(",", ":")) + "\n")
+        else:
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.out, fieldnames=list(row), restval="", lineterminator="\n")
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        if self.flush:
+            self.out.flush()
+
+    def write_all(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self.write(row)
+
+
+def _command(args: argparse.Namespace) -> str:
+    cmd = list(args.cmd)
+    if cmd and cmd[0] == "--":
+        cmd = cmd[1:]
+    if not cmd:
+        raise ValueError("no command given, pass it after --")
+    # a single argument is taken as a shell string ("./bench -t 4 | tee log")
+    return cmd[0] if len(cmd) == 1 else shlex.join(cmd)
+
+
+def _pin(args: argparse.Namespace):
+    if args.cpus is None and args.mem_node is None:
+        return None
+    from rykit.affinity import Pin
+    from rykit.topology import parse_range_list
+
+    cpus = None if args.cpus is None else parse_range_list(args.cpus)
+    return Pin(cpus, None if args.mem_node is None else [args.mem_node])
+
+
+def _unc_event(spec: str) -> Tuple[str, str]:
+    # EVENT:UMASK with a binary umask as the library takes it, or 0x-prefixed hex
+    event, sep, umask = spec.partition(":")
+    if not sep or not event or not umask:
+        raise argparse.ArgumentTypeError(f"expected EVENT:UMASK (e.g. 0xb3:00001000), got {spec}")
+    if umask.lower().startswith("0x"):
+        try:
+            umask = format(int(umask, 16), "b")
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"umask {umask} is not hexadecimal")
+    return event, umask
+
+
+def _interval_rows(records) -> Iterable[Dict[str, Any]]:
+    try:
+        for r in records:
+            yield {"timestamp": r.timestamp, "event": r.event, "unit": r.unit, "value": r.value}
+    finally:
+        # stops perf and the workload if the consumer went away
+        records.close()
+
+
+def _matrix_rows(mat, axis: str, sockets: Optional[List[int]] = None) -> Iterable[Dict[str, Any]]:
+    # one row per reported CounterMatrix cell, axis names its third dimension
+    for event in mat.events:
+        for socket in mat.sockets if sockets is None else sockets:
+            for key, value in zip(mat.cores, mat.plane(event)[mat.sockets.index(socket) * len(mat.cores) :]):
+                if value == value:
+                    yield {"event": event, "socket": socket, axis: key, "value": value}
+
+
+def _stat(args: argparse.Namespace, out: RowWriter):
+    cmd = _command(args)
+    if args.interval is not None:
+        from rykit.perf_interval import perf_stream_interval
+
+        records = perf_stream_interval(
+            cmd, args.events, args.interval, system_wide=args.system_wide, sudo=args.sudo, pin=_pin(args)
+        )
+        out.write_all(_interval_rows(records))
+        return
+    if args.system_wide:
+        from rykit.perf_schedule import perf_sample_scheduled
+
+        res = perf_sample_scheduled(
+            cmd, args.events, system_wide=True, sudo=args.sudo, pin=_pin(args), backend=args.backend
+        )
+        counts = res.counts
+    else:
+        from rykit.perf_sample import perf_sample_core_events
+
+        counts = perf_sample_core_events(cmd, args.events, sudo=args.sudo, pin=_pin(args), backend=args.backend)
+    out.write_all({"event": e, "value": v} for e, v in counts.items())
+
+
+def _cha(args: argparse.Namespace, out: RowWriter):
+    cmd = _command(args)
+    if args.interval is not None:
+        from rykit.perf_sample_intel import perf_stream_uncore_event_many
+
+        out.write_all(_interval_rows(perf_stream_uncore_event_many(cmd, args.events, args.interval, pin=_pin(args))))
+        return
+    from rykit.perf_sample_intel import perf_sample_uncore_event_many
+
+    res = perf_sample_uncore_event_many(cmd, args.events, mode=args.mode, pin=_pin(args), backend=args.backend)
+    out.write_all(
+        {"event": event, "cha": int(cha), "value": value}
+        for event, per_cha in res.items()
+        for cha, value in per_cha.items()
+    )
+
+
+def _amd_df(args: argparse.Namespace, out: RowWriter):
+    cmd = _command(args)
+    if args.per_instance or args.l3:
+        from rykit.perf_sample_amd import perf_sample_amd_uncore_instances
+
+        pmu = "amd_l3" if args.l3 else "amd_df"
+        res = perf_sample_amd_uncore_instances(cmd, args.events, pmu=pmu, sudo=args.sudo, pin=_pin(args))
+        out.write_all(_matrix_rows(res.counts, "instance"))
+        return
+    from rykit.perf_sample_amd import perf_sample_amd_uncore_event_many
+
+    res = perf_sample_amd_uncore_event_many(
+        cmd, args.events, sudo=args.sudo, mode=args.mode, pin=_pin(args), backend=args.backend
+    )
+    out.write_all({"event": e, "value": v} for e, v in res.items())
+
+
+def _percore(args: argparse.Namespace, out: RowWriter):
+    cmd = _command(args)
+    if args.interval is not None:
+        from rykit.perf_interval import perf_stream_interval
+
+        records = perf_stream_interval(cmd, args.events, args.interval, per_core=True, sudo=args.sudo, pin=_pin(args))
+        out.write_all(_interval_rows(records))
+        return
+    from rykit.perf_sample import perf_sample_per_core_matrix
+
+    mat = perf_sample_per_core_matrix(cmd, args.events, pin=_pin(args), sudo=args.sudo)
+    out.write_all(_matrix_rows(mat, "core", None if args.socket is None else [args.socket]))
+
+
+def _topo(args: argparse.Namespace, out: RowWriter):
+    from rykit.topology import Topology
+
+    topo = Topology(args.sysfs_root)
+    caches = topo.cache_names()
+    for cpu in topo.cpus:
+        package, core = topo.core_of(cpu)
+        row: Dict[str, Any] = {"cpu": cpu, "package": package, "node": topo.node_of(cpu), "core": core}
+        for name in caches:
+            try:
+                row[name] = topo.cache_id(cpu, name)
+            except KeyError:
+                row[name] = None
+        out.write(row)
+
+
+def _add_run_args(p: argparse.ArgumentParser, sudo: bool = True):
+    p.add_argument("--cpus", help="pin the command to these CPUs, e.g. 0-3,8")
+    p.add_argument("--mem-node", type=int, help="bind the command's memory to this NUMA node")
+    if sudo:
+        p.add_argument("--no-sudo", dest="sudo", action="store_false", help="run perf without sudo")
+    p.add_argument("cmd", nargs=argparse.REMAINDER, help="command to measure, after --")
+
+
+def _check_args(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    # options a subcommand accepts but one of its code paths cannot honour
+    if getattr(args, "interval", None) is None:
+        return
+    # streaming always runs the perf binary with every event scheduled at once
+    if getattr(args, "backend", "perf") != "perf":
+        parser.error(f"{args.command}: --backend {args.backend} cannot be combined with -I")
+    if getattr(args, "mode", "sequential") != "sequential":
+        parser.error(f"{args.command}: --mode {args.mode} cannot be combined with -I")
+    if getattr(args, "socket", None) is not None:
+        parser.error(f"{args.command}: --socket cannot be combined with -I")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the argument parser of the rykit command."""
+    parser = argparse.ArgumentParser(prog="rykit", description="Count perf events and print NDJSON or CSV rows.")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="ndjson", help="output format (default ndjson)")
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND")
+    sub.required = True
+
+    p = sub.add_parser("stat", help="count core events over a command")
+    p.add_argument("-e", "--event", dest="events", action="append", required=True, help="perf event, repeatable")
+    p.add_argument("-I", "--interval", type=int, help="stream a row per event every INTERVAL ms")
+    p.add_argument("-a", "--system-wide", action="store_true", help="count on all CPUs")
+    p.add_argument("--backend", choices=("perf", "syscall"), default="perf")
+    _add_run_args(p)
+    p.set_defaults(handler=_stat)
+
+    p = sub.add_parser("cha", help="count Intel CHA uncore events per CHA")
+    p.add_argument("-e", "--event", dest="events", action="append", type=_unc_event, required=True,
+                   help="EVENT:UMASK with a binary or 0x umask, repeatable")
+    p.add_argument("-I", "--interval", type=int, help="stream a row per event and CHA every INTERVAL ms")
+    p.add_argument("--mode", choices=("sequential", "multiplex"), default="sequential")
+    p.add_argument("--backend", choices=("perf", "syscall"), default="perf")
+    _add_run_args(p, sudo=False)
+    p.set_defaults(handler=_cha)
+
+    p = sub.add_parser("amd-df", help="count AMD data fabric (or L3) uncore events")
+    p.add_argument("-e", "--event", dest="events", action="append", type=_unc_event, required=True,
+                   help="EVENT:UMASK with a binary or 0x umask, repeatable")
+    p.add_argument("--per-instance", action="store_true", help="one row per socket instance, in a single run")
+    p.add_argument("--l3", action="store_true", help="count amd_l3 events, one row per CCX")
+    p.add_argument("--mode", choices=("sequential", "multiplex"), default="sequential")
+    p.add_argument("--backend", choices=("perf", "syscall"), default="perf")
+    _add_run_args(p)
+    p.set_defaults(handler=_amd_df)
+
+    p = sub.add_parser("percore", help="count core events per physical core")
+    p.add_argument("-e", "--event", dest="events", action="append", required=True, help="perf event, repeatable")
+    p.add_argument("-I", "--interval", type=int, help="stream a row per event and core every INTERVAL ms")
+    p.add_argument("--socket", type=int, help="only report this socket")
+    _add_run_args(p)
+    p.set_defaults(handler=_percore)
+
+    p = sub.add_parser("topo", help="print the CPU, NUMA and cache topology, one row per CPU")
+    p.add_argument("--sysfs-root", default="/sys")
+    p.set_defaults(handler=_topo)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the rykit command line.
+
+    Args:
+        argv (Optional[List[str]]): Arguments, defaults to sys.argv[1:].
+
+    Returns:
+        int: Exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    _check_args(parser, args)
+    streaming = getattr(args, "interval", None) is not None
+    out = RowWriter(args.format, flush=streaming)
+    handler: Callable[[argparse.Namespace, RowWriter], None] = args.handler
+    from rykit.cmd import CommandTimeout
+
+    try:
+        handler(args, out)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader (head, a closed pipe) went away; silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 141
+    except (ValueError, AssertionError, RuntimeError, CommandTimeout, OSError) as e:
+        # CommandFailed and invalid events are ValueErrors; a missing perf or
+        # numactl is an OSError and daemon failures are RuntimeErrors
+        print(f"rykit: error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
@@ -1,27 +1,88 @@
+import asyncio
+import logging
+import os
+import shlex
+import signal
 import subprocess
-def run_command_read_stderr(cmd: str) -> str:
+import time
+from typing import Any, AsyncIterator, Awaitable, Iterator, List, Optional, Tuple
+from rykit.affinity import Pin, apply_pin, launch_pin, native_pinning_available, pin_prefix
+from rykit.instrument import EXEC, EXIT, SPAWN, context, emit, enabled
+from rykit.perf_daemon import astream_job, stream_job, workload_argv
+
+# seconds a stopped command gets to exit (and perf to print its counts) before SIGKILL
+STOP_GRACE = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class CommandFailed(ValueError):
+    """
+    A command exited with a code other than 0 or 124.
+
+    Attributes:
+        returncode (int): Exit code of the command.
+        output (str): What the command wrote to the captured stream.
+    """
+
+    def __init__(self, returncode: int, output: str = ""):
+        super().__init__(f"Command failed with exit code {returncode}.")
+        self.returncode = returncode
+        self.output = output
+
+
+class CommandTimeout(Exception):
+    """
+    A command was stopped because it ran past its timeout.
+
+    Attributes:
+        cmd (str): The command that was stopped.
+        timeout (float): The limit in seconds.
+        output (str): stderr written before and while stopping; perf prints
+                      the counts gathered so far when its workload dies.
+    """
+
+    def __init__(self, cmd: str, timeout: float, output: str = ""):
+        super().__init__(f"Command timed out after {timeout}s: {cmd}")
+        self.cmd = cmd
+        self.timeout = timeout
+        self.output = output
+
+
+def run_command_read_stderr(cmd: str, pin: Optional[Pin] = None) -> str:
     """
     Run a shell command and capture stderr output.
 
     Args:
         cmd (str): The shell command to execute.
+        pin (Optional[Pin]): CPU/memory binding, applied in the child before
+                             exec when possible, else via a numactl prefix.
 
     Returns:
         str: The stderr output of the command (perf writes stats here).
     """
-    print(f"running cmd: {cmd}")
-    result = subprocess.run(
-        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-    output: str = result.stderr  # perf outputs stats to stderr
-    if result.returncode == 124:  # 124 is timeout exit code
-        print("Command timed out as expected.")
-    elif result.returncode != 0:
+    cmd, preexec_fn = launch_pin(pin, cmd)
+    logger.info("running cmd: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    with subprocess.Popen(
+        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        preexec_fn=preexec_fn,
+    ) as proc:
+        exec_ns = time.monotonic_ns()
+        try:
+            _, output = proc.communicate()  # perf outputs stats to stderr
+        except BaseException:
+            proc.kill()
+            raise
+    _emit_process(cmd, spawn_ns, exec_ns, len(output), proc.returncode, "shell")
+    if proc.returncode == 124:  # 124 is timeout exit code
+        logger.debug("Command timed out as expected.")
+    elif proc.returncode != 0:
         # output is stderr
-        print(output)
-        raise ValueError(f"Command failed with exit code {result.returncode}.")
+        logger.error("command failed with exit code %d:\n%s", proc.returncode, output)
+        raise CommandFailed(proc.returncode, output)
     else:
-        print("command returned 0")
+        logger.debug("command returned 0")
     return output
 
 
@@ -35,14 +96,563 @@ def run_command_read_stdout(cmd: str) -> str:
     Returns:
         str: The stderr output of the command (perf writes stats here).
     """
-    print(f"running cmd: {cmd}")
-    result = subprocess.run(
+    logger.info("running cmd: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    with subprocess.Popen(
         cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
-    output: str = result.stdout
-    if result.returncode == 124:  # 124 is timeout exit code
-        print("Command timed out as expected.")
-    elif result.returncode != 0:
-        print(result.stderr)
-        raise ValueError(f"Command failed with exit code {result.returncode}.")
+    ) as proc:
+        exec_ns = time.monotonic_ns()
+        try:
+            output, stderr = proc.communicate()
+        except BaseException:
+            proc.kill()
+            raise
+    _emit_process(cmd, spawn_ns, exec_ns, len(output), proc.returncode, "shell")
+    if proc.returncode == 124:  # 124 is timeout exit code
+        logger.debug("Command timed out as expected.")
+    elif proc.returncode != 0:
+        logger.error("command failed with exit code %d:\n%s", proc.returncode, stderr)
+        raise CommandFailed(proc.returncode, stderr)
     return output
+
+
+def _check_returncode(returncode: int) -> None:
+    if returncode == 124:  # 124 is timeout exit code
+        logger.debug("Command timed out as expected.")
+    elif returncode != 0:
+        raise CommandFailed(returncode)
+    else:
+        logger.debug("command returned 0")
+
+
+def _emit_process(
+    cmd: str, spawn_ns: int, exec_ns: int, output_bytes: int, returncode: Optional[int], via: str
+) -> None:
+    # spawn: creating the process, exec: running until output was drained
+    # and it exited, exit: reaped with returncode
+    if not enabled():
+        return
+    end_ns = time.monotonic_ns()
+    emit(SPAWN, spawn_ns, exec_ns, cmd=cmd, via=via)
+    emit(EXEC, exec_ns, end_ns, cmd=cmd, via=via, output_bytes=output_bytes, returncode=returncode)
+    emit(EXIT, end_ns, cmd=cmd, via=via, returncode=returncode)
+
+
+def stream_command_stderr(cmd: str, pin: Optional[Pin] = None) -> Iterator[str]:
+    """
+    Run a shell command and yield its stderr line by line as it is written.
+
+    Only one line is held in memory at a time. Closing the generator early
+    terminates the command.
+
+    Args:
+        cmd (str): The shell command to execute.
+        pin (Optional[Pin]): CPU/memory binding, see run_command_read_stderr.
+
+    Yields:
+        str: Each stderr line, without the trailing newline.
+
+    Raises:
+        CommandFailed: If the command exits with a code other than 0 or 124.
+    """
+    cmd, preexec_fn = launch_pin(pin, cmd)
+    logger.info("running cmd: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    proc = subprocess.Popen(
+        cmd,
+        shell=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        preexec_fn=preexec_fn,
+    )
+    exec_ns = time.monotonic_ns()
+    assert proc.stderr is not None
+    nbytes = 0
+    try:
+        for line in proc.stderr:
+            nbytes += len(line)
+            yield line.rstrip("\n")
+        returncode = proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+        proc.stderr.close()
+        _emit_process(cmd, spawn_ns, exec_ns, nbytes, proc.returncode, "shell")
+    _check_returncode(returncode)
+
+
+def stream_command_stdout(cmd: str) -> Iterator[str]:
+    """
+    Run a shell command and yield its stdout line by line as it is written.
+
+    Only one line is held in memory at a time, so commands producing many
+    GB of output (perf script) can be consumed incrementally. Closing the
+    generator early terminates the command.
+
+    Args:
+        cmd (str): The shell command to execute.
+
+    Yields:
+        str: Each stdout line, without the trailing newline.
+
+    Raises:
+        CommandFailed: If the command exits with a code other than 0 or 124.
+    """
+    logger.info("running cmd: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    proc = subprocess.Popen(
+        cmd,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        errors="replace",
+        bufsize=1 << 16,
+    )
+    exec_ns = time.monotonic_ns()
+    assert proc.stdout is not None
+    nbytes = 0
+    try:
+        for line in proc.stdout:
+            nbytes += len(line)
+            yield line.rstrip("\n")
+        returncode = proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait()
+        proc.stdout.close()
+        _emit_process(cmd, spawn_ns, exec_ns, nbytes, proc.returncode, "shell")
+    _check_returncode(returncode)
+
+
+async def astream_command_stderr(cmd: str, pin: Optional[Pin] = None) -> AsyncIterator[str]:
+    """
+    Async counterpart of stream_command_stderr.
+
+    Args:
+        cmd (str): The shell command to execute.
+        pin (Optional[Pin]): CPU/memory binding, see run_command_read_stderr.
+
+    Yields:
+        str: Each stderr line, without the trailing newline.
+
+    Raises:
+        CommandFailed: If the command exits with a code other than 0 or 124.
+    """
+    cmd, preexec_fn = launch_pin(pin, cmd)
+    logger.info("running cmd: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    proc = await asyncio.create_subprocess_shell(
+        cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        preexec_fn=preexec_fn,
+    )
+    exec_ns = time.monotonic_ns()
+    assert proc.stderr is not None
+    nbytes = 0
+    try:
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            nbytes += len(line)
+            yield line.decode().rstrip("\n")
+        returncode = await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.terminate()
+            await proc.wait()
+        _emit_process(cmd, spawn_ns, exec_ns, nbytes, proc.returncode, "async")
+    _check_returncode(returncode)
+
+
+def perf_command(perf_args: List[str], cmd: str, sudo: bool = True) -> str:
+    """
+    Render a perf invocation as a shell command string.
+
+    Args:
+        perf_args (List[str]): Arguments after the perf executable.
+        cmd (str): The shell command perf should run.
+        sudo (bool): Whether to run command as sudo
+
+    Returns:
+        str: e.g. "sudo perf stat -x ';' -e cycles ./bench".
+    """
+    full_cmd = " ".join(["perf"] + [shlex.quote(a) for a in perf_args] + [cmd])
+    if sudo:
+        full_cmd = "sudo " + full_cmd
+    return full_cmd
+
+
+def _perf_pin(pin: Optional[Pin], cmd: str) -> Tuple[str, Optional[Pin]]:
+    # native pins go on perf itself and are inherited by the workload, the
+    # numactl fallback has to wrap only the workload
+    if pin is None or native_pinning_available(pin):
+        return cmd, pin
+    return pin_prefix(pin) + cmd, None
+
+
+def run_perf_read_stderr(
+    perf_args: List[str], cmd: str, sudo: bool = True, pin: Optional[Pin] = None
+) -> str:
+    """
+    Run perf over a command and capture stderr output.
+
+    If sudo is requested and a rykit.perf_daemon helper is running, the job
+    is sent to it (no shell, no sudo per call); otherwise this is
+    run_command_read_stderr on the equivalent `sudo perf ...` string.
+
+    Args:
+        perf_args (List[str]): Arguments after the perf executable.
+        cmd (str): The command perf should run.
+        sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for the workload.
+
+    Returns:
+        str: The stderr output of perf.
+    """
+    cmd, pin = _perf_pin(pin, cmd)
+    with context(events=perf_args.count("-e")):
+        if sudo:
+            spawn_ns = time.monotonic_ns()
+            lines = stream_job(perf_args, cmd, pin=pin)
+            if lines is not None:
+                exec_ns = time.monotonic_ns()
+                rendered = perf_command(perf_args, cmd, sudo=False)
+                logger.info("running cmd via perf daemon: %s", rendered)
+                output: List[str] = []
+                returncode: Optional[int] = None
+                try:
+                    for line in lines:
+                        output.append(line)
+                    returncode = 0
+                except ValueError:
+                    logger.error("%s", "\n".join(output))
+                    raise
+                finally:
+                    _emit_process(rendered, spawn_ns, exec_ns, sum(map(len, output)), returncode, "daemon")
+                return "\n".join(output)
+        return run_command_read_stderr(perf_command(perf_args, cmd, sudo), pin=pin)
+
+
+def stream_perf_stderr(
+    perf_args: List[str], cmd: str, sudo: bool = True, pin: Optional[Pin] = None
+) -> Iterator[str]:
+    """
+    Run perf over a command and yield its stderr line by line, through the
+    perf daemon when one is running (see run_perf_read_stderr).
+
+    Closing the generator early stops perf and the workload (SIGINT to their
+    process group, SIGKILL after STOP_GRACE seconds).
+    """
+    cmd, pin = _perf_pin(pin, cmd)
+    if sudo:
+        lines = stream_job(perf_args, cmd, pin=pin)
+        if lines is not None:
+            logger.info("running cmd via perf daemon: %s", perf_command(perf_args, cmd, sudo=False))
+            return lines
+    return _stream_perf_local(perf_args, cmd, sudo, pin)
+
+
+def stream_perf_stdout(perf_args: List[str], sudo: bool = True) -> Iterator[str]:
+    """
+    Run a perf command without a workload (e.g. perf script) and yield its
+    stdout line by line, through the perf daemon when one is running (see
+    run_perf_read_stderr).
+    """
+    if sudo:
+        lines = stream_job(perf_args, "", output="stdout")
+        if lines is not None:
+            logger.info("running cmd via perf daemon: %s", perf_command(perf_args, "", sudo=False))
+            return lines
+    return stream_command_stdout(perf_command(perf_args, "", sudo))
+
+
+def _stream_perf_local(perf_args: List[str], cmd: str, sudo: bool, pin: Optional[Pin]) -> Iterator[str]:
+    argv = _perf_argv(perf_args, cmd, sudo)
+    logger.info("running cmd: %s", shlex.join(argv))
+    spawn_ns = time.monotonic_ns()
+    proc = subprocess.Popen(
+        argv,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        # own process group, so closing early reaches perf and the workload
+        start_new_session=True,
+        preexec_fn=None if pin is None else (lambda: apply_pin(pin)),
+    )
+    exec_ns = time.monotonic_ns()
+    assert proc.stderr is not None
+    nbytes = 0
+    try:
+        for line in proc.stderr:
+            nbytes += len(line)
+            yield line.rstrip("\n")
+        returncode = proc.wait()
+    finally:
+        try:
+            if proc.poll() is None:
+                _stop_sync(proc, sudo)
+        finally:
+            proc.stderr.close()
+            with context(events=perf_args.count("-e")):
+                _emit_process(shlex.join(argv), spawn_ns, exec_ns, nbytes, proc.returncode, "shell")
+    _check_returncode(returncode)
+
+
+async def astream_perf_stderr(
+    perf_args: List[str], cmd: str, sudo: bool = True, pin: Optional[Pin] = None
+) -> AsyncIterator[str]:
+    """
+    Async counterpart of stream_perf_stderr.
+    """
+    cmd, pin = _perf_pin(pin, cmd)
+    lines = None
+    if sudo:
+        lines = await astream_job(perf_args, cmd, pin=pin)
+    if lines is not None:
+        logger.info("running cmd via perf daemon: %s", perf_command(perf_args, cmd, sudo=False))
+    else:
+        lines = astream_command_stderr(perf_command(perf_args, cmd, sudo), pin=pin)
+    async for line in lines:
+        yield line
+
+
+def _perf_argv(perf_args: List[str], cmd: str, sudo: bool) -> List[str]:
+    # same argv the perf daemon runs, see perf_daemon.workload_argv
+    return (["sudo"] if sudo else []) + workload_argv("perf", perf_args, cmd)
+
+
+def _sudo_kill_argv(pgid: int, sig: signal.Signals) -> List[str]:
+    # perf and the workload run as root under sudo, so only root can signal them
+    return ["sudo", "-n", "kill", "-s", sig.name[3:], "--", f"-{pgid}"]
+
+
+def _signal_self(proc: Any, sig: signal.Signals):
+    # fallback when `sudo -n kill` is refused (expired credentials): sudo
+    # relays signals it receives to the command it runs
+    try:
+        proc.send_signal(sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _signal_group_sync(proc: subprocess.Popen, sig: signal.Signals, sudo: bool):
+    # blocking counterpart of _signal_group
+    if not sudo:
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        return
+    killer = subprocess.run(_sudo_kill_argv(proc.pid, sig), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if killer.returncode != 0 and proc.poll() is None:
+        logger.warning("sudo kill -%s of %d failed, signalling sudo directly", sig.name[3:], proc.pid)
+        _signal_self(proc, sig)
+
+
+def _stop_sync(proc: subprocess.Popen, sudo: bool):
+    # blocking counterpart of _stop
+    _signal_group_sync(proc, signal.SIGINT, sudo)
+    try:
+        proc.wait(STOP_GRACE)
+    except subprocess.TimeoutExpired:
+        pass
+    _signal_group_sync(proc, signal.SIGKILL, sudo)
+    try:
+        proc.wait(STOP_GRACE)
+    except subprocess.TimeoutExpired:
+        raise CommandTimeout(shlex.join(proc.args), STOP_GRACE) from None
+
+
+async def _signal_group(proc: asyncio.subprocess.Process, sig: signal.Signals, sudo: bool):
+    if not sudo:
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        return
+    killer = await asyncio.create_subprocess_exec(
+        *_sudo_kill_argv(proc.pid, sig), stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    if await killer.wait() != 0 and proc.returncode is None:
+        logger.warning("sudo kill -%s of %d failed, signalling sudo directly", sig.name[3:], proc.pid)
+        _signal_self(proc, sig)
+
+
+async def _stop(proc: asyncio.subprocess.Process, sudo: bool, cmd: str):
+    # SIGINT first: the workload dies and perf prints what it has counted
+    await _signal_group(proc, signal.SIGINT, sudo)
+    try:
+        await asyncio.wait_for(proc.wait(), STOP_GRACE)
+    except asyncio.TimeoutError:
+        pass
+    # also reaps group members that ignore SIGINT and would hold stderr open
+    await _signal_group(proc, signal.SIGKILL, sudo)
+    try:
+        await asyncio.wait_for(proc.wait(), STOP_GRACE)
+    except asyncio.TimeoutError:
+        # the signals could not be delivered; don't hang the caller forever
+        raise CommandTimeout(cmd, STOP_GRACE) from None
+
+
+async def _collect(lines: AsyncIterator[str], out: List[str]):
+    async for line in lines:
+        out.append(line)
+
+
+async def _arun_perf_local(
+    perf_args: List[str], cmd: str, sudo: bool, pin: Optional[Pin], timeout: Optional[float]
+) -> str:
+    argv = _perf_argv(perf_args, cmd, sudo)
+    logger.info("running cmd: %s", shlex.join(argv))
+    spawn_ns = time.monotonic_ns()
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        # own process group, so stopping reaches perf, the shell and the workload
+        start_new_session=True,
+        preexec_fn=None if pin is None else (lambda: apply_pin(pin)),
+    )
+    exec_ns = time.monotonic_ns()
+    assert proc.stderr is not None
+    output: List[str] = []
+
+    async def read() -> int:
+        assert proc.stderr is not None
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            output.append(line.decode().rstrip("\n"))
+        return await proc.wait()
+
+    try:
+        returncode = await asyncio.wait_for(read(), timeout)
+    except asyncio.TimeoutError:
+        await _stop(proc, sudo, cmd)
+        # keep what perf printed; group members we could not signal may still
+        # hold stderr open, so stop reading after STOP_GRACE
+        deadline = time.monotonic() + STOP_GRACE
+        try:
+            while True:
+                line = await asyncio.wait_for(proc.stderr.readline(), max(0.0, deadline - time.monotonic()))
+                if not line:
+                    break
+                output.append(line.decode().rstrip("\n"))
+        except asyncio.TimeoutError:
+            pass
+        raise CommandTimeout(cmd, timeout or 0.0, "\n".join(output))
+    except BaseException:
+        # cancelled (or failed) while running, leave nothing behind
+        if proc.returncode is None:
+            await asyncio.shield(_stop(proc, sudo, cmd))
+        raise
+    finally:
+        with context(events=perf_args.count("-e")):
+            _emit_process(shlex.join(argv), spawn_ns, exec_ns, sum(map(len, output)), proc.returncode, "async")
+    try:
+        _check_returncode(returncode)
+    except CommandFailed as e:
+        logger.error("command failed with exit code %d:\n%s", e.returncode, "\n".join(output))
+        e.output = "\n".join(output)
+        raise
+    return "\n".join(output)
+
+
+async def arun_perf_read_stderr(
+    perf_args: List[str],
+    cmd: str,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Async counterpart of run_perf_read_stderr, without a thread per call.
+
+    Cancelling the awaiting task stops perf and the workload (SIGINT to their
+    process group, SIGKILL after STOP_GRACE seconds) before the cancellation
+    propagates. With a perf daemon running, closing the connection has the
+    daemon do the same.
+
+    Args:
+        perf_args (List[str]): Arguments after the perf executable.
+        cmd (str): The command perf should run.
+        sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for the workload.
+        timeout (Optional[float]): Seconds after which the run is stopped.
+
+    Returns:
+        str: The stderr output of perf.
+
+    Raises:
+        CommandTimeout: If timeout elapsed; its output holds the partial counts.
+        CommandFailed: If perf exits with a code other than 0 or 124 (124
+                       still means a `timeout` inside cmd fired as intended).
+    """
+    cmd, pin = _perf_pin(pin, cmd)
+    if sudo:
+        spawn_ns = time.monotonic_ns()
+        lines = await astream_job(perf_args, cmd, pin=pin, timeout=timeout)
+        if lines is not None:
+            exec_ns = time.monotonic_ns()
+            rendered = perf_command(perf_args, cmd, sudo=False)
+            logger.info("running cmd via perf daemon: %s", rendered)
+            output: List[str] = []
+            returncode: Optional[int] = None
+            try:
+                # the daemon client enforces timeout, raising CommandTimeout
+                # with what perf printed while stopping
+                await _collect(lines, output)
+                returncode = 0
+            except ValueError:
+                logger.error("%s", "\n".join(output))
+                raise
+            finally:
+                # disconnecting is what tells the daemon to stop the job
+                await lines.aclose()  # type: ignore
+                with context(events=perf_args.count("-e")):
+                    _emit_process(rendered, spawn_ns, exec_ns, sum(map(len, output)), returncode, "daemon")
+            return "\n".join(output)
+    return await _arun_perf_local(perf_args, cmd, sudo, pin, timeout)
+
+
+async def gather_limited(
+    aws: List[Awaitable[Any]], limit: Optional[int] = None, return_exceptions: bool = False
+) -> List[Any]:
+    """
+    asyncio.gather for independent perf sessions, with at most limit in flight.
+
+    Args:
+        aws (List[Awaitable]): Coroutines such as aperf_sample_core_events(...).
+        limit (Optional[int]): Most sessions running at once, None for no limit.
+        return_exceptions (bool): Report failures (CommandFailed,
+                                  CommandTimeout, ...) in place of results.
+                                  Otherwise the first failure cancels the
+                                  other sessions and is raised.
+
+    Returns:
+        List[Any]: Results in the order of aws.
+    """
+    sem = asyncio.Semaphore(limit) if limit is not None else None
+
+    async def bounded(aw: Awaitable[Any]) -> Any:
+        if sem is None:
+            return await aw
+        async with sem:
+            return await aw
+
+    tasks = [asyncio.ensure_future(bounded(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    except BaseException:
+        # one session failed or we were cancelled: stop the rest, which kills their perf runs
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,291 @@
+import logging
+import math
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# phases emitted by rykit itself
+SPAWN = "spawn"  # creating the perf/shell process (fork, exec of sudo/sh)
+EXEC = "exec"  # process running until it exited and its output was drained
+EXIT = "exit"  # instant: the process was reaped, carries returncode
+PARSE = "parse"  # tokenizing perf output
+POSTPROCESS = "postprocess"  # turning tokens into results (dicts, matrices, metrics)
+
+logger = logging.getLogger(__name__)
+
+
+class Span(NamedTuple):
+    """
+    One timed phase of a measurement.
+
+    Attributes:
+        phase (str): SPAWN, EXEC, EXIT, PARSE, POSTPROCESS or a user phase.
+        start_ns (int): time.monotonic_ns() at the start.
+        end_ns (int): time.monotonic_ns() at the end (== start_ns for instants).
+        attrs (Dict[str,Any]): Details such as cmd, events, output_bytes,
+            returncode, via ("shell", "daemon", "async") and the attributes
+            of enclosing context() blocks.
+    """
+
+    phase: str
+    start_ns: int
+    end_ns: int
+    attrs: Dict[str, Any]
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+Sink = Callable[[Span], None]
+
+# registered sinks; instrumentation sites only check this list is non-empty
+_sinks: List[Sink] = []
+_context: ContextVar[Dict[str, Any]] = ContextVar("rykit_instrument_context", default={})
+
+
+def enabled() -> bool:
+    """Return whether any sink is registered."""
+    return bool(_sinks)
+
+
+def add_sink(sink: Sink):
+    """
+    Register a callable receiving every Span. Sinks run synchronously in the
+    measuring thread, so they should be cheap (aggregate, don't block).
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink: Sink):
+    """Unregister a sink added with add_sink."""
+    _sinks.remove(sink)
+
+
+def emit(phase: str, start_ns: int, end_ns: Optional[int] = None, **attrs):
+    """
+    Send a span to every sink. end_ns defaults to start_ns (an instant).
+    """
+    if not _sinks:
+        return
+    ctx = _context.get()
+    merged = dict(ctx, **attrs) if ctx else attrs
+    span = Span(phase, start_ns, start_ns if end_ns is None else end_ns, merged)
+    for sink in list(_sinks):
+        try:
+            sink(span)
+        except Exception:
+            logger.exception("instrumentation sink %r failed", sink)
+
+
+class _ActiveSpan:
+    __slots__ = ("phase", "attrs", "start_ns")
+
+    def __init__(self, phase: str, attrs: Dict[str, Any]):
+        self.phase = phase
+        self.attrs = attrs
+        self.start_ns = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "_ActiveSpan":
+        self.start_ns = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        emit(self.phase, self.start_ns, time.monotonic_ns(), **self.attrs)
+
+
+class _Context:
+    __slots__ = ("attrs", "token")
+
+    def __init__(self, attrs: Dict[str, Any]):
+        self.attrs = attrs
+        self.token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "_Context":
+        self.token = _context.set(dict(_context.get(), **self.attrs))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _context.reset(self.token)
+
+
+class _Null:
+    # returned when no sink is registered: entering, exiting and set() do nothing
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self) -> "_Null":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL = _Null()
+
+
+def span(phase: str, **attrs):
+    """
+    Time the enclosed block as a Span of phase.
+
+    Costs one list check when no sink is registered. The returned object's
+    set(**attrs) adds details discovered inside the block (output_bytes,
+    returncode).
+
+    Example:
+        with span("postprocess", events=len(events)) as s:
+            ...
+            s.set(cells=n)
+    """
+    if not _sinks:
+        return _NULL
+    return _ActiveSpan(phase, attrs)
+
+
+def context(**attrs):
+    """
+    Attach attrs to every span emitted inside the block (and tasks it
+    starts), e.g. the sweep configuration.
+    """
+    if not _sinks:
+        return _NULL
+    return _Context(attrs)
+
+
+class instrumented:
+    """
+    Register a sink for the duration of a with block.
+
+    Example:
+        hist = PhaseHistogram()
+        with instrumented(hist):
+            for threads in (1, 2, 4):
+                perf_sample_core_events(f"./bench {threads}", ["cycles"])
+        print(hist.format())
+    """
+
+    def __init__(self, sink: Sink):
+        self.sink = sink
+
+    def __enter__(self) -> Sink:
+        add_sink(self.sink)
+        return self.sink
+
+    def __exit__(self, exc_type, exc, tb):
+        remove_sink(self.sink)
+
+
+class PhaseSummary(NamedTuple):
+    """
+    Latency summary of one phase, in seconds. Quantiles are estimated from
+    power-of-two buckets (within a factor of sqrt(2)).
+    """
+
+    count: int
+    total: float
+    mean: float
+    min: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class PhaseHistogram:
+    """
+    Sink aggregating span durations into per-phase log2 histograms.
+
+    Memory is constant per phase however many spans are recorded, so it
+    can stay attached over whole sweeps. Thread safe.
+    """
+
+    _BUCKETS = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[int]] = {}
+        self._stats: Dict[str, List[int]] = {}  # count, total, min, max (ns)
+
+    def __call__(self, span: Span):
+        ns = max(0, span.end_ns - span.start_ns)
+        bucket = ns.bit_length()
+        with self._lock:
+            buckets = self._buckets.get(span.phase)
+            if buckets is None:
+                buckets = self._buckets[span.phase] = [0] * self._BUCKETS
+                self._stats[span.phase] = [0, 0, ns, ns]
+            buckets[min(bucket, self._BUCKETS - 1)] += 1
+            stats = self._stats[span.phase]
+            stats[0] += 1
+            stats[1] += ns
+            stats[2] = min(stats[2], ns)
+            stats[3] = max(stats[3], ns)
+
+    def phases(self) -> List[str]:
+        return list(self._buckets)
+
+    def quantile(self, phase: str, q: float) -> float:
+        """Estimate the q quantile (0..1) of a phase in seconds."""
+        with self._lock:
+            buckets = list(self._buckets[phase])
+            count, _, lo, hi = self._stats[phase]
+        target = q * count
+        seen = 0
+        for bucket, n in enumerate(buckets):
+            seen += n
+            if n and seen >= target:
+                if bucket == 0:
+                    return 0.0
+                # geometric middle of [2^(b-1), 2^b), clamped to what was observed
+                mid = math.sqrt(2.0 ** (bucket - 1) * 2.0**bucket)
+                return min(max(mid, lo), hi) / 1e9
+        return hi / 1e9
+
+    def summary(self) -> Dict[str, PhaseSummary]:
+        """Return phase -> latency summary."""
+        res: Dict[str, PhaseSummary] = {}
+        for phase in self.phases():
+            with self._lock:
+                count, total, lo, hi = self._stats[phase]
+            res[phase] = PhaseSummary(
+                count=count,
+                total=total / 1e9,
+                mean=total / count / 1e9,
+                min=lo / 1e9,
+                p50=self.quantile(phase, 0.5),
+                p90=self.quantile(phase, 0.9),
+                p99=self.quantile(phase, 0.99),
+                max=hi / 1e9,
+            )
+        return res
+
+    def format(self) -> str:
+        """Render summary() as a text table (milliseconds)."""
+        rows = [f"{'phase':<12} {'count':>7} {'total':>10} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+        for phase, s in self.summary().items():
+            rows.append(
+                f"{phase:<12} {s.count:>7} {s.total * 1e3:>10.1f} {s.mean * 1e3:>9.3f} {s.p50 * 1e3:>9.3f}"
+                f" {s.p90 * 1e3:>9.3f} {s.p99 * 1e3:>9.3f} {s.max * 1e3:>9.3f}"
+            )
+        return "\n".join(rows)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._stats.clear()
+
+
+def log_sink(span: Span):
+    """Sink writing each span to the rykit.instrument logger at DEBUG level."""
+    logger.debug("%s %.6fs %s", span.phase, span.seconds, span.attrs)
@@ -1,10 +1,14 @@
 import glob
-def get_cha_count() -> int:
+import os
+def get_cha_count(sysfs_root: str = "/sys") -> int:
     """
     Return the number of CHA devices under /sys/devices.
 
+    Args:
+        sysfs_root (str): Root of the sysfs tree, overridable for fixture trees.
+
     Returns:
         int: Count of directories matching 'uncore_cha_*'.
     """
-    cha_paths = glob.glob("/sys/devices/uncore_cha_*")
+    cha_paths = glob.glob(os.path.join(sysfs_root, "devices/uncore_cha_*"))
     return len(cha_paths)
@@ -1,6 +1,7 @@
 from typing import Dict,List,Optional
 from rykit.cmd import run_command_read_stdout
-import shutil
+from rykit.topology import get_topology, parse_range_list
+from rykit.affinity import Pin, numactl_installed
 def lscpu() -> Dict[str, str]:
     """
     Parse the output of `lscpu` into a dictionary.
@@ -8,8 +9,15 @@ def lscpu() -> Dict[str, str]:
     Returns:
         Dict[str, str]: Mapping of lscpu fields to their values.
     """
+    return parse_lscpu(run_command_read_stdout("lscpu"))
+
+
+def parse_lscpu(output: str) -> Dict[str, str]:
+    """
+    Parse `lscpu` output text, see lscpu.
+    """
     res = {}
-    for line in run_command_read_stdout("lscpu").split("\n"):
+    for line in output.split("\n"):
         if ":" not in line:
             continue
         segments = [x.strip() for x in line.split(":")]
@@ -57,7 +65,7 @@ def numactl_pin(node:int) -> str:
     Raises:
         RuntimeError: If numactl is not installed.
     """
-    if shutil.which('numactl') is None:
+    if not numactl_installed():
         raise RuntimeError("numactl should be installed")
     return f"numactl --cpunodebind={node} --membind={node} "
 def numactl_pin_mem(node:int) -> str:
@@ -74,7 +82,7 @@ def numactl_pin_mem(node:int) -> str:
     Raises:
         RuntimeError: If numactl is not installed.
     """
-    if shutil.which('numactl') is None:
+    if not numactl_installed():
         raise RuntimeError("numactl should be installed")
     return f"numactl --membind={node} "
 
@@ -97,7 +105,7 @@ def numactl_pin_cpu(cpus:List[int],mem_node:Optional[int]) -> str:
         AssertionError: If cpus is empty.
     """
     assert len(cpus) > 0
-    if shutil.which('numactl') is None:
+    if not numactl_installed():
         raise RuntimeError("numactl should be installed")
 
     if mem_node is None:
@@ -106,6 +114,52 @@ def numactl_pin_cpu(cpus:List[int],mem_node:Optional[int]) -> str:
     return f"numactl --membind={mem_node} --physcpubind={cpustr} " 
 
 
+def native_pin(node:int) -> Pin:
+    """
+    Pinning equivalent to numactl_pin, applied in-process instead of by numactl.
+
+    Pass the result as pin= to the perf_sample_* functions; it falls back to
+    a numactl prefix where sched_setaffinity/set_mempolicy are unavailable.
+
+    Args:
+        node (int): NUMA node to bind to
+
+    Returns:
+        Pin: binding of the node's CPUs and memory.
+    """
+    return Pin(cpus=get_topology().node_cpus(node), mem_nodes=[node])
+def native_pin_mem(node:int) -> Pin:
+    """
+    Pinning equivalent to numactl_pin_mem.
+
+    Args:
+        node (int): NUMA node for memory allocation
+
+    Returns:
+        Pin: memory-only binding.
+    """
+    return Pin(mem_nodes=[node])
+def native_pin_cpu(cpus:List[int],mem_node:Optional[int]) -> Pin:
+    """
+    Pinning equivalent to numactl_pin_cpu.
+
+    Args:
+        cpus (List[int]): CPU IDs the process is allowed to run on.
+        mem_node (Optional[int]): NUMA node for memory allocation. If None,
+                                  the NUMA node of cpus[0] is used.
+
+    Returns:
+        Pin: CPU and memory binding.
+
+    Raises:
+        AssertionError: If cpus is empty.
+    """
+    assert len(cpus) > 0
+    if mem_node is None:
+        mem_node = get_socket_for_cpu(cpus[0])
+    return Pin(cpus=list(cpus), mem_nodes=[mem_node])
+
+
 def lscpu_cache() -> Dict[str, Dict[str, str]]:
     """
     Parse `lscpu -C` output to get per-CPU cache and CPU info.
@@ -113,7 +167,14 @@ def lscpu_cache() -> Dict[str, Dict[str, str]]:
     Returns:
         Dict[str, Dict[str, str]]: Mapping from CPU ID to its properties.
     """
-    rows = run_command_read_stdout("lscpu -C").split("\n")
+    return parse_lscpu_cache(run_command_read_stdout("lscpu -C"))
+
+
+def parse_lscpu_cache(output: str) -> Dict[str, Dict[str, str]]:
+    """
+    Parse `lscpu -C` output text, see lscpu_cache.
+    """
+    rows = output.split("\n")
     col_names = rows[0].split()
     res = {}
     for row in rows[1:]:
@@ -126,28 +187,11 @@ def lscpu_cache() -> Dict[str, Dict[str, str]]:
     return res
 
 
-def parse_range_list(s: str) -> List[int]:
+def get_socket_ct() -> int:
     """
-    Convert a string representing ranges into a list of integers.
-
-    Args:
-        s (str): Range string, e.g., "0-3,5,7-8".
-
-    Returns:
-        List[int]: Expanded list of integers from the range string.
+    Return the number of NUMA nodes, from the cached sysfs topology.
     """
-    result = []
-    for part in s.split(","):
-        if "-" in part:
-            start, end = map(int, part.split("-"))
-            result.extend(range(start, end + 1))
-        else:
-            result.append(int(part))
-    return result
-
-def get_socket_ct():
-    info = lscpu()
-    return int(info["NUMA node(s)"])
+    return len(get_topology().nodes)
 
 def get_socket(skt: int) -> List[int]:
     """
@@ -164,12 +208,18 @@ def get_socket(skt: int) -> List[int]:
     """
     assert skt >= 0
     assert skt < get_socket_ct()
-    info = lscpu()
-    nodestr = info[f"NUMA node{skt} CPU(s)"]
-
-    return parse_range_list(nodestr)
-def get_socket_for_cpu(cpu:int):
-    for socket in range(get_socket_ct()):
-        if cpu in get_socket(socket):
-            return socket
-    raise ValueError(f"{cpu} not in any socket")
+    return list(get_topology().node_cpus(skt))
+def get_socket_for_cpu(cpu:int) -> int:
+    """
+    Get the NUMA socket a CPU belongs to.
+
+    Args:
+        cpu (int): CPU ID.
+
+    Returns:
+        int: NUMA socket index.
+
+    Raises:
+        ValueError: If the cpu is not in any socket.
+    """
+    return get_topology().node_of(cpu)
@@ -0,0 +1,190 @@
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+from rykit.cmd import run_perf_read_stderr, stream_perf_stderr
+from rykit.perf_catalog import validate_events
+from rykit.perf_interval import IntervalRecord, interpret_interval_line
+from rykit.perf_sample import interpret_core_events
+from rykit.perf_schedule import (
+    EventMeta,
+    ScheduledResult,
+    interpret_csv_events,
+    plan_passes,
+    pmu_of,
+)
+
+
+class AttachTarget(NamedTuple):
+    """
+    What perf counts when it does not launch a command.
+
+    perf only opens counters on the target (no ptrace, no signals), so
+    attaching and detaching never pauses or otherwise disturbs it.
+
+    Attributes:
+        pids (Optional[List[int]]): Processes to count, with all their threads (-p).
+        tids (Optional[List[int]]): Individual threads to count (-t).
+        cgroup (Optional[str]): cgroup (path below the cgroup mount, e.g.
+                                "system.slice/nginx.service") to count, on all CPUs (-G).
+        system_wide (bool): Count everything on all CPUs (-a), required
+                            for uncore events.
+        cpus (Optional[List[int]]): Restrict system-wide/cgroup counting to these CPUs (-C).
+    """
+
+    pids: Optional[List[int]] = None
+    tids: Optional[List[int]] = None
+    cgroup: Optional[str] = None
+    system_wide: bool = False
+    cpus: Optional[List[int]] = None
+
+
+def _check_target(target: AttachTarget, events: List[str]):
+    kinds = [target.pids is not None, target.tids is not None, target.cgroup is not None, target.system_wide]
+    if sum(kinds) != 1:
+        raise ValueError(f"exactly one of pids, tids, cgroup or system_wide must be set (passed {target})")
+    for pid in (target.pids or []) + (target.tids or []):
+        if not os.path.exists(f"/proc/{pid}"):
+            raise ValueError(f"no process or thread with id {pid}")
+    if not target.system_wide:
+        uncore = [e for e in events if pmu_of(e) not in ("cpu", "software")]
+        if uncore:
+            raise ValueError(f"uncore events {uncore} count the whole socket, attach system_wide instead")
+
+
+def build_perf_attach_args(
+    events: List[str],
+    target: AttachTarget,
+    duration: Optional[float] = None,
+    interval_ms: Optional[int] = None,
+) -> List[str]:
+    """
+    Build `perf stat -x ;` arguments counting events on target without a workload.
+
+    Args:
+        events (List[str]): Perf event strings.
+        target (AttachTarget): What to count.
+        duration (Optional[float]): Seconds to count for, None to count
+                                    until perf is stopped.
+        interval_ms (Optional[int]): Print deltas every interval_ms (-I).
+    """
+    args = ["stat", "-x", ";"]
+    if interval_ms is not None:
+        assert interval_ms >= 10, "perf stat does not support intervals below 10ms"
+        args += ["-I", str(interval_ms)]
+        if duration is not None:
+            # --timeout is rejected together with -I
+            args += ["--interval-count", str(max(1, round(duration * 1000 / interval_ms)))]
+    elif duration is not None:
+        args += ["--timeout", str(max(1, round(duration * 1000)))]
+    if target.pids is not None:
+        args += ["-p", ",".join(str(p) for p in target.pids)]
+    if target.tids is not None:
+        args += ["-t", ",".join(str(t) for t in target.tids)]
+    if target.system_wide or target.cgroup is not None:
+        args.append("-a")
+    if target.cpus is not None:
+        args += ["-C", ",".join(str(c) for c in target.cpus)]
+    for e in events:
+        args += ["-e", e]
+        if target.cgroup is not None:
+            # -G applies to the event before it
+            args += ["-G", target.cgroup]
+    return args
+
+
+def perf_attach_scheduled(
+    target: AttachTarget,
+    events: List[str],
+    duration: float,
+    mode: str = "sequential",
+    sudo: bool = True,
+    limits: Optional[Dict[str, int]] = None,
+    validate: bool = True,
+) -> ScheduledResult:
+    """
+    Count any number of events on a running target for a fixed window.
+
+    Like perf_sample_scheduled, except that in "sequential" mode each pass
+    is its own window of duration seconds, so passes see different (but,
+    for a steady service, comparable) stretches of execution.
+
+    Args:
+        target (AttachTarget): What to count.
+        events (List[str]): Perf event strings.
+        duration (float): Seconds per window.
+        mode (str): "sequential" or "multiplex".
+        sudo (bool): Whether to run perf as sudo.
+        limits (Optional[Dict[str,int]]): Counters per PMU family.
+        validate (bool): Check the events against the PMU catalog first.
+
+    Returns:
+        ScheduledResult: Merged counts and per-event run/enabled metadata.
+    """
+    _check_target(target, events)
+    passes = plan_passes(events, mode, limits, validate)
+    counts: Dict[str, Union[int, float]] = {}
+    meta: Dict[str, EventMeta] = {}
+    for pass_index, group in enumerate(passes):
+        output = run_perf_read_stderr(build_perf_attach_args(group, target, duration), "", sudo=sudo)
+        res = interpret_csv_events(output, pass_index)
+        counts.update(res.counts)
+        meta.update(res.meta)
+    return ScheduledResult(counts=counts, meta=meta, passes=passes)
+
+
+def perf_attach_core_events(
+    target: AttachTarget,
+    core_events: List[str],
+    duration: float,
+    sudo: bool = True,
+    validate: bool = True,
+) -> Dict[str, int]:
+    """
+    Count core events on a running target for duration seconds.
+
+    The attach counterpart of perf_sample_core_events (same parsing).
+
+    Returns:
+        Dict[str,int]: Mapping of event name -> event counter value.
+    """
+    if validate:
+        validate_events(core_events)
+    _check_target(target, core_events)
+    output = run_perf_read_stderr(build_perf_attach_args(core_events, target, duration), "", sudo=sudo)
+    return interpret_core_events(output, core_events)
+
+
+def perf_attach_stream(
+    target: AttachTarget,
+    events: List[str],
+    interval_ms: int = 1000,
+    duration: Optional[float] = None,
+    sudo: bool = True,
+    validate: bool = True,
+) -> Iterator[IntervalRecord]:
+    """
+    Yield periodic snapshots of counters on a running target.
+
+    perf reads the counters once per interval and nothing else runs in
+    between, so the overhead is that of plain counting. Closing the
+    generator early stops perf; the target keeps running untouched.
+
+    Args:
+        target (AttachTarget): What to count.
+        events (List[str]): Perf event strings, e.g. from create_unc_cha_events
+                            or create_amd_df_event for system-wide targets.
+        interval_ms (int): Snapshot interval in milliseconds (>= 10).
+        duration (Optional[float]): Seconds to stream for, None for until closed.
+        sudo (bool): Whether to run perf as sudo.
+        validate (bool): Check the events against the PMU catalog first.
+
+    Yields:
+        IntervalRecord: One record per event (per CHA) per interval.
+    """
+    if validate:
+        validate_events(events)
+    _check_target(target, events)
+    perf_args = build_perf_attach_args(events, target, duration, interval_ms)
+    for line in stream_perf_stderr(perf_args, "", sudo):
+        record = interpret_interval_line(line)
+        if record is not None:
+            yield record
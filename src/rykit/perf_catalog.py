@@ -0,0 +1,460 @@
+import difflib
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from rykit.cmd import run_command_read_stdout
+
+# perf's built-in names, always valid without a PMU prefix
+GENERIC_EVENTS = {
+    "cycles", "cpu-cycles", "instructions", "cache-references", "cache-misses",
+    "branches", "branch-instructions", "branch-misses", "bus-cycles",
+    "stalled-cycles-frontend", "idle-cycles-frontend", "stalled-cycles-backend",
+    "idle-cycles-backend", "ref-cycles",
+    "task-clock", "cpu-clock", "page-faults", "faults", "minor-faults",
+    "major-faults", "context-switches", "cs", "cpu-migrations", "migrations",
+    "alignment-faults", "emulation-faults", "dummy", "bpf-output", "duration_time",
+    "L1-dcache-loads", "L1-dcache-load-misses", "L1-dcache-stores",
+    "L1-icache-loads", "L1-icache-load-misses", "LLC-loads", "LLC-load-misses",
+    "LLC-stores", "LLC-store-misses", "dTLB-loads", "dTLB-load-misses",
+    "iTLB-loads", "iTLB-load-misses", "branch-loads", "branch-load-misses",
+}
+
+# terms perf accepts inside pmu/.../ that are not format fields
+_PERF_TERMS = {
+    "name", "period", "freq", "config", "config1", "config2", "config3",
+    "call-graph", "stack-size", "inherit", "no-inherit", "max-stack", "nr",
+    "percore", "aux-output", "metric-id", "time", "overwrite", "no-overwrite",
+    "driver-config", "branch_type", "aux-sample-size",
+}
+
+# perf's generated cache event grammar: <cache>-<op>[-<result>], matched
+# case-insensitively (L1-dcache-prefetches, LLC-load-misses, dTLB-stores, ...)
+_CACHE_EVENT = re.compile(
+    r"^(l1-dcache|l1-d|l1d|l1-data|l1-icache|l1-i|l1i|l1-instruction|llc|l2|dtlb|d-tlb|data-tlb"
+    r"|itlb|i-tlb|instruction-tlb|branch|branches|bpu|btb|bpc|node)"
+    r"-(loads?|reads?|stores?|writes?|prefetch(?:es)?|speculative-reads?|speculative-loads?)"
+    r"(?:-(refs|references?|ops|access(?:es)?|misses|miss))?$",
+    re.IGNORECASE,
+)
+# raw hardware event codes (r01c2, r1a8:u)
+_RAW_EVENT = re.compile(r"^r[0-9a-fA-F]+$")
+# modifiers perf accepts after a ':' (cycles:u, cycles:ppp, instructions:uk)
+_MODIFIERS = re.compile(r"^[ukhIGHpPSDWebR]+$")
+
+CATALOG_VERSION = 1
+
+logger = logging.getLogger(__name__)
+# unknown symbolic names already warned about
+_warned: Set[str] = set()
+
+
+class FieldRange(NamedTuple):
+    """Bits [lo, hi] of config word `config` holding part of a format field."""
+
+    config: str
+    lo: int
+    hi: int
+
+
+def parse_format(spec: str) -> List[FieldRange]:
+    """
+    Parse a sysfs PMU format spec such as "config:0-7,32-35" or "config1:3".
+
+    Returns:
+        List[FieldRange]: The bit ranges, least significant part first.
+    """
+    config, bits = spec.strip().split(":")
+    ranges: List[FieldRange] = []
+    for part in bits.split(","):
+        if "-" in part:
+            lo, hi = map(int, part.split("-"))
+        else:
+            lo = hi = int(part)
+        ranges.append(FieldRange(config, lo, hi))
+    return ranges
+
+
+def field_width(ranges: List[FieldRange]) -> int:
+    """Total number of bits of a format field."""
+    return sum(r.hi - r.lo + 1 for r in ranges)
+
+
+def _parse_terms(body: str) -> List[Tuple[str, Optional[str]]]:
+    terms: List[Tuple[str, Optional[str]]] = []
+    for term in body.split(","):
+        term = term.strip()
+        if term == "":
+            continue
+        if "=" in term:
+            k, v = term.split("=", 1)
+            terms.append((k.strip(), v.strip()))
+        else:
+            terms.append((term, None))
+    return terms
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_model(procfs_root: str = "/proc") -> str:
+    """Return a string identifying the CPU model (vendor, family, model, name)."""
+    info = _read(os.path.join(procfs_root, "cpuinfo")) or ""
+    keep = ("vendor_id", "cpu family", "model", "model name", "CPU implementer", "CPU part")
+    fields: Dict[str, str] = {}
+    for line in info.split("\n"):
+        if line.strip() == "":
+            # first processor block is enough
+            if fields:
+                break
+            continue
+        k, _, v = line.partition(":")
+        if k.strip() in keep:
+            fields[k.strip()] = v.strip()
+    return ";".join(f"{k}={fields[k]}" for k in keep if k in fields)
+
+
+class PerfCatalog:
+    """
+    Index of the PMUs, their format fields and their named events.
+
+    Built from /sys/bus/event_source/devices/*/{type,format,events} and,
+    when available, `perf list --json`; see load_catalog() for the on-disk
+    cache that makes later lookups subprocess free.
+
+    Attributes:
+        pmus (Dict[str,int]): PMU name -> perf_event_attr type.
+        formats (Dict[str,Dict[str,List[FieldRange]]]): PMU -> field -> bit ranges.
+        aliases (Dict[str,Dict[str,str]]): PMU -> sysfs event name -> terms.
+        named (Dict[str,str]): Symbolic event name (from perf list) -> perf
+                               event string, or the name itself if perf gave
+                               no encoding.
+    """
+
+    def __init__(
+        self,
+        pmus: Dict[str, int],
+        formats: Dict[str, Dict[str, List[FieldRange]]],
+        aliases: Dict[str, Dict[str, str]],
+        named: Dict[str, str],
+    ):
+        self.pmus = pmus
+        self.formats = formats
+        self.aliases = aliases
+        self.named = named
+        self._known = {n.lower() for n in list(GENERIC_EVENTS) + list(named)}
+        self._known.update(a.lower() for pmu_aliases in aliases.values() for a in pmu_aliases)
+
+    @classmethod
+    def from_sysfs(cls, sysfs_root: str = "/sys", perf_list: bool = True) -> "PerfCatalog":
+        """
+        Build a catalog by scanning sysfs (and running `perf list --json`).
+        """
+        pmus: Dict[str, int] = {}
+        formats: Dict[str, Dict[str, List[FieldRange]]] = {}
+        aliases: Dict[str, Dict[str, str]] = {}
+        for dev in glob.glob(os.path.join(sysfs_root, "bus/event_source/devices/*")):
+            name = os.path.basename(dev)
+            pmu_type = _read(os.path.join(dev, "type"))
+            if pmu_type is None:
+                continue
+            pmus[name] = int(pmu_type)
+            formats[name] = {}
+            for fmt in glob.glob(os.path.join(dev, "format/*")):
+                spec = _read(fmt)
+                if spec:
+                    formats[name][os.path.basename(fmt)] = parse_format(spec)
+            aliases[name] = {}
+            for ev in glob.glob(os.path.join(dev, "events/*")):
+                ev_name = os.path.basename(ev)
+                if "." in ev_name and ev_name.rsplit(".", 1)[1] in ("scale", "unit", "per-pkg", "snapshot"):
+                    continue
+                terms = _read(ev)
+                if terms is not None:
+                    aliases[name][ev_name] = terms
+        named: Dict[str, str] = {}
+        if perf_list:
+            named = _perf_list_json()
+        return cls(pmus, formats, aliases, named)
+
+    def to_json(self) -> dict:
+        return {
+            "version": CATALOG_VERSION,
+            "pmus": self.pmus,
+            "formats": {
+                pmu: {f: [list(r) for r in ranges] for f, ranges in fields.items()}
+                for pmu, fields in self.formats.items()
+            },
+            "aliases": self.aliases,
+            "named": self.named,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "PerfCatalog":
+        formats = {
+            pmu: {f: [FieldRange(*r) for r in ranges] for f, ranges in fields.items()}
+            for pmu, fields in data["formats"].items()
+        }
+        return cls(data["pmus"], formats, data["aliases"], data["named"])
+
+    def check(self, event: str) -> List[str]:
+        """
+        Return the problems with an event string (empty if it is valid).
+
+        Checks that the PMU exists, every term is a known format field or
+        event alias of it, and that every value fits its field width.
+        Symbolic names (compared case-insensitively with perf's generic and
+        cache event names, sysfs aliases and perf list), raw r<hex> codes and
+        tracepoints are never rejected; unknown names are logged as warnings.
+        """
+        event = event.strip()
+        if event.startswith("{"):
+            # group syntax, check members
+            problems: List[str] = []
+            for member in _split_group(event.strip("{}").split("}")[0]):
+                problems += self.check(member)
+            return problems
+        if "/" not in event:
+            name, _, modifiers = event.partition(":")
+            if modifiers and not _MODIFIERS.match(modifiers):
+                # subsys:tracepoint
+                return []
+            if name.lower() in self._known or _RAW_EVENT.match(name) or _CACHE_EVENT.match(name):
+                return []
+            if self.named and name not in _warned:
+                # perf list does not cover every name perf accepts, so only warn
+                _warned.add(name)
+                logger.warning(
+                    "unknown event %s%s", name, _suggest(name, list(self.named) + list(GENERIC_EVENTS))
+                )
+            return []
+
+        pmu, _, rest = event.partition("/")
+        body = rest.rsplit("/", 1)[0] if "/" in rest else rest
+        instance = self._instance(pmu)
+        if instance is None:
+            return [f"unknown PMU {pmu}{_suggest(pmu, list(self.pmus))}"]
+        fields = self.formats.get(instance, {})
+        pmu_aliases = self.aliases.get(instance, {})
+        problems = []
+        for key, val in _parse_terms(body):
+            if key in pmu_aliases and val is None:
+                continue
+            if key in _PERF_TERMS:
+                continue
+            if key not in fields:
+                choices = list(fields) + list(pmu_aliases)
+                problems.append(f"{pmu} has no field or event {key}{_suggest(key, choices)}")
+                continue
+            try:
+                value = 1 if val is None else int(val, 0)
+            except ValueError:
+                problems.append(f"{pmu}/{key}={val}: not an integer")
+                continue
+            width = field_width(fields[key])
+            if value < 0 or value >= (1 << width):
+                problems.append(f"{pmu}/{key}={val} does not fit in {width} bits")
+        return problems
+
+    def _instance(self, pmu: str) -> Optional[str]:
+        # perf expands a PMU name without its instance number (uncore_imc,
+        # uncore_cha) to every uncore_imc_<n>; they share one format
+        if pmu in self.pmus:
+            return pmu
+        instances = [p for p in self.pmus if re.fullmatch(re.escape(pmu) + r"_\d+", p)]
+        if not instances:
+            return None
+        return min(instances, key=lambda p: int(p.rsplit("_", 1)[1]))
+
+    def validate(self, events: List[str]):
+        """
+        Raise if any event is invalid, before a workload is launched.
+
+        Raises:
+            ValueError: Listing every problem found.
+        """
+        problems = [p for e in events for p in self.check(e)]
+        if problems:
+            raise ValueError("invalid perf events:\n\t" + "\n\t".join(problems))
+
+    def resolve(self, name: str) -> str:
+        """
+        Resolve a symbolic event name to a perf event string.
+
+        "pmu/alias/" and perf list names are expanded to their "pmu/terms/"
+        encoding; anything else is validated and returned unchanged.
+
+        Raises:
+            ValueError: If the event is invalid.
+        """
+        if name in self.named:
+            return self.named[name]
+        for known, encoding in self.named.items():
+            if known.lower() == name.lower():
+                return encoding
+        if "/" in name:
+            pmu, _, rest = name.partition("/")
+            alias = rest.rstrip("/")
+            if alias in self.aliases.get(pmu, {}):
+                return f"{pmu}/{self.aliases[pmu][alias]}/"
+        self.validate([name])
+        return name
+
+    def encode(self, event: str) -> Dict[str, int]:
+        """
+        Compute the perf_event_attr config words of a "pmu/field=value,.../" event.
+
+        Returns:
+            Dict[str,int]: Config word name ("config", "config1", ...) -> value.
+
+        Raises:
+            ValueError: If the event is invalid or has no PMU prefix.
+        """
+        self.validate([event])
+        if "/" not in event:
+            raise ValueError(f"{event} has no PMU prefix, resolve() it first")
+        pmu, _, rest = event.partition("/")
+        pmu = self._instance(pmu) or pmu
+        body = rest.rsplit("/", 1)[0]
+        terms = _parse_terms(body)
+        expanded: List[Tuple[str, Optional[str]]] = []
+        for key, val in terms:
+            if val is None and key in self.aliases.get(pmu, {}):
+                expanded += _parse_terms(self.aliases[pmu][key])
+            else:
+                expanded.append((key, val))
+        words: Dict[str, int] = {}
+        for key, val in expanded:
+            if key in ("config", "config1", "config2", "config3") and val is not None:
+                words[key] = words.get(key, 0) | int(val, 0)
+                continue
+            if key not in self.formats.get(pmu, {}):
+                continue
+            value = 1 if val is None else int(val, 0)
+            for r in self.formats[pmu][key]:
+                width = r.hi - r.lo + 1
+                words[r.config] = words.get(r.config, 0) | ((value & ((1 << width) - 1)) << r.lo)
+                value >>= width
+        return words
+
+
+def _split_group(s: str) -> List[str]:
+    # split on commas that are not inside pmu/.../ terms
+    members: List[str] = []
+    depth = 0
+    cur = ""
+    for ch in s:
+        if ch == "/":
+            depth ^= 1
+        if ch == "," and depth == 0:
+            members.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    if cur:
+        members.append(cur)
+    return members
+
+
+def _suggest(name: str, choices: List[str]) -> str:
+    close = difflib.get_close_matches(name, choices, n=3)
+    return f" (did you mean {', '.join(close)}?)" if close else ""
+
+
+def _perf_list_json() -> Dict[str, str]:
+    try:
+        out = run_command_read_stdout("perf list --json 2>/dev/null")
+        entries = json.loads(out)
+    except (ValueError, OSError):
+        return {}
+    named: Dict[str, str] = {}
+    for entry in entries if isinstance(entries, list) else []:
+        name = entry.get("EventName")
+        if not name:
+            continue
+        named[name] = entry.get("Encoding") or name
+    return named
+
+
+def catalog_path(cache_dir: Optional[str] = None, procfs_root: str = "/proc") -> str:
+    """
+    Return the on-disk catalog location, keyed by kernel version and CPU model.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "rykit", "catalog"
+        )
+    model = hashlib.sha1(cpu_model(procfs_root).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.uname().release}-{model}.json")
+
+
+def load_catalog(
+    refresh: bool = False,
+    cache_dir: Optional[str] = None,
+    sysfs_root: str = "/sys",
+    perf_list: bool = True,
+) -> PerfCatalog:
+    """
+    Load the persisted catalog for this kernel and CPU, building it if needed.
+
+    Args:
+        refresh (bool): Rebuild from sysfs/perf even if a cached copy exists.
+        cache_dir (Optional[str]): Where catalogs are stored, defaults to
+                                   $XDG_CACHE_HOME/rykit/catalog.
+        sysfs_root (str): Root of the sysfs tree, overridable for fixtures.
+        perf_list (bool): Also ingest `perf list --json` when building.
+
+    Returns:
+        PerfCatalog: The catalog.
+    """
+    path = catalog_path(cache_dir)
+    if not refresh and sysfs_root == "/sys":
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == CATALOG_VERSION:
+                return PerfCatalog.from_json(data)
+        except (OSError, ValueError, KeyError):
+            pass
+    catalog = PerfCatalog.from_sysfs(sysfs_root, perf_list=perf_list)
+    # a catalog built without perf list data (perf missing or failing) is
+    # not persisted, so installing perf later is picked up
+    if sysfs_root == "/sys" and (catalog.named or not perf_list):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + f".{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(catalog.to_json(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return catalog
+
+
+_catalog: Optional[PerfCatalog] = None
+
+
+def get_catalog() -> PerfCatalog:
+    """Return the process-wide catalog, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        _catalog = load_catalog()
+    return _catalog
+
+
+def validate_events(events: List[str]):
+    """
+    Validate perf event strings against the process-wide catalog.
+
+    Raises:
+        ValueError: Listing every invalid event.
+    """
+    get_catalog().validate(events)
@@ -0,0 +1,439 @@
+"""
+Long-lived privileged helper that runs perf jobs sent over a Unix socket.
+
+Start it once per session instead of paying a shell fork and sudo check
+per sample:
+
+    sudo python -m rykit.perf_daemon &
+
+While it is running, rykit's perf_sample_* functions (sudo=True) send their
+jobs to it transparently. perf is launched from an argv list, without a
+shell, and the workload string runs under `sh -c` exactly as on the
+local path (see workload_argv), so pipes, && and redirections behave the
+same whether or not a daemon is running.
+
+The socket is created mode 0600 and owned by the user who invoked sudo,
+so only that user (and root) may submit jobs. Note that jobs run as root,
+exactly as `sudo perf stat ... cmd` would. Clients only use a socket
+owned by themselves or root, not writable by group or others, and served
+by a root (or their own) process; anything else, e.g. a socket another
+user created first at the predictable path, is ignored and perf runs
+locally.
+
+Protocol: the client sends one JSON line {"op": "run", "perf_args": [...],
+"cmd": "...", "cwd": "..."}; the daemon answers with {"stderr": "<line>"}
+lines as perf writes them (or {"stdout": "<line>"} for jobs sent with
+"output": "stdout", such as perf script), then {"returncode": <int>}. Closing the
+connection before that stops the job: perf and the workload get SIGINT
+(so perf still prints its counts) and SIGKILL if they linger.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Optional
+from rykit.affinity import Pin, apply_pin
+
+ENV_SOCKET = "RYKIT_PERF_DAEMON"
+
+logger = logging.getLogger(__name__)
+
+# seconds a stopped job gets to exit before SIGKILL
+STOP_GRACE = 2.0
+
+
+def default_socket_path(uid: Optional[int] = None) -> str:
+    """
+    Return the socket path used by the client and daemon.
+
+    RYKIT_PERF_DAEMON overrides it; otherwise it is per user under the temp
+    directory. When run under sudo the daemon uses the invoking user's uid.
+    """
+    if ENV_SOCKET in os.environ:
+        return os.environ[ENV_SOCKET]
+    if uid is None:
+        uid = int(os.environ.get("SUDO_UID", os.getuid()))
+    return os.path.join(tempfile.gettempdir(), f"rykit-perf-{uid}.sock")
+
+
+def workload_argv(perf: str, perf_args: List[str], cmd: str) -> List[str]:
+    """
+    Return the argv running perf over cmd, shared by the daemon and the
+    local path of rykit.cmd so both run the workload identically.
+
+    The workload goes through sh -c so cmd keeps its shell syntax without
+    putting perf's own arguments through a shell; an empty cmd (attach or
+    system-wide sessions) runs perf alone.
+    """
+    if cmd.strip() == "":
+        args = list(perf_args[:-1]) if perf_args[-1:] == ["--"] else list(perf_args)
+        return [perf] + args
+    sep = [] if perf_args[-1:] == ["--"] else ["--"]
+    return [perf] + list(perf_args) + sep + ["sh", "-c", cmd]
+
+
+def _job_preexec(job: dict) -> Optional[Callable[[], None]]:
+    if job.get("cpus") is None and job.get("mem_nodes") is None:
+        return None
+    pin = Pin(cpus=job.get("cpus"), mem_nodes=job.get("mem_nodes"))
+    return lambda: apply_pin(pin)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    server: "PerfDaemon"
+
+    def _send(self, msg: dict):
+        self.wfile.write((json.dumps(msg) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+        except ValueError:
+            self._send({"error": "malformed job"})
+            return
+        op = job.get("op", "run")
+        if op == "ping":
+            self._send({"pong": os.getpid()})
+        elif op == "shutdown":
+            self._send({"returncode": 0})
+            # shutdown() waits for serve_forever to return, so it can't run on a handler thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif op == "run":
+            self._run(job)
+        else:
+            self._send({"error": f"unknown op {op}"})
+
+    def _run(self, job: dict):
+        argv = workload_argv(self.server.perf, list(job["perf_args"]), job.get("cmd", ""))
+        key = "stdout" if job.get("output") == "stdout" else "stderr"
+        proc = subprocess.Popen(
+            argv,
+            cwd=job.get("cwd") or None,
+            preexec_fn=_job_preexec(job),
+            stdout=subprocess.PIPE if key == "stdout" else subprocess.DEVNULL,
+            stderr=subprocess.PIPE if key == "stderr" else subprocess.DEVNULL,
+            text=True,
+            errors="replace",
+            bufsize=1,
+            # own process group, so a stop reaches the workload as well as perf
+            start_new_session=True,
+        )
+        stream = proc.stdout if key == "stdout" else proc.stderr
+        assert stream is not None
+        # the client sends nothing after the job, so EOF means it went away
+        # (perf stat is silent until the end, so a failed send is not enough)
+        threading.Thread(target=self._watch_client, args=(proc,), daemon=True).start()
+        try:
+            for outline in stream:
+                self._send({key: outline.rstrip("\n")})
+            self._send({"returncode": proc.wait()})
+        except (BrokenPipeError, ConnectionResetError):
+            # client went away, don't leave perf and the workload behind
+            _stop_group(proc)
+        finally:
+            if proc.poll() is None:
+                proc.wait()
+            stream.close()
+
+    def _watch_client(self, proc: subprocess.Popen):
+        try:
+            self.connection.recv(1)
+        except OSError:
+            pass
+        if proc.poll() is None:
+            _stop_group(proc)
+
+
+def _stop_group(proc: subprocess.Popen):
+    # SIGINT lets perf print its counts, SIGKILL then reaps whatever is left
+    for sig in (signal.SIGINT, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + STOP_GRACE
+        while proc.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+class PerfDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server running perf jobs, one thread per connection.
+
+    Attributes:
+        perf (str): perf executable used for every job (fixed at startup so
+                    clients cannot choose what runs privileged).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, perf: str = "perf", owner_uid: Optional[int] = None):
+        self.perf = perf
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _JobHandler)
+        finally:
+            os.umask(old_umask)
+        if owner_uid is not None and os.getuid() == 0:
+            os.chown(socket_path, owner_uid, -1)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)  # type: ignore
+        except OSError:
+            pass
+
+
+def serve(socket_path: Optional[str] = None, perf: str = "perf"):
+    """
+    Run the daemon in the foreground until a shutdown job arrives.
+
+    Args:
+        socket_path (Optional[str]): Where to listen, defaults to default_socket_path().
+        perf (str): perf executable to launch for each job.
+    """
+    socket_path = default_socket_path() if socket_path is None else socket_path
+    owner = os.environ.get("SUDO_UID")
+    with PerfDaemon(socket_path, perf, int(owner) if owner is not None else None) as server:
+        server.serve_forever()
+
+
+def _trusted_path(socket_path: str) -> bool:
+    # lstat: the path itself must be the socket, not a link to one
+    try:
+        st = os.lstat(socket_path)
+    except OSError:
+        return False
+    uid = os.getuid()
+    owners = {uid, 0}
+    if uid == 0 and "SUDO_UID" in os.environ:
+        owners.add(int(os.environ["SUDO_UID"]))
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid not in owners or st.st_mode & 0o022:
+        logger.warning("ignoring perf daemon socket %s: not a private socket of this user or root", socket_path)
+        return False
+    return True
+
+
+def _trusted_peer(sock: socket.socket) -> bool:
+    # the server's credentials as of connect(); root, or ourselves (no more
+    # privileged than running perf directly)
+    peercred = getattr(socket, "SO_PEERCRED", None)
+    if peercred is None:
+        return False
+    try:
+        _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, peercred, struct.calcsize("3i")))
+    except OSError:
+        return False
+    if uid not in (0, os.getuid()):
+        logger.warning("ignoring perf daemon served by uid %d", uid)
+        return False
+    return True
+
+
+def _connect(socket_path: Optional[str] = None) -> Optional[socket.socket]:
+    socket_path = default_socket_path() if socket_path is None else socket_path
+    if not os.path.exists(socket_path) or not _trusted_path(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    if not _trusted_peer(sock):
+        sock.close()
+        return None
+    return sock
+
+
+def daemon_running(socket_path: Optional[str] = None) -> bool:
+    """Return whether a perf daemon answers on socket_path."""
+    sock = _connect(socket_path)
+    if sock is None:
+        return False
+    with sock, sock.makefile("rwb") as f:
+        f.write(b'{"op": "ping"}\n')
+        f.flush()
+        return b"pong" in f.readline()
+
+
+def stop_daemon(socket_path: Optional[str] = None):
+    """Ask a running perf daemon to exit."""
+    sock = _connect(socket_path)
+    if sock is None:
+        return
+    with sock, sock.makefile("rwb") as f:
+        f.write(b'{"op": "shutdown"}\n')
+        f.flush()
+        f.readline()
+
+
+def _job(perf_args: List[str], cmd: str, pin: Optional[Pin], output: str = "stderr") -> dict:
+    job = {"op": "run", "perf_args": perf_args, "cmd": cmd, "cwd": os.getcwd(), "output": output}
+    if pin is not None:
+        job["cpus"] = pin.cpus
+        job["mem_nodes"] = pin.mem_nodes
+    return job
+
+
+def stream_job(
+    perf_args: List[str],
+    cmd: str,
+    socket_path: Optional[str] = None,
+    pin: Optional[Pin] = None,
+    output: str = "stderr",
+) -> Optional[Iterator[str]]:
+    """
+    Submit a perf job to the daemon and stream its stderr (or stdout).
+
+    Args:
+        perf_args (List[str]): Arguments after the perf executable, e.g.
+                               ["stat", "-x", ";", "-e", "cycles", "--"].
+        cmd (str): Workload command line, run with sh -c by the daemon.
+        socket_path (Optional[str]): Daemon socket, defaults to default_socket_path().
+        pin (Optional[Pin]): CPU/memory binding the daemon applies to perf
+                             (and so the workload) before exec.
+        output (str): "stderr", or "stdout" for perf commands that report
+                      there (perf script); the other stream is discarded.
+
+    Returns:
+        Optional[Iterator[str]]: None if no (trusted) daemon is running,
+            otherwise a generator of output lines. The generator raises
+            rykit.cmd.CommandFailed if the job exits with a code other than
+            0 or 124, like run_command_read_stderr.
+    """
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+    assert output in ("stderr", "stdout"), f"output must be stderr or stdout (passed {output})"
+    return _stream(sock, _job(perf_args, cmd, pin, output))
+
+
+def _stream(sock: socket.socket, job: dict) -> Iterator[str]:
+    from rykit.cmd import CommandFailed
+
+    output: List[str] = []
+    with sock, sock.makefile("rwb") as f:
+        f.write((json.dumps(job) + "\n").encode())
+        f.flush()
+        for line in f:
+            msg = json.loads(line)
+            if "stderr" in msg:
+                output.append(msg["stderr"])
+                yield msg["stderr"]
+            elif "stdout" in msg:
+                # not kept for CommandFailed, perf script output can be huge
+                yield msg["stdout"]
+            elif "returncode" in msg:
+                returncode = msg["returncode"]
+                if returncode not in (0, 124):
+                    raise CommandFailed(returncode, "\n".join(output))
+                return
+            else:
+                raise RuntimeError(f"perf daemon error: {msg.get('error')}")
+    raise RuntimeError("perf daemon closed the connection before the job finished")
+
+
+async def astream_job(
+    perf_args: List[str],
+    cmd: str,
+    socket_path: Optional[str] = None,
+    pin: Optional[Pin] = None,
+    timeout: Optional[float] = None,
+) -> Optional[AsyncIterator[str]]:
+    """
+    Async counterpart of stream_job.
+
+    After timeout seconds the daemon is asked to stop the job (by
+    half-closing the connection) and its remaining stderr, where perf
+    prints the counts so far, is read for up to 2 * STOP_GRACE seconds
+    before rykit.cmd.CommandTimeout is raised with all of it.
+    """
+    socket_path = default_socket_path() if socket_path is None else socket_path
+    if not os.path.exists(socket_path) or not _trusted_path(socket_path):
+        return None
+    try:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    except OSError:
+        return None
+    if not _trusted_peer(writer.get_extra_info("socket")):
+        writer.close()
+        return None
+    return _astream(reader, writer, _job(perf_args, cmd, pin), timeout)
+
+
+async def _astream(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, job: dict, timeout: Optional[float] = None
+) -> AsyncIterator[str]:
+    from rykit.cmd import CommandFailed, CommandTimeout
+
+    output: List[str] = []
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = False
+    try:
+        writer.write((json.dumps(job) + "\n").encode())
+        await writer.drain()
+        while True:
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                line = await asyncio.wait_for(reader.readline(), remaining)
+            except asyncio.TimeoutError:
+                if timed_out:
+                    # the daemon did not finish stopping the job in time
+                    break
+                # EOF on the connection makes the daemon stop the job; keep
+                # reading for the counts perf prints on SIGINT
+                timed_out = True
+                writer.write_eof()
+                deadline = time.monotonic() + 2 * STOP_GRACE
+                continue
+            if not line:
+                break
+            msg = json.loads(line)
+            if "stderr" in msg:
+                output.append(msg["stderr"])
+                yield msg["stderr"]
+            elif "returncode" in msg:
+                returncode = msg["returncode"]
+                if timed_out:
+                    break
+                if returncode not in (0, 124):
+                    raise CommandFailed(returncode, "\n".join(output))
+                return
+            else:
+                raise RuntimeError(f"perf daemon error: {msg.get('error')}")
+    finally:
+        writer.close()
+    if timed_out:
+        assert timeout is not None
+        raise CommandTimeout(job.get("cmd", ""), timeout, "\n".join(output))
+    raise RuntimeError("perf daemon closed the connection before the job finished")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="privileged rykit perf helper")
+    parser.add_argument("--socket", default=None, help="unix socket path")
+    parser.add_argument("--perf", default="perf", help="perf executable")
+    args = parser.parse_args()
+    serve(args.socket, args.perf)
+
+
+if __name__ == "__main__":
+    main()
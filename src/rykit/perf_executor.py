@@ -0,0 +1,227 @@
+import logging
+import shlex
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from rykit.affinity import Pin, numactl_installed, pin_prefix
+from rykit.perf_schedule import perf_sample_scheduled, pmu_of
+from rykit.topology import Topology, get_topology
+
+logger = logging.getLogger(__name__)
+
+
+class PinnedJob(NamedTuple):
+    """
+    One measurement to run pinned to its own CPUs.
+
+    Attributes:
+        cmd (str): Command to run under perf.
+        events (List[str]): Perf event strings to count.
+        cpus (Optional[List[int]]): CPUs to pin to. If None, ncores whole
+                                    physical cores on one NUMA node are
+                                    picked from the free pool.
+        ncores (int): Number of physical cores to allocate when cpus is None.
+        mem_node (Optional[int]): NUMA node for memory, defaults to the node
+                                  of the first allocated cpu.
+        system_wide (bool): Count on all CPUs (-a). Such jobs see every other
+                            job's activity and are never co-scheduled.
+        sudo (bool): Whether to run command as sudo
+    """
+
+    cmd: str
+    events: List[str]
+    cpus: Optional[List[int]] = None
+    ncores: int = 1
+    mem_node: Optional[int] = None
+    system_wide: bool = False
+    sudo: bool = True
+
+
+class JobResult(NamedTuple):
+    """
+    Outcome of one PinnedJob.
+
+    Attributes:
+        job (PinnedJob): The job that was run.
+        cpus (List[int]): CPUs it was pinned to.
+        counts (Optional[Dict[str,Union[int,float]]]): Event -> counter value,
+                                                       None if it failed.
+        error (Optional[BaseException]): The exception raised by the job, if any.
+    """
+
+    job: PinnedJob
+    cpus: List[int]
+    counts: Optional[Dict[str, Union[int, float]]]
+    error: Optional[BaseException]
+
+
+def is_exclusive(job: PinnedJob) -> bool:
+    """
+    Return whether a job's counters would pick up concurrently running jobs.
+
+    That is the case for system-wide jobs and for any uncore event, which
+    counts traffic from the whole socket regardless of pinning.
+    """
+    return job.system_wide or any(pmu_of(e) not in ("cpu", "software") for e in job.events)
+
+
+def _allocate(
+    job: PinnedJob, free: Set[int], topo: Topology
+) -> Optional[Tuple[List[int], int]]:
+    if job.cpus is not None:
+        if not set(job.cpus) <= free:
+            return None
+        mem_node = job.mem_node if job.mem_node is not None else topo.node_of(job.cpus[0])
+        return sorted(job.cpus), mem_node
+    for node in topo.nodes:
+        if job.mem_node is not None and node != job.mem_node:
+            continue
+        picked: List[int] = []
+        ncores = 0
+        seen: Set[int] = set()
+        for cpu in topo.node_cpus(node):
+            if cpu in seen:
+                continue
+            siblings = topo.smt_siblings(cpu)
+            seen.update(siblings)
+            if set(siblings) <= free:
+                picked += siblings
+                ncores += 1
+                if ncores == job.ncores:
+                    return sorted(picked), node
+    return None
+
+
+def _check_feasible(job: PinnedJob, topo: Topology):
+    if job.cpus is not None:
+        assert len(job.cpus) > 0, "cpus must not be empty"
+        unknown = set(job.cpus) - set(topo.cpus)
+        if unknown:
+            raise ValueError(f"job {job.cmd} asks for cpus {sorted(unknown)} which are not online")
+    else:
+        assert job.ncores > 0, "ncores must be positive"
+        nodes = topo.nodes if job.mem_node is None else [job.mem_node]
+        most = max(len({tuple(topo.smt_siblings(c)) for c in topo.node_cpus(n)}) for n in nodes)
+        if job.ncores > most:
+            raise ValueError(f"job {job.cmd} asks for {job.ncores} cores, nodes have at most {most}")
+
+
+def _pinned_cmd(cmd: str, cpus: List[int], mem_node: int) -> str:
+    # jobs run on pool threads, where a preexec_fn (native pinning) can
+    # deadlock the forked child, so the workload is pinned by an exec prefix;
+    # sh -c keeps the whole pipeline of cmd on the cpus, not just its first command
+    if numactl_installed():
+        prefix = pin_prefix(Pin(cpus=cpus, mem_nodes=[mem_node]))
+    elif shutil.which("taskset") is not None:
+        logger.warning("numactl is not installed, pinning %s to cpus %s without binding memory", cmd, cpus)
+        prefix = f"taskset -c {','.join(str(c) for c in cpus)} "
+    else:
+        raise RuntimeError("numactl or taskset should be installed to run pinned jobs")
+    return f"{prefix}sh -c {shlex.quote(cmd)}"
+
+
+def _run_job(job: PinnedJob, cpus: List[int], mem_node: int) -> Dict[str, Union[int, float]]:
+    res = perf_sample_scheduled(
+        _pinned_cmd(job.cmd, cpus, mem_node),
+        job.events,
+        system_wide=job.system_wide,
+        sudo=job.sudo,
+    )
+    return res.counts
+
+
+def run_pinned_jobs(
+    jobs: List[PinnedJob],
+    max_workers: Optional[int] = None,
+    policy: str = "serialize",
+    topology: Optional[Topology] = None,
+) -> List[JobResult]:
+    """
+    Run measurement jobs concurrently on disjoint CPUs.
+
+    Jobs are started in order as soon as their CPUs are free (later jobs may
+    backfill around a job waiting for busy CPUs). Each workload is pinned
+    with a numactl (or, without it, taskset) prefix rather than natively,
+    since jobs are launched from worker threads. Jobs flagged by
+    is_exclusive() wait for every running job to finish and run alone, and
+    no job starts behind them until they are done.
+
+    Args:
+        jobs (List[PinnedJob]): Jobs to run.
+        max_workers (Optional[int]): Most jobs in flight at once, defaults to
+                                     the number of physical cores.
+        policy (str): "serialize" runs exclusive jobs alone, "error" raises
+                      instead of running them alongside other jobs.
+        topology (Optional[Topology]): Defaults to get_topology().
+
+    Returns:
+        List[JobResult]: One result per job, in input order. A failing job
+            reports its exception instead of aborting the others.
+
+    Raises:
+        ValueError: If a job can never be placed, policy is unknown, or
+                    policy is "error" and an exclusive job shares the run.
+    """
+    topo = get_topology() if topology is None else topology
+    if policy not in ("serialize", "error"):
+        raise ValueError(f"policy must be 'serialize' or 'error' (passed {policy})")
+    for job in jobs:
+        _check_feasible(job, topo)
+    if policy == "error" and len(jobs) > 1:
+        bad = [job.cmd for job in jobs if is_exclusive(job)]
+        if bad:
+            raise ValueError(
+                f"jobs {bad} use system-wide or uncore events and would be contaminated by co-scheduled jobs"
+            )
+    if max_workers is None:
+        max_workers = len({tuple(topo.smt_siblings(c)) for c in topo.cpus})
+
+    cond = threading.Condition()
+    free: Set[int] = set(topo.cpus)
+    running = 0
+    exclusive_running = False
+    results: List[Optional[JobResult]] = [None] * len(jobs)
+
+    def work(i: int, cpus: List[int], mem_node: int):
+        nonlocal running, exclusive_running
+        job = jobs[i]
+        try:
+            results[i] = JobResult(job, cpus, _run_job(job, cpus, mem_node), None)
+        except Exception as e:
+            results[i] = JobResult(job, cpus, None, e)
+        finally:
+            with cond:
+                free.update(cpus)
+                running -= 1
+                if is_exclusive(job):
+                    exclusive_running = False
+                cond.notify_all()
+
+    pending = list(range(len(jobs)))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, cond:
+        while pending:
+            for i in list(pending):
+                if exclusive_running or running >= max_workers:
+                    break
+                job = jobs[i]
+                exclusive = is_exclusive(job)
+                if exclusive and running > 0:
+                    # barrier: let the running jobs drain, start nothing after it
+                    break
+                placement = _allocate(job, free, topo)
+                if placement is None:
+                    continue
+                cpus, mem_node = placement
+                free.difference_update(cpus)
+                running += 1
+                exclusive_running = exclusive
+                pending.remove(i)
+                pool.submit(work, i, cpus, mem_node)
+                if exclusive:
+                    break
+            if pending:
+                cond.wait()
+        while running > 0:
+            cond.wait()
+    return [r for r in results if r is not None]
@@ -0,0 +1,118 @@
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Union
+from rykit.affinity import Pin
+from rykit.cmd import stream_perf_stderr, astream_perf_stderr
+from rykit.perf_parse import CHA_EVENT, parse_perf_stat_line
+
+
+class IntervalRecord(NamedTuple):
+    """
+    One counter reading from one `perf stat -I` interval.
+
+    Attributes:
+        timestamp (float): Seconds since perf started, at the end of the interval.
+        event (str): Perf event string, or the event code for CHA events.
+        unit (Optional[str]): CHA index, core ("S0-D0-C3") or cpu ("CPU3")
+                              the value belongs to, None when aggregated.
+        value (Union[int,float]): Counter delta over the interval.
+    """
+
+    timestamp: float
+    event: str
+    unit: Optional[str]
+    value: Union[int, float]
+
+
+def interpret_interval_line(line: str) -> Optional[IntervalRecord]:
+    """
+    Parse one line of `perf stat -I <ms> -x ;` output.
+
+    Handles aggregated, --per-core and -A (per cpu) layouts.
+
+    Args:
+        line (str): A single stderr line.
+
+    Returns:
+        Optional[IntervalRecord]: The record, or None for headers, blank
+            lines and events perf could not count.
+    """
+    parsed = parse_perf_stat_line(line)
+    if parsed is None or parsed.timestamp is None or parsed.value is None:
+        return None
+    unit, event = parsed.agg, parsed.event
+    m = CHA_EVENT.match(event)
+    if m is not None:
+        unit, event = m.group(1), m.group(2)
+    return IntervalRecord(timestamp=parsed.timestamp, event=event, unit=unit, value=parsed.value)
+
+
+def build_perf_interval_args(
+    events: List[str],
+    interval_ms: int,
+    system_wide: bool = False,
+    per_core: bool = False,
+) -> List[str]:
+    """
+    Build `perf stat -I <ms> -x ;` arguments counting events over a command.
+    """
+    assert interval_ms >= 10, "perf stat does not support intervals below 10ms"
+    args = ["stat", "-I", str(interval_ms), "-x", ";"]
+    if system_wide or per_core:
+        args.append("-a")
+    if per_core:
+        args.append("--per-core")
+    for e in events:
+        args += ["-e", e]
+    return args + ["--"]
+
+
+def perf_stream_interval(
+    cmd: str,
+    events: List[str],
+    interval_ms: int = 1000,
+    system_wide: bool = False,
+    per_core: bool = False,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+) -> Iterator[IntervalRecord]:
+    """
+    Count events over cmd and yield per-interval records as perf prints them.
+
+    Memory use is bounded by one line regardless of how long cmd runs.
+    Closing the generator early stops perf and the workload.
+
+    Args:
+        cmd (str): Command to run under perf.
+        events (List[str]): Perf event strings.
+        interval_ms (int): Print interval in milliseconds (>= 10).
+        system_wide (bool): Count on all CPUs (-a), required for uncore events.
+        per_core (bool): Report each core separately (implies system_wide).
+        sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+
+    Yields:
+        IntervalRecord: One record per event (per CHA/core) per interval.
+    """
+    perf_args = build_perf_interval_args(events, interval_ms, system_wide, per_core)
+    for line in stream_perf_stderr(perf_args, cmd, sudo, pin=pin):
+        record = interpret_interval_line(line)
+        if record is not None:
+            yield record
+
+
+async def aperf_stream_interval(
+    cmd: str,
+    events: List[str],
+    interval_ms: int = 1000,
+    system_wide: bool = False,
+    per_core: bool = False,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+) -> AsyncIterator[IntervalRecord]:
+    """
+    Async iterator variant of perf_stream_interval.
+    """
+    perf_args = build_perf_interval_args(events, interval_ms, system_wide, per_core)
+    async for line in astream_perf_stderr(perf_args, cmd, sudo, pin=pin):
+        record = interpret_interval_line(line)
+        if record is not None:
+            yield record
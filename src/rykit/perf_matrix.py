@@ -0,0 +1,153 @@
+import math
+import operator
+from array import array
+from itertools import compress, repeat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+NAN = float("nan")
+
+
+def _divide(num: array, den: array) -> array:
+    # operator.truediv runs the loop in C; zero denominators (idle cores) are
+    # located with compress/not_, also in C, and set to NaN so that the whole
+    # plane is still divided in one pass (x / NaN is NaN)
+    try:
+        return array("d", map(operator.truediv, num, den))
+    except ZeroDivisionError:
+        pass
+    den = array("d", den)
+    for i in compress(range(len(den)), map(operator.not_, den)):
+        den[i] = NAN
+    return array("d", map(operator.truediv, num, den))
+
+
+class CounterMatrix:
+    """
+    Dense event x socket x core counter matrix backed by one contiguous
+    array of doubles.
+
+    Cells perf did not report (e.g. cores absent from a socket) hold NaN.
+    Ratio and normalization operations work on whole event planes at a
+    time instead of per core dict comprehensions; dict views are available
+    for code expecting the older Dict[str, Dict[str, int]] results.
+
+    Attributes:
+        events (List[str]): Event names, the first axis.
+        sockets (List[int]): Socket IDs, the second axis.
+        cores (List[int]): Core IDs, the third axis.
+        data (array): Row-major values of length len(events)*len(sockets)*len(cores).
+    """
+
+    def __init__(
+        self,
+        events: List[str],
+        sockets: List[int],
+        cores: List[int],
+        data: Optional[array] = None,
+    ):
+        self.events = list(events)
+        self.sockets = list(sockets)
+        self.cores = list(cores)
+        self._event_idx = {e: i for i, e in enumerate(self.events)}
+        self._socket_idx = {s: i for i, s in enumerate(self.sockets)}
+        self._core_idx = {c: i for i, c in enumerate(self.cores)}
+        size = len(self.events) * self.plane_size
+        if data is None:
+            data = array("d", repeat(NAN, size))
+        assert len(data) == size, f"data has {len(data)} cells, expected {size}"
+        self.data = data
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (len(self.events), len(self.sockets), len(self.cores))
+
+    @property
+    def plane_size(self) -> int:
+        """Number of cells per event (sockets x cores)."""
+        return len(self.sockets) * len(self.cores)
+
+    def _offset(self, event: str, socket: int, core: int) -> int:
+        return (
+            self._event_idx[event] * self.plane_size
+            + self._socket_idx[socket] * len(self.cores)
+            + self._core_idx[core]
+        )
+
+    def get(self, event: str, socket: int, core: int) -> float:
+        return self.data[self._offset(event, socket, core)]
+
+    def set(self, event: str, socket: int, core: int, value: float):
+        self.data[self._offset(event, socket, core)] = value
+
+    def plane(self, event: str) -> array:
+        """Return a copy of the socket x core values of one event."""
+        start = self._event_idx[event] * self.plane_size
+        return self.data[start : start + self.plane_size]
+
+    def ratio(self, numerator: str, denominator: str, name: Optional[str] = None) -> "CounterMatrix":
+        """
+        Divide one event by another on every socket/core.
+
+        Args:
+            numerator (str): Event on top, e.g. "instructions".
+            denominator (str): Event below, e.g. "cycles".
+            name (Optional[str]): Name of the resulting event, defaults to
+                                  "numerator/denominator".
+
+        Returns:
+            CounterMatrix: Single event matrix; cells with a zero denominator are NaN.
+        """
+        name = f"{numerator}/{denominator}" if name is None else name
+        data = _divide(self.plane(numerator), self.plane(denominator))
+        return CounterMatrix([name], self.sockets, self.cores, data)
+
+    def normalize(self, by: str) -> "CounterMatrix":
+        """
+        Divide every event by one event, e.g. by="cycles" for per-cycle rates.
+
+        Returns:
+            CounterMatrix: Matrix with the same events (by itself becomes 1.0).
+        """
+        den = self.plane(by)
+        data = array("d")
+        for event in self.events:
+            data.extend(_divide(self.plane(event), den))
+        return CounterMatrix(self.events, self.sockets, self.cores, data)
+
+    def scale(self, factor: float) -> "CounterMatrix":
+        """Multiply every cell by factor (e.g. 64 to turn cache lines into bytes)."""
+        data = array("d", map(operator.mul, self.data, repeat(factor)))
+        return CounterMatrix(self.events, self.sockets, self.cores, data)
+
+    def select(self, events: Iterable[str]) -> "CounterMatrix":
+        """Return a matrix restricted to the given events."""
+        events = list(events)
+        data = array("d")
+        for event in events:
+            data.extend(self.plane(event))
+        return CounterMatrix(events, self.sockets, self.cores, data)
+
+    def total(self, event: str, socket: Optional[int] = None) -> float:
+        """Sum an event over all cores of a socket (or all sockets), ignoring NaN."""
+        values = self.plane(event)
+        if socket is not None:
+            start = self._socket_idx[socket] * len(self.cores)
+            values = values[start : start + len(self.cores)]
+        return math.fsum(v for v in values if v == v)
+
+    def as_dict(self, socket: int) -> Dict[str, Dict[str, float]]:
+        """
+        Dict view of one socket: event -> core ID (as str) -> value.
+
+        Cores without a value are omitted, matching interpret_per_core_events.
+        """
+        start = self._socket_idx[socket] * len(self.cores)
+        res: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            row = self.plane(event)[start : start + len(self.cores)]
+            res[event] = {str(c): v for c, v in zip(self.cores, row) if v == v}
+        return res
+
+    def to_dict(self) -> Dict[int, Dict[str, Dict[str, float]]]:
+        """Dict view of all sockets: socket -> event -> core ID (as str) -> value."""
+        return {socket: self.as_dict(socket) for socket in self.sockets}
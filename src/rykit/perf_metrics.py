@@ -0,0 +1,468 @@
+import ast
+import operator
+import re
+import time
+from array import array
+from functools import lru_cache
+from itertools import repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+from rykit.affinity import Pin
+from rykit.instrument import POSTPROCESS, span
+from rykit.perf_interval import IntervalRecord
+from rykit.perf_matrix import NAN, CounterMatrix, _divide
+from rykit.perf_sample import perf_sample_per_core_matrix
+from rykit.perf_schedule import ScheduledResult, perf_sample_scheduled
+
+# bytes moved per counted cache line (CHA/amd_df read and write events count lines)
+CACHE_LINE = 64
+
+# names usable in expressions besides events
+CONSTANTS: Dict[str, float] = {"cache_line": CACHE_LINE}
+
+# elapsed seconds of the measurement: the interval length for interval
+# records, duration_time otherwise
+SECONDS = "seconds"
+
+# perf event giving the wall time of a run in nanoseconds
+DURATION_EVENT = "duration_time"
+
+# multiplier from a metric unit to its SI base unit, see convert()
+UNIT_SCALE: Dict[str, float] = {
+    "": 1.0,
+    "B": 1.0,
+    "KB": 1e3,
+    "MB": 1e6,
+    "GB": 1e9,
+    "KiB": 1024.0,
+    "MiB": 1024.0**2,
+    "GiB": 1024.0**3,
+    "B/s": 1.0,
+    "KB/s": 1e3,
+    "MB/s": 1e6,
+    "GB/s": 1e9,
+    "KiB/s": 1024.0,
+    "MiB/s": 1024.0**2,
+    "GiB/s": 1024.0**3,
+    "Hz": 1.0,
+    "GHz": 1e9,
+    "%": 1e-2,
+    "s": 1.0,
+    "ms": 1e-3,
+    "ns": 1e-9,
+}
+
+_BRACED = re.compile(r"\{([^{}]+)\}")
+_PLACEHOLDER = "_rykit_event_"
+
+Value = Union[float, array]
+
+
+class Metric(NamedTuple):
+    """
+    A quantity derived from counters by an arithmetic expression.
+
+    Expressions use +, -, *, /, ** and parentheses over numbers, event
+    names, CONSTANTS and `seconds`. Event names that are not Python
+    identifiers (dashes, slashes, CHA event codes, ...) go in braces:
+    "{cache-misses} / {cache-references}", "{0x35} * cache_line / seconds".
+    Dotted names (mem_load_retired.l3_miss) may be written bare. Division by
+    zero gives NaN instead of raising.
+
+    Attributes:
+        name (str): Metric name, the key in evaluation results.
+        expr (str): The expression.
+        unit (str): Unit of the result, a key of UNIT_SCALE ("" for ratios).
+        description (str): Human readable meaning.
+    """
+
+    name: str
+    expr: str
+    unit: str = ""
+    description: str = ""
+
+    @property
+    def events(self) -> Tuple[str, ...]:
+        """Events the expression reads, in order of appearance."""
+        return _compile(self.expr)[1]
+
+    @property
+    def uses_seconds(self) -> bool:
+        return _compile(self.expr)[2]
+
+
+# metrics over generic perf events, usable by name in place of a Metric
+METRICS: Dict[str, Metric] = {
+    m.name: m
+    for m in [
+        Metric("ipc", "instructions / cycles", "", "instructions per cycle"),
+        Metric("cpi", "cycles / instructions", "", "cycles per instruction"),
+        Metric("branch_miss_ratio", "{branch-misses} / {branch-instructions}", "", "mispredicted share of branches"),
+        Metric("cache_miss_ratio", "{cache-misses} / {cache-references}", "", "share of cache references missing the LLC"),
+        Metric("llc_load_miss_ratio", "{LLC-load-misses} / {LLC-loads}", "", "share of LLC loads that missed"),
+        Metric("l1d_load_miss_ratio", "{L1-dcache-load-misses} / {L1-dcache-loads}", "", "share of L1D loads that missed"),
+        Metric("mpki", "{cache-misses} * 1000 / instructions", "", "LLC misses per thousand instructions"),
+        Metric("ghz", "cycles / ({task-clock} * 1e6)", "GHz", "average clock while running"),
+        Metric("cpus_utilized", "{task-clock} / (seconds * 1e3)", "", "average busy CPUs"),
+    ]
+}
+
+
+def _binop(op: Callable[[float, float], float]) -> Callable[[Value, Value], Value]:
+    def apply(a: Value, b: Value) -> Value:
+        if isinstance(a, array):
+            if isinstance(b, array):
+                return array("d", map(op, a, b))
+            return array("d", map(op, a, repeat(b)))
+        if isinstance(b, array):
+            return array("d", map(op, repeat(a), b))
+        return op(a, b)
+
+    return apply
+
+
+def _div(a: Value, b: Value) -> Value:
+    # zero denominators give NaN (idle cores); arrays go through
+    # perf_matrix._divide, which divides a whole plane in one C-level pass
+    if isinstance(b, array):
+        return _divide(a if isinstance(a, array) else array("d", repeat(a, len(b))), b)
+    if b == 0:
+        return array("d", repeat(NAN, len(a))) if isinstance(a, array) else NAN
+    return _binop(operator.truediv)(a, b)
+
+
+_BINOPS: Dict[type, Callable[[Value, Value], Value]] = {
+    ast.Add: _binop(operator.add),
+    ast.Sub: _binop(operator.sub),
+    ast.Mult: _binop(operator.mul),
+    ast.Div: _div,
+    ast.Pow: _binop(operator.pow),
+}
+
+
+def _neg(a: Value) -> Value:
+    return array("d", map(operator.neg, a)) if isinstance(a, array) else -a
+
+
+def _dotted(node: ast.expr) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return None if base is None else f"{base}.{node.attr}"
+    return None
+
+
+@lru_cache(maxsize=None)
+def _compile(expr: str) -> Tuple[Callable[[Callable[[str], Value]], Value], Tuple[str, ...], bool]:
+    # returns (fn(lookup) -> value, events read, whether seconds is read);
+    # compiled once per expression into nested closures
+    braced: List[str] = []
+
+    def sub(m: re.Match) -> str:
+        braced.append(m.group(1).strip())
+        return f"{_PLACEHOLDER}{len(braced) - 1}"
+
+    try:
+        tree = ast.parse(_BRACED.sub(sub, expr), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"invalid metric expression {expr!r}: {e.msg}") from None
+    events: List[str] = []
+    uses_seconds = False
+
+    def build(node: ast.expr) -> Callable[[Callable[[str], Value]], Value]:
+        nonlocal uses_seconds
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            const = float(node.value)
+            return lambda lookup: const
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            fn, left, right = _BINOPS[type(node.op)], build(node.left), build(node.right)
+            return lambda lookup: fn(left(lookup), right(lookup))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            inner = build(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return inner
+            return lambda lookup: _neg(inner(lookup))
+        name = _dotted(node)
+        if name is None:
+            raise ValueError(f"unsupported syntax in metric expression {expr!r}: {ast.dump(node)}")
+        if name.startswith(_PLACEHOLDER):
+            name = braced[int(name[len(_PLACEHOLDER) :])]
+        elif name in CONSTANTS:
+            const = CONSTANTS[name]
+            return lambda lookup: const
+        elif name == SECONDS:
+            uses_seconds = True
+        if name != SECONDS and name not in events:
+            events.append(name)
+        return lambda lookup: lookup(name)
+
+    fn = build(tree.body)
+    return fn, tuple(events), uses_seconds
+
+
+def resolve_metrics(metrics: Sequence[Union[Metric, str]]) -> List[Metric]:
+    """
+    Turn names of built-in METRICS into Metric objects, validating expressions.
+
+    Raises:
+        ValueError: If a name is unknown or an expression is invalid.
+    """
+    res: List[Metric] = []
+    for m in metrics:
+        if isinstance(m, str):
+            if m not in METRICS:
+                raise ValueError(f"unknown metric {m}, known metrics are {sorted(METRICS)}")
+            m = METRICS[m]
+        _compile(m.expr)
+        res.append(m)
+    return res
+
+
+def required_events(metrics: Sequence[Union[Metric, str]], events: Optional[List[str]] = None) -> List[str]:
+    """
+    Return events extended with everything the metrics read, without duplicates.
+
+    DURATION_EVENT is added when a metric uses seconds.
+    """
+    res = list(events or [])
+    for m in resolve_metrics(metrics):
+        needed = list(m.events) + ([DURATION_EVENT] if m.uses_seconds else [])
+        for e in needed:
+            if e not in res:
+                res.append(e)
+    return res
+
+
+def convert(value: float, from_unit: str, to_unit: str) -> float:
+    """
+    Convert value between units of UNIT_SCALE, e.g. convert(x, "B/s", "GiB/s").
+    """
+    return value * UNIT_SCALE[from_unit] / UNIT_SCALE[to_unit]
+
+
+def _seconds_of(counts: Mapping[str, Union[int, float]], seconds: Optional[float]) -> float:
+    if seconds is not None:
+        return seconds
+    if DURATION_EVENT in counts:
+        return counts[DURATION_EVENT] / 1e9
+    return NAN
+
+
+def evaluate(
+    metrics: Sequence[Union[Metric, str]],
+    counts: Mapping[str, Union[int, float]],
+    seconds: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Evaluate metrics over aggregate counts.
+
+    Args:
+        metrics (Sequence[Union[Metric,str]]): Metrics or names of METRICS.
+        counts (Mapping[str,Union[int,float]]): Event -> value, e.g. from
+            perf_sample_core_events or ScheduledResult.counts.
+        seconds (Optional[float]): Elapsed time, defaults to the duration_time count.
+
+    Returns:
+        Dict[str,float]: Metric name -> value, NaN where an event is missing.
+    """
+    secs = _seconds_of(counts, seconds)
+
+    def lookup(name: str) -> Value:
+        if name == SECONDS:
+            return secs
+        return float(counts.get(name, NAN))
+
+    with span(POSTPROCESS, metrics=len(metrics)):
+        return {m.name: _compile(m.expr)[0](lookup) for m in resolve_metrics(metrics)}
+
+
+def evaluate_matrix(
+    metrics: Sequence[Union[Metric, str]], matrix: CounterMatrix, seconds: float = NAN
+) -> CounterMatrix:
+    """
+    Evaluate metrics on every socket/core of a per-core matrix at once.
+
+    Args:
+        metrics (Sequence[Union[Metric,str]]): Metrics or names of METRICS.
+        matrix (CounterMatrix): Per-core counts, e.g. from perf_sample_per_core_matrix.
+        seconds (float): Elapsed time for metrics using seconds.
+
+    Returns:
+        CounterMatrix: Matrix with one event per metric (named after it).
+    """
+    metrics = resolve_metrics(metrics)
+    known = set(matrix.events)
+
+    def lookup(name: str) -> Value:
+        if name == SECONDS:
+            return seconds
+        return matrix.plane(name) if name in known else NAN
+
+    data = array("d")
+    with span(POSTPROCESS, metrics=len(metrics), cells=matrix.plane_size):
+        for m in metrics:
+            value = _compile(m.expr)[0](lookup)
+            data.extend(value if isinstance(value, array) else repeat(value, matrix.plane_size))
+    return CounterMatrix([m.name for m in metrics], matrix.sockets, matrix.cores, data)
+
+
+def evaluate_units(
+    metrics: Sequence[Union[Metric, str]],
+    counts: Mapping[str, Mapping[str, Union[int, float]]],
+    seconds: float = NAN,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Evaluate metrics per unit (CHA, amd_df instance, CPU, ...) at once.
+
+    Args:
+        metrics (Sequence[Union[Metric,str]]): Metrics or names of METRICS;
+            CHA events are referenced by code, e.g. "{0x35} * cache_line / seconds".
+        counts (Mapping[str,Mapping[str,Union[int,float]]]): Event -> unit -> value,
+            e.g. from perf_sample_uncore_event_many.
+        seconds (float): Elapsed time for metrics using seconds.
+
+    Returns:
+        Dict[str,Dict[str,float]]: Metric name -> unit -> value.
+    """
+    metrics = resolve_metrics(metrics)
+    units = sorted({u for per_unit in counts.values() for u in per_unit}, key=lambda u: (len(u), u))
+    columns: Dict[str, array] = {}
+
+    def lookup(name: str) -> Value:
+        if name == SECONDS:
+            return seconds
+        if name not in counts:
+            return NAN
+        col = columns.get(name)
+        if col is None:
+            per_unit = counts[name]
+            col = array("d", (float(per_unit.get(u, NAN)) for u in units))
+            columns[name] = col
+        return col
+
+    res: Dict[str, Dict[str, float]] = {}
+    with span(POSTPROCESS, metrics=len(metrics), units=len(units)):
+        for m in metrics:
+            value = _compile(m.expr)[0](lookup)
+            values = value if isinstance(value, array) else repeat(value, len(units))
+            res[m.name] = dict(zip(units, values))
+    return res
+
+
+class MetricSample(NamedTuple):
+    """
+    Metric values of one unit over one interval.
+
+    Attributes:
+        timestamp (float): End of the interval, seconds since perf started.
+        unit (Optional[str]): CHA index, core or CPU, None when aggregated.
+        values (Dict[str,float]): Metric name -> value.
+    """
+
+    timestamp: float
+    unit: Optional[str]
+    values: Dict[str, float]
+
+
+def evaluate_intervals(
+    metrics: Sequence[Union[Metric, str]], records: Iterable[IntervalRecord]
+) -> Iterator[MetricSample]:
+    """
+    Evaluate metrics over an interval stream, one interval at a time.
+
+    Only the current interval is held in memory, so this composes with
+    perf_stream_interval/perf_attach_stream over unbounded runs. seconds is
+    the length of each interval.
+
+    Yields:
+        MetricSample: One per unit per interval, in unit order.
+    """
+    metrics = resolve_metrics(metrics)
+    prev_ts = 0.0
+    ts: Optional[float] = None
+    counts: Dict[str, Dict[Optional[str], Union[int, float]]] = {}
+
+    def flush() -> Iterator[MetricSample]:
+        assert ts is not None
+        # evaluate_units wants str units; the aggregate unit None maps to ""
+        by_event = {e: {"" if u is None else u: v for u, v in per_unit.items()} for e, per_unit in counts.items()}
+        values = evaluate_units(metrics, by_event, ts - prev_ts)
+        units = next(iter(values.values())).keys() if values else []
+        for unit in units:
+            yield MetricSample(ts, unit or None, {name: values[name][unit] for name in values})
+
+    for record in records:
+        if ts is not None and record.timestamp != ts:
+            yield from flush()
+            prev_ts, counts = ts, {}
+        ts = record.timestamp
+        counts.setdefault(record.event, {})[record.unit] = record.value
+    if ts is not None:
+        yield from flush()
+
+
+class MetricResult(NamedTuple):
+    """
+    Metrics together with the counts they were computed from.
+
+    Attributes:
+        values (Dict[str,float]): Metric name -> value.
+        counts (ScheduledResult): The raw counts and run metadata.
+    """
+
+    values: Dict[str, float]
+    counts: ScheduledResult
+
+
+def perf_sample_metrics(
+    cmd: str,
+    metrics: Sequence[Union[Metric, str]],
+    events: Optional[List[str]] = None,
+    mode: str = "sequential",
+    system_wide: bool = False,
+    sudo: bool = True,
+    limits: Optional[Dict[str, int]] = None,
+    pin: Optional[Pin] = None,
+) -> MetricResult:
+    """
+    Count every event the metrics need (plus events) over cmd and evaluate them.
+
+    Events are scheduled across passes like perf_sample_scheduled; counts
+    keep the units perf reports (no Byte to cache line conversion).
+
+    Args:
+        cmd (str): Command to run under perf.
+        metrics (Sequence[Union[Metric,str]]): Metrics or names of METRICS.
+        events (Optional[List[str]]): Extra events to count.
+        mode (str): "sequential" or "multiplex", see perf_sample_scheduled.
+        system_wide (bool): Count on all CPUs, required for uncore events.
+        sudo (bool): Whether to run command as sudo.
+        limits (Optional[Dict[str,int]]): Counters per PMU family.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+
+    Returns:
+        MetricResult: Metric values and the underlying counts.
+    """
+    res = perf_sample_scheduled(
+        cmd, required_events(metrics, events), mode, system_wide, sudo, limits, pin
+    )
+    return MetricResult(values=evaluate(metrics, res.counts), counts=res)
+
+
+def perf_sample_per_core_metrics(
+    cmd: str,
+    metrics: Sequence[Union[Metric, str]],
+    pin: Optional[Pin] = None,
+) -> CounterMatrix:
+    """
+    Evaluate metrics on every core from one per-core perf run.
+
+    seconds is the wall time of the run measured around perf.
+
+    Returns:
+        CounterMatrix: metric x socket x core values.
+    """
+    events = [e for e in required_events(metrics) if e != DURATION_EVENT]
+    start = time.monotonic()
+    matrix = perf_sample_per_core_matrix(cmd, events, pin=pin)
+    return evaluate_matrix(metrics, matrix, time.monotonic() - start)
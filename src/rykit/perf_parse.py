@@ -0,0 +1,210 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Union
+from rykit.instrument import PARSE, span
+
+# aggregation prefixes perf prepends in --per-socket/--per-die/--per-core/
+# --per-node modes (followed by a cpu count) and in -A mode (no count)
+_AGG_WITH_COUNT = re.compile(r"^(S\d+(-D\d+)?(-C\d+)?|N\d+)$")
+_AGG_CPU = re.compile(r"^CPU\d+$")
+_PERCENT = re.compile(r"\(\s*([\d.]+)%\s*\)\s*$")
+# modifiers perf appends to the names it prints (cycles:u when it falls back
+# to user-only counting under perf_event_paranoid, cycles:ppp, ...)
+_MODIFIER_SUFFIX = re.compile(r":[ukhIGHpPSDWebR]+$")
+# Intel CHA event strings as rykit.perf_sample_intel builds them: CHA index, event code
+CHA_EVENT = re.compile(r"^uncore_cha_(\d+)/event=([^,/]+)")
+
+
+class PerfStatLine(NamedTuple):
+    """
+    One counter line of `perf stat` output, tokenized.
+
+    Attributes:
+        timestamp (Optional[float]): Interval timestamp in -I mode, else None.
+        agg (Optional[str]): Aggregation unit ("S0-D0-C3", "CPU3", "N0", ...)
+                             or None for aggregated output.
+        value (Optional[Union[int,float]]): Counter value, None if perf
+                                            reported "<not counted>"/"<not supported>".
+        unit (str): Unit perf printed for the value ("msec", "Bytes", ...) or "".
+        event (str): The exact event string.
+        run_time (int): Nanoseconds the counter was running (0 if not reported).
+        pct_enabled (float): Percent of enabled time the counter ran.
+    """
+
+    timestamp: Optional[float]
+    agg: Optional[str]
+    value: Optional[Union[int, float]]
+    unit: str
+    event: str
+    run_time: int
+    pct_enabled: float
+
+
+def parse_number(valstr: str) -> Union[int, float]:
+    """
+    Parse a perf counter value, dropping thousands separators.
+
+    Raises:
+        ValueError: If valstr is not a number.
+    """
+    valstr = valstr.replace(",", "")
+    try:
+        return int(valstr)
+    except ValueError:
+        return float(valstr)
+
+
+def _is_number(s: str) -> bool:
+    try:
+        parse_number(s)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_csv_line(line: str, sep: str) -> Optional[PerfStatLine]:
+    fields = line.split(sep)
+    timestamp: Optional[float] = None
+    agg: Optional[str] = None
+    # interval timestamps are followed by a value or aggregation unit, a
+    # plain counter value is followed by its (non numeric) unit
+    if (
+        len(fields) > 1
+        and not _AGG_WITH_COUNT.match(fields[0])
+        and _is_number(fields[0])
+        and (
+            _is_number(fields[1])
+            or fields[1].startswith("<")
+            or _AGG_WITH_COUNT.match(fields[1]) is not None
+            or _AGG_CPU.match(fields[1]) is not None
+        )
+    ):
+        timestamp = float(fields[0])
+        fields = fields[1:]
+    if len(fields) > 0 and _AGG_WITH_COUNT.match(fields[0]):
+        agg, fields = fields[0], fields[2:]
+    elif len(fields) > 0 and _AGG_CPU.match(fields[0]):
+        agg, fields = fields[0], fields[1:]
+    if len(fields) < 3:
+        return None
+    valstr, unit, event = fields[0].strip(), fields[1], fields[2]
+    if event == "":
+        return None
+    value: Optional[Union[int, float]] = None
+    if not valstr.startswith("<"):
+        try:
+            value = parse_number(valstr)
+        except ValueError:
+            return None
+    run_time = fields[3] if len(fields) > 3 else ""
+    pct = fields[4] if len(fields) > 4 else ""
+    return PerfStatLine(
+        timestamp=timestamp,
+        agg=agg,
+        value=value,
+        unit=unit,
+        event=event,
+        run_time=int(run_time) if run_time.isdigit() else 0,
+        pct_enabled=float(pct) if _is_number(pct) else 100.0,
+    )
+
+
+def _parse_human_line(line: str) -> Optional[PerfStatLine]:
+    # e.g. "     8,795      uncore_cha_1/event=0xb3,umask=0x8/      (99.80%)"
+    #      "  1,234.56 msec task-clock   #    0.998 CPUs utilized"
+    body = line.split("#")[0]
+    pct = 100.0
+    m = _PERCENT.search(body)
+    if m is not None:
+        pct = float(m.group(1))
+        body = body[: m.start()]
+    tokens = body.split()
+    if len(tokens) < 2:
+        return None
+    if tokens[0] == "<not" and len(tokens) >= 3:
+        return PerfStatLine(None, None, None, "", tokens[2], 0, pct)
+    try:
+        value = parse_number(tokens[0])
+    except ValueError:
+        return None
+    unit = ""
+    event = tokens[1]
+    if len(tokens) >= 3:
+        unit, event = tokens[1], tokens[2]
+    return PerfStatLine(None, None, value, unit, event, 0, pct)
+
+
+def parse_perf_stat_line(line: str, sep: str = ";") -> Optional[PerfStatLine]:
+    """
+    Tokenize one line of `perf stat` output.
+
+    Both `-x <sep>` (CSV, optionally with -I timestamps and aggregation
+    prefixes) and the default human-readable layout are understood.
+
+    Args:
+        line (str): A single line of perf's stderr.
+        sep (str): The -x field separator.
+
+    Returns:
+        Optional[PerfStatLine]: The tokenized line, or None if it is not a
+            counter line (headers, comments, blank lines).
+    """
+    stripped = line.strip()
+    if stripped == "" or stripped.startswith("#"):
+        return None
+    if sep in stripped:
+        return _parse_csv_line(stripped, sep)
+    return _parse_human_line(stripped)
+
+
+def index_perf_stat(output: str, sep: str = ";") -> Dict[str, List[PerfStatLine]]:
+    """
+    Tokenize perf stat output once and index the lines by exact event string.
+
+    Args:
+        output (str): Raw stderr output from perf.
+        sep (str): The -x field separator.
+
+    Returns:
+        Dict[str,List[PerfStatLine]]: Event string -> its lines in output order
+            (several per event in per-core, per-cpu or interval mode).
+    """
+    index: Dict[str, List[PerfStatLine]] = {}
+    with span(PARSE, output_bytes=len(output)) as s:
+        for line in output.split("\n"):
+            parsed = parse_perf_stat_line(line, sep)
+            if parsed is None:
+                continue
+            lines = index.get(parsed.event)
+            if lines is None:
+                index[parsed.event] = [parsed]
+            else:
+                lines.append(parsed)
+        s.set(events=len(index))
+    return index
+
+
+def base_event(event: str) -> str:
+    """Strip the modifier suffix perf may print after an event ("cycles:u" -> "cycles")."""
+    return _MODIFIER_SUFFIX.sub("", event)
+
+
+def lookup_event(index: Dict[str, List[PerfStatLine]], event: str) -> List[PerfStatLine]:
+    """
+    Return the indexed lines of event, falling back to lines perf printed
+    under a modified name (event "cycles" reported as "cycles:u").
+
+    Args:
+        index (Dict[str,List[PerfStatLine]]): Result of index_perf_stat.
+        event (str): Event string as requested.
+
+    Returns:
+        List[PerfStatLine]: The lines, empty if perf reported nothing for event.
+    """
+    lines = index.get(event)
+    if lines is not None:
+        return lines
+    base = base_event(event)
+    for name, lines in index.items():
+        if name != event and base_event(name) == base:
+            return lines
+    return []
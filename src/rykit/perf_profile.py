@@ -0,0 +1,346 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from rykit.affinity import Pin
+from rykit.cmd import run_perf_read_stderr, stream_perf_stdout
+from rykit.perf_catalog import validate_events
+
+logger = logging.getLogger(__name__)
+
+# fields requested from perf script, parsed by iter_perf_script
+SCRIPT_FIELDS = "comm,tid,period,event,ip,sym,dso"
+
+# "bench  1234  100003 cycles:   55d1c3a0 compute (/path/bench)"
+_HEADER = re.compile(r"^\s*(?P<comm>.+?)\s+(?P<tid>\d+)\s+(?P<period>\d+)\s+(?P<event>\S+):(?:\s+(?P<rest>.*))?$")
+# "	    55d1c3a0 compute (/path/bench)"
+_FRAME = re.compile(r"^\s*(?P<ip>[0-9a-fA-F]+)\s+(?P<sym>.*?)\s*\((?P<dso>[^()]*)\)\s*$")
+
+OTHER = "[other]"
+
+
+class Frame(NamedTuple):
+    """One call stack entry: symbol (or "[unknown]") and the DSO it is in."""
+
+    sym: str
+    dso: str
+
+
+class Sample(NamedTuple):
+    """
+    One `perf script` sample.
+
+    Attributes:
+        comm (str): Command name of the sampled thread.
+        tid (int): Thread ID.
+        period (int): Events this sample stands for.
+        event (str): Sampled event.
+        frames (Tuple[Frame,...]): Call stack, leaf first (just the leaf
+                                   without --call-graph).
+    """
+
+    comm: str
+    tid: int
+    period: int
+    event: str
+    frames: Tuple[Frame, ...]
+
+
+class ProfileEntry(NamedTuple):
+    """Samples and summed period attributed to one table key."""
+
+    samples: int
+    period: int
+
+
+def _frame(line: str) -> Optional[Frame]:
+    m = _FRAME.match(line)
+    if m is None:
+        return None
+    return Frame(m.group("sym") or "[unknown]", m.group("dso"))
+
+
+def iter_perf_script(lines: Iterable[str]) -> Iterator[Sample]:
+    """
+    Parse `perf script -F comm,tid,period,event,ip,sym,dso` output lazily.
+
+    Handles both layouts: the frame on the header line (no call graph) and
+    one frame per following line until a blank line (with call graph).
+
+    Args:
+        lines (Iterable[str]): Output lines, e.g. from rykit.cmd.stream_perf_stdout.
+
+    Yields:
+        Sample: One per sample, holding only that sample's frames.
+    """
+    header: Optional[re.Match] = None
+    frames: List[Frame] = []
+    for line in lines:
+        if header is not None and line.strip() == "":
+            yield _sample(header, frames)
+            header, frames = None, []
+            continue
+        # call chain frames are tab-indented, headers are space-padded
+        m = None if line.startswith("\t") else _HEADER.match(line)
+        if m is not None:
+            if header is not None:
+                yield _sample(header, frames)
+            header, frames = m, []
+            rest = m.group("rest")
+            if rest is not None and rest.strip():
+                frame = _frame(rest)
+                if frame is not None:
+                    frames.append(frame)
+            continue
+        if header is not None:
+            frame = _frame(line)
+            if frame is not None:
+                frames.append(frame)
+    if header is not None:
+        yield _sample(header, frames)
+
+
+def _sample(header: re.Match, frames: List[Frame]) -> Sample:
+    return Sample(
+        comm=header.group("comm").strip(),
+        tid=int(header.group("tid")),
+        period=int(header.group("period")),
+        event=header.group("event"),
+        frames=tuple(frames),
+    )
+
+
+def _frame_name(frame: Frame) -> str:
+    # like stackcollapse-perf: unresolved frames are named after their DSO
+    if frame.sym == "[unknown]":
+        return f"[{os.path.basename(frame.dso)}]"
+    return frame.sym
+
+
+class _BoundedTable:
+    # key -> [samples, period]; when it grows past 2 * max_entries the
+    # lightest half is folded into OTHER, so memory stays O(max_entries)
+    def __init__(self, max_entries: Optional[int]):
+        self.max_entries = max_entries
+        self.data: Dict = {}
+
+    def add(self, key, period: int):
+        entry = self.data.get(key)
+        if entry is None:
+            self.data[key] = [1, period]
+            if self.max_entries is not None and len(self.data) > 2 * self.max_entries:
+                self._prune()
+        else:
+            entry[0] += 1
+            entry[1] += period
+
+    def _prune(self):
+        assert self.max_entries is not None
+        other = self.data.pop(OTHER, [0, 0])
+        ranked = sorted(self.data.items(), key=lambda kv: kv[1][1], reverse=True)
+        self.data = dict(ranked[: self.max_entries])
+        for _, (samples, period) in ranked[self.max_entries:]:
+            other[0] += samples
+            other[1] += period
+        self.data[OTHER] = other
+
+    def entries(self) -> Dict:
+        return {k: ProfileEntry(v[0], v[1]) for k, v in self.data.items()}
+
+
+class Profile:
+    """
+    Hotspot tables for one sampled event, built incrementally.
+
+    Each table keeps at most about 2 * max_entries keys; the lightest are
+    merged into an "[other]" entry, so exact totals are preserved while
+    memory stays bounded however long the recording was.
+
+    Attributes:
+        event (str): The sampled event.
+        samples (int): Number of samples.
+        period (int): Sum of sample periods (estimated event count).
+    """
+
+    def __init__(self, event: str, max_entries: Optional[int] = 10000, call_graph: bool = True):
+        self.event = event
+        self.samples = 0
+        self.period = 0
+        self.call_graph = call_graph
+        self._symbols = _BoundedTable(max_entries)
+        self._dsos = _BoundedTable(max_entries)
+        self._stacks = _BoundedTable(max_entries)
+
+    def add(self, sample: Sample):
+        """Account one sample."""
+        self.samples += 1
+        self.period += sample.period
+        if len(sample.frames) == 0:
+            leaf = Frame("[unknown]", "[unknown]")
+        else:
+            leaf = sample.frames[0]
+        self._symbols.add(leaf, sample.period)
+        self._dsos.add(leaf.dso, sample.period)
+        if self.call_graph:
+            stack = ";".join([sample.comm] + [_frame_name(f) for f in reversed(sample.frames)])
+            self._stacks.add(stack, sample.period)
+
+    def symbols(self) -> Dict[Frame, ProfileEntry]:
+        """Return (symbol, dso) of the sampled instruction -> samples/period (self time)."""
+        return self._symbols.entries()
+
+    def dsos(self) -> Dict[str, ProfileEntry]:
+        """Return DSO of the sampled instruction -> samples/period."""
+        return self._dsos.entries()
+
+    def stacks(self) -> Dict[str, ProfileEntry]:
+        """Return folded call stack ("comm;main;f;g") -> samples/period."""
+        return self._stacks.entries()
+
+    def top(self, n: int = 20, table: str = "symbols") -> List[Tuple[object, ProfileEntry, float]]:
+        """
+        Return the n heaviest entries of a table with their share of the period.
+
+        Args:
+            n (int): Number of entries.
+            table (str): "symbols", "dsos" or "stacks".
+
+        Returns:
+            List[Tuple[key,ProfileEntry,float]]: (key, entry, percent of period),
+                heaviest first.
+        """
+        entries = {"symbols": self.symbols, "dsos": self.dsos, "stacks": self.stacks}[table]()
+        ranked = sorted(entries.items(), key=lambda kv: kv[1].period, reverse=True)[:n]
+        return [(k, e, 100.0 * e.period / self.period if self.period else 0.0) for k, e in ranked]
+
+    def write_folded(self, f: TextIO, weight: str = "period"):
+        """
+        Write the stacks in folded format ("comm;main;f;g 1234" per line),
+        the input of flamegraph.pl and speedscope.
+
+        Args:
+            f (TextIO): Destination.
+            weight (str): "period" (estimated events) or "samples".
+        """
+        for stack, entry in self._stacks.entries().items():
+            f.write(f"{stack} {entry.period if weight == 'period' else entry.samples}\n")
+
+
+def aggregate_samples(
+    samples: Iterable[Sample], max_entries: Optional[int] = 10000, call_graph: bool = True
+) -> Dict[str, Profile]:
+    """
+    Fold a sample stream into one Profile per event, one sample at a time.
+    """
+    profiles: Dict[str, Profile] = {}
+    for sample in samples:
+        profile = profiles.get(sample.event)
+        if profile is None:
+            profile = Profile(sample.event, max_entries, call_graph)
+            profiles[sample.event] = profile
+        profile.add(sample)
+    return profiles
+
+
+def build_perf_record_args(
+    events: List[str],
+    output: str,
+    period: Optional[int] = None,
+    freq: Optional[int] = None,
+    call_graph: Optional[str] = None,
+    system_wide: bool = False,
+) -> List[str]:
+    """
+    Build `perf record` arguments sampling events over a command.
+
+    Args:
+        events (List[str]): Events to sample.
+        output (str): perf.data path.
+        period (Optional[int]): Sample every period events (-c).
+        freq (Optional[int]): Sample at freq Hz instead (-F).
+        call_graph (Optional[str]): Unwinding method ("fp", "dwarf", "lbr"),
+                                    None to record only the sampled ip.
+        system_wide (bool): Sample all CPUs (-a).
+    """
+    assert period is None or freq is None, "pass either period or freq, not both"
+    args = ["record", "-o", output, "-q"]
+    if period is not None:
+        args += ["-c", str(period)]
+    if freq is not None:
+        args += ["-F", str(freq)]
+    if call_graph is not None:
+        args += ["--call-graph", call_graph]
+    if system_wide:
+        args.append("-a")
+    for e in events:
+        args += ["-e", e]
+    return args + ["--"]
+
+
+def stream_perf_script(data: str, sudo: bool = True) -> Iterator[Sample]:
+    """
+    Stream the samples of a perf.data file through `perf script`, one at a
+    time, via the perf daemon when one is running (like perf record).
+    """
+    perf_args = ["script", "-i", data, "-F", SCRIPT_FIELDS]
+    return iter_perf_script(stream_perf_stdout(perf_args, sudo))
+
+
+def perf_profile(
+    cmd: str,
+    events: Optional[List[str]] = None,
+    period: Optional[int] = None,
+    freq: Optional[int] = None,
+    call_graph: Optional[str] = "fp",
+    system_wide: bool = False,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+    max_entries: Optional[int] = 10000,
+    data: Optional[str] = None,
+    validate: bool = True,
+) -> Dict[str, Profile]:
+    """
+    Sample cmd with perf record and aggregate the samples into hotspot tables.
+
+    `perf script` output is parsed and folded into the tables as it is
+    produced; it is never held in memory or written to disk.
+
+    Args:
+        cmd (str): Command to run under perf.
+        events (Optional[List[str]]): Events to sample, defaults to ["cycles"].
+        period (Optional[int]): Sample every period events.
+        freq (Optional[int]): Sample at freq Hz (perf's default of 4000 Hz if
+                              neither is given).
+        call_graph (Optional[str]): "fp", "dwarf", "lbr" or None for flat profiles.
+        system_wide (bool): Sample all CPUs.
+        sudo (bool): Whether to run perf as sudo.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        max_entries (Optional[int]): Bound on each table (see Profile), None for unbounded.
+        data (Optional[str]): Where to keep perf.data; by default a temporary
+                              file removed afterwards.
+        validate (bool): Check the events against the PMU catalog first.
+
+    Returns:
+        Dict[str,Profile]: Sampled event -> its profile.
+    """
+    events = ["cycles"] if events is None else events
+    if validate:
+        validate_events(events)
+    tmpdir = None
+    if data is None:
+        tmpdir = tempfile.mkdtemp(prefix="rykit-record-")
+        data = os.path.join(tmpdir, "perf.data")
+    try:
+        perf_args = build_perf_record_args(events, data, period, freq, call_graph, system_wide)
+        run_perf_read_stderr(perf_args, cmd, sudo=sudo, pin=pin)
+        return aggregate_samples(stream_perf_script(data, sudo), max_entries, call_graph is not None)
+    finally:
+        if tmpdir is not None:
+            # perf.data is owned by root when recorded with sudo
+            if sudo and os.path.exists(data) and not os.access(data, os.W_OK):
+                if subprocess.run(["sudo", "rm", "-f", data], stdout=subprocess.DEVNULL).returncode != 0:
+                    logger.warning("could not remove %s", data)
+            shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,406 @@
+"""
+Region-of-interest counting: perf counts only between enable and disable.
+
+perf is started with counting disabled (`perf stat --delay=-1`) and a
+control FIFO. The code being measured, either this Python process or the
+command perf runs, toggles counting around its hot regions:
+
+    with PerfRegions(["task-clock", "context-switches"]) as roi:
+        setup()
+        with roi.region("kernel"):
+            kernel()
+    roi.results()  # {"kernel": {"task-clock": ..., "context-switches": ...}}
+
+A child launched with PerfRegions(events, cmd="./bench") finds the FIFOs in
+its environment and uses region()/region_enable()/region_disable() from this
+module, `python -m rykit.perf_region enable|disable [name]`, or the protocol
+directly (append "disable <name>" to $RYKIT_PERF_REGIONS before disabling;
+write "enable"/"disable" lines to $RYKIT_PERF_CTL and read "ack" back from
+$RYKIT_PERF_ACK). Outside of rykit the helpers do nothing, so instrumented
+workloads still run standalone.
+
+Only one controller may toggle counting at a time. Needs perf >= 5.10.
+"""
+import argparse
+import contextlib
+import os
+import select
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from rykit.affinity import Pin
+from rykit.cmd import stream_perf_stderr
+from rykit.perf_catalog import validate_events
+from rykit.perf_parse import parse_perf_stat_line
+
+ENV_CTL = "RYKIT_PERF_CTL"
+ENV_ACK = "RYKIT_PERF_ACK"
+ENV_LOG = "RYKIT_PERF_REGIONS"
+
+# seconds a workload waits for perf to acknowledge a toggle
+CHILD_ACK_TIMEOUT = 60.0
+
+# -I period long enough that perf only prints when counting is toggled
+_NO_PERIOD_MS = 24 * 3600 * 1000
+
+RegionCounts = Dict[str, Union[int, float]]
+
+
+def build_perf_region_args(
+    events: List[str],
+    ctl: str,
+    ack: str,
+    system_wide: bool = False,
+    pid: Optional[int] = None,
+) -> List[str]:
+    """
+    Build `perf stat` arguments that start disabled and print one interval
+    each time counting is enabled or disabled through the ctl FIFO.
+    """
+    args = [
+        "stat", "--delay=-1", "--control", f"fifo:{ctl},{ack}",
+        "-I", str(_NO_PERIOD_MS), "-x", ";",
+    ]
+    if system_wide:
+        args.append("-a")
+    if pid is not None:
+        args += ["-p", str(pid)]
+    for e in events:
+        args += ["-e", e]
+    return args + ["--"]
+
+
+def interpret_region_output(
+    lines: List[str], commands: List[str]
+) -> List[Tuple[str, RegionCounts]]:
+    """
+    Pair perf's interval blocks with the control commands that caused them.
+
+    Args:
+        lines (List[str]): perf stderr lines.
+        commands (List[str]): The control log, "enable" or "disable <name>"
+                              per command, in the order they were sent.
+
+    Returns:
+        List[Tuple[str,RegionCounts]]: (region name, event -> count) for each
+            disable, in order. Events perf could not count are left out.
+
+    Raises:
+        RuntimeError: If perf printed fewer blocks than commands were sent.
+    """
+    blocks: List[RegionCounts] = []
+    last_ts: Optional[float] = None
+    for line in lines:
+        parsed = parse_perf_stat_line(line)
+        if parsed is None or parsed.timestamp is None:
+            continue
+        if parsed.timestamp != last_ts:
+            blocks.append({})
+            last_ts = parsed.timestamp
+        if parsed.value is not None:
+            blocks[-1][parsed.event] = parsed.value
+    if len(blocks) < len(commands):
+        raise RuntimeError(
+            f"perf printed {len(blocks)} intervals for {len(commands)} control commands "
+            "(perf >= 5.10 is needed for --control)"
+        )
+    regions: List[Tuple[str, RegionCounts]] = []
+    for command, block in zip(commands, blocks):
+        op, _, name = command.partition(" ")
+        if op == "disable":
+            regions.append((name, block))
+    return regions
+
+
+def _append_log(path: str, command: str):
+    # O_APPEND keeps lines whole when parent and child both log
+    with open(path, "a") as f:
+        f.write(command + "\n")
+
+
+def _read_ack(fd: int, deadline: Optional[float] = None, alive=lambda: True):
+    buf = b""
+    while not buf.endswith(b"ack\n"):
+        if deadline is not None and time.monotonic() > deadline:
+            raise RuntimeError("perf did not acknowledge the control command in time")
+        if not alive():
+            raise RuntimeError("perf exited before acknowledging the control command")
+        ready, _, _ = select.select([fd], [], [], 0.05)
+        if not ready:
+            continue
+        try:
+            chunk = os.read(fd, 64)
+        except BlockingIOError:
+            continue
+        if chunk == b"":
+            # perf has not opened its end yet
+            time.sleep(0.01)
+        buf += chunk
+
+
+class PerfRegions:
+    """
+    Count events only inside marked regions, accumulating each region separately.
+
+    Without cmd, perf attaches to this process and regions are marked with
+    enable()/disable() or the region() context manager. With cmd, perf runs
+    cmd, which marks regions itself using the module-level helpers; the
+    caller may also toggle counting (e.g. to skip a warmup by wall time).
+
+    Attributes:
+        events (List[str]): Perf event strings. Software events such as
+                            task-clock work on machines without a PMU.
+        cmd (Optional[str]): Command to run under perf, None to measure
+                             this process.
+        regions (List[Tuple[str,Dict]]): (name, event -> count) per
+                                         completed region, filled in by stop().
+    """
+
+    def __init__(
+        self,
+        events: List[str],
+        cmd: Optional[str] = None,
+        system_wide: bool = False,
+        sudo: bool = True,
+        pin: Optional[Pin] = None,
+        validate: bool = True,
+        ack_timeout: float = 10.0,
+    ):
+        if validate:
+            validate_events(events)
+        self.events = events
+        self.cmd = cmd
+        self.system_wide = system_wide
+        self.sudo = sudo
+        self.pin = pin
+        self.ack_timeout = ack_timeout
+        self.regions: List[Tuple[str, RegionCounts]] = []
+        self._dir: Optional[str] = None
+        self._ctl_fd: Optional[int] = None
+        self._ack_fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lines: List[str] = []
+        self._error: Optional[BaseException] = None
+
+    def _path(self, name: str) -> str:
+        assert self._dir is not None, "start() has not been called"
+        return os.path.join(self._dir, name)
+
+    def start(self) -> "PerfRegions":
+        """
+        Launch perf with counting disabled.
+
+        Returns:
+            PerfRegions: self, to allow chaining.
+        """
+        assert self._thread is None, "already started"
+        self._dir = tempfile.mkdtemp(prefix="rykit-roi-")
+        ctl, ack, log = self._path("ctl"), self._path("ack"), self._path("log")
+        os.mkfifo(ctl, 0o600)
+        os.mkfifo(ack, 0o600)
+        open(log, "w").close()
+        # perf opens ack write-only at startup, which blocks until there is a reader
+        self._ack_fd = os.open(ack, os.O_RDONLY | os.O_NONBLOCK)
+        if self.cmd is None:
+            done = self._path("done")
+            os.mkfifo(done, 0o600)
+            perf_args = build_perf_region_args(self.events, ctl, ack, self.system_wide, os.getpid())
+            # perf counts the pid for as long as this runs, stop() ends it
+            cmd = f"cat {shlex.quote(done)}"
+        else:
+            perf_args = build_perf_region_args(self.events, ctl, ack, self.system_wide)
+            # passed on the command line, sudo would drop them from the environment
+            env = " ".join(
+                f"{k}={shlex.quote(v)}" for k, v in ((ENV_CTL, ctl), (ENV_ACK, ack), (ENV_LOG, log))
+            )
+            cmd = f"env {env} {self.cmd}"
+        self._thread = threading.Thread(target=self._read, args=(perf_args, cmd), daemon=True)
+        self._thread.start()
+        return self
+
+    def _read(self, perf_args: List[str], cmd: str):
+        try:
+            for line in stream_perf_stderr(perf_args, cmd, self.sudo, pin=self.pin):
+                self._lines.append(line)
+        except BaseException as e:
+            self._error = e
+
+    def _alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _open_writer(self, path: str) -> int:
+        # non-blocking open fails with ENXIO until perf (or cat) has opened its end
+        while True:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                if not self._alive():
+                    raise RuntimeError(f"perf exited before opening {path}") from self._error
+                time.sleep(0.01)
+                continue
+            os.set_blocking(fd, True)
+            return fd
+
+    def _command(self, command: str, log: str):
+        if self._ctl_fd is None:
+            self._ctl_fd = self._open_writer(self._path("ctl"))
+        assert self._ack_fd is not None
+        _append_log(self._path("log"), log)
+        os.write(self._ctl_fd, (command + "\n").encode())
+        _read_ack(self._ack_fd, time.monotonic() + self.ack_timeout, self._alive)
+
+    def enable(self):
+        """Start counting."""
+        self._command("enable", "enable")
+
+    def disable(self, name: str = "region"):
+        """Stop counting and close the current region under name."""
+        self._command("disable", f"disable {name}")
+
+    @contextlib.contextmanager
+    def region(self, name: str = "region") -> Iterator[None]:
+        """Count only while the with-block runs, as region name."""
+        self.enable()
+        try:
+            yield
+        finally:
+            self.disable(name)
+
+    def stop(self) -> List[Tuple[str, RegionCounts]]:
+        """
+        Wait for cmd to finish (or detach from this process) and collect regions.
+
+        Returns:
+            List[Tuple[str,Dict]]: self.regions.
+
+        Raises:
+            CommandFailed: If perf or cmd failed.
+        """
+        assert self._thread is not None, "start() has not been called"
+        try:
+            if self.cmd is None and self._thread.is_alive():
+                # closing the write end gives cat EOF, perf then exits normally
+                os.close(self._open_writer(self._path("done")))
+            self._thread.join()
+            if self._error is not None:
+                raise self._error
+            with open(self._path("log")) as f:
+                commands = [line.rstrip("\n") for line in f if line.strip()]
+            self.regions = interpret_region_output(self._lines, commands)
+        finally:
+            for fd in (self._ctl_fd, self._ack_fd):
+                if fd is not None:
+                    os.close(fd)
+            self._ctl_fd = self._ack_fd = None
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+        return self.regions
+
+    def results(self) -> Dict[str, RegionCounts]:
+        """
+        Return region name -> event -> count, summed over repeats of a region.
+        """
+        totals: Dict[str, RegionCounts] = {}
+        for name, counts in self.regions:
+            acc = totals.setdefault(name, {})
+            for event, value in counts.items():
+                acc[event] = acc.get(event, 0) + value
+        return totals
+
+    def __enter__(self) -> "PerfRegions":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def perf_sample_regions(
+    cmd: str,
+    events: List[str],
+    system_wide: bool = False,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+    validate: bool = True,
+) -> Dict[str, RegionCounts]:
+    """
+    Run cmd under perf, counting only inside the regions cmd marks.
+
+    Returns:
+        Dict[str,Dict[str,Union[int,float]]]: Mapping of region name ->
+            event name -> counter value, summed over repeats of a region.
+    """
+    roi = PerfRegions(events, cmd, system_wide=system_wide, sudo=sudo, pin=pin, validate=validate)
+    with roi:
+        pass
+    return roi.results()
+
+
+_child: Optional[Tuple[int, int, str]] = None
+
+
+def _child_fifos() -> Optional[Tuple[int, int, str]]:
+    global _child
+    if _child is None:
+        ctl, ack, log = (os.environ.get(k) for k in (ENV_CTL, ENV_ACK, ENV_LOG))
+        if ctl is None or ack is None or log is None:
+            return None
+        _child = (os.open(ctl, os.O_WRONLY), os.open(ack, os.O_RDONLY), log)
+    return _child
+
+
+def region_enable():
+    """
+    Start counting, from a workload run by PerfRegions(cmd=...). No-op
+    when not running under it.
+    """
+    fifos = _child_fifos()
+    if fifos is None:
+        return
+    ctl, ack, log = fifos
+    _append_log(log, "enable")
+    os.write(ctl, b"enable\n")
+    _read_ack(ack, time.monotonic() + CHILD_ACK_TIMEOUT)
+
+
+def region_disable(name: str = "region"):
+    """
+    Stop counting and close the current region under name, from a workload
+    run by PerfRegions(cmd=...). No-op when not running under it.
+    """
+    fifos = _child_fifos()
+    if fifos is None:
+        return
+    ctl, ack, log = fifos
+    _append_log(log, f"disable {name}")
+    os.write(ctl, b"disable\n")
+    _read_ack(ack, time.monotonic() + CHILD_ACK_TIMEOUT)
+
+
+@contextlib.contextmanager
+def region(name: str = "region") -> Iterator[None]:
+    """Count only while the with-block runs, from a workload run by PerfRegions(cmd=...)."""
+    region_enable()
+    try:
+        yield
+    finally:
+        region_disable(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Toggle perf counting from a workload run by rykit.perf_region.PerfRegions."
+    )
+    parser.add_argument("op", choices=["enable", "disable"])
+    parser.add_argument("name", nargs="?", default="region", help="region name (disable only)")
+    args = parser.parse_args()
+    if args.op == "enable":
+        region_enable()
+    else:
+        region_disable(args.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,20 @@
+import logging
+import re
 from rykit.cmd import run_command_read_stdout
-from rykit.cmd import run_command_read_stderr
-from typing import List, Dict 
+from rykit.cmd import arun_perf_read_stderr, run_command_read_stderr, run_perf_read_stderr
+from rykit.perf_parse import index_perf_stat, lookup_event
+from rykit.instrument import POSTPROCESS, span
+from rykit.perf_matrix import CounterMatrix
+from rykit.perf_catalog import validate_events
+from rykit.perf_syscall import BACKENDS, syscall_sample_events
+from rykit.topology import Topology, get_topology
+from rykit.affinity import Pin
+from typing import List, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --per-core unit: S<socket>[-D<die>]-C<core> (perf before 5.x prints no die)
+_PER_CORE_UNIT = re.compile(r"^S(\d+)(?:-D(\d+))?-C(\d+)$")
 
 def set_perf_event_paranoid(level: int):
     """
@@ -64,72 +78,154 @@ def interpret_umask(binval: str) -> str:
 
 
 
-def interpret_core_events(output: str, core_events: List[str]) -> Dict[str, int]:
+def interpret_core_events(output: str, core_events: List[str], bytes_as_lines: bool = True) -> Dict[str, int]:
     """
     Parse perf output for core events.
 
     Args:
         output (str): Raw stderr output from perf.
         core_events (List[str]): List of event names to extract.
+        bytes_as_lines (bool): Return events perf reports in Bytes as 64 byte
+                               cache line counts (the historical behaviour);
+                               False keeps perf's value.
 
     Returns:
         Dict[str,int]: Mapping of event name -> event counter value.
     """
-    lines = output.split("\n")
+    index = index_perf_stat(output)
     res: Dict[str, int] = {}
-    for line in lines:
+    with span(POSTPROCESS, events=len(core_events)):
         for event in core_events:
-            if event in line:
-                # remove name of event
-                valstr = line.split(event)[0]
-                valstr = valstr.strip()
-
-                # remove commas
-                valstr = valstr.replace(",", "")
-
-                if "Byte" in valstr:
-
-                    valstr = valstr.split("Byte")[0]
-
-                    # TODO this is debatable whether you want this,
-                    # Many events which are labeled byte
-                    # cast from cache line to byte (ie: *64)
-                    # so casting back (ie /64) is natural in most cases
-                    val = int(int(valstr) / 64)
-                else:
-                    val = int(valstr)
-                res[event] = val
+            lines = lookup_event(index, event)
+            if not lines or lines[-1].value is None:
+                continue
+            line = lines[-1]
+            res[event] = _core_value(line.value, line.unit, bytes_as_lines)
+    return res
+def _core_value(value, unit: str, bytes_as_lines: bool = True):
+    if bytes_as_lines and "Byte" in unit:
+        # TODO this is debatable whether you want this,
+        # Many events which are labeled byte
+        # cast from cache line to byte (ie: *64)
+        # so casting back (ie /64) is natural in most cases
+        return int(value / 64)
+    return value
+def interpret_per_core_events(output:str,events:List[str],socket:int) -> Dict[str,Dict[str,int]]:
+    """
+    Parse `perf stat --per-core -x ;` output for several events at once.
+
+    Args:
+        output (str): Raw stderr output from perf.
+        events (List[str]): List of event names to extract.
+        socket (int): Socket whose cores are returned.
+
+    Returns:
+        Dict[str,Dict[str,int]]: Mapping of event name -> core ID (as str) -> counter value.
+    """
+    index = index_perf_stat(output)
+    res: Dict[str, Dict[str, int]] = {}
+    with span(POSTPROCESS, events=len(events)):
+        for event in events:
+            data: Dict[str, int] = {}
+            for line in lookup_event(index, event):
+                if line.agg is None or line.value is None:
+                    continue
+                #[S0,D0,C0]
+                core_code = line.agg.split("-")
+                if int(core_code[0][1:]) != socket:
+                    continue
+                data[core_code[2][1:]] = line.value
+            res[event] = data
     return res
 def interpret_per_core_event(output:str,event:str,socket:int) -> Dict[str,int]:
-    data : Dict[int,Dict[str,int]] = {skt:{} for skt in range(2)}
-    for line in output.split("\n"):
-        if event not in line:
-            continue
-        fields : List[str] = [x for x in line.split(";") if x != ""]
-        #print(fields)
-        #[S0,D0,C0]
-        core_code = fields[0].split("-")
-        socket_num = int(core_code[0][1:])
-        core = core_code[2][1:]
-        ctr = int(fields[2])
-        data[socket_num][core] = ctr
-    #print(data[socket])
-    return data[socket]
+    return interpret_per_core_events(output,[event],socket)[event]
 def perf_sample_per_core_event(cmd:str,event:str,socket:int) -> Dict[str,int]:
-    perf_cmd = f"sudo perf stat --per-core -x \\; -a -e {event} {cmd}"
-    output = run_command_read_stderr(perf_cmd)
+    perf_args = ["stat","--per-core","-x",";","-a","-e",event]
+    output = run_perf_read_stderr(perf_args,cmd)
     return interpret_per_core_event(output,event,socket)
-def perf_sample_per_core_events(cmd:str,events:List[str],socket:int) -> Dict[str,Dict[str,int]]:
-    eventstr = " ".join([f"-e {event}" for event in events])
-    perf_cmd = f"sudo perf stat --per-core -x \\; -a {eventstr} {cmd}"
-    output = run_command_read_stderr(perf_cmd)
-    return {event:interpret_per_core_event(output,event,socket) for event in events}
-def perf_normalize_per_core_events(cmd:str,events:List[str],socket:int) -> Dict[str,Dict[str,float]]:
-    events += ["cycles"]
-    res = perf_sample_per_core_events(cmd,events,socket)
-    cycles = res["cycles"]
-    normalized_res = {event:{core:ctr/cycles[core] for core,ctr in percore.items()} for event,percore in res.items()}
-    return normalized_res
+def _per_core_args(events:List[str]) -> List[str]:
+    return ["stat","--per-core","-x",";","-a"] + [arg for event in events for arg in ("-e",event)]
+def perf_sample_per_core_events(cmd:str,events:List[str],socket:int,pin:Optional[Pin]=None) -> Dict[str,Dict[str,int]]:
+    output = run_perf_read_stderr(_per_core_args(events),cmd,pin=pin)
+    return interpret_per_core_events(output,events,socket)
+async def aperf_sample_per_core_events(cmd:str,events:List[str],socket:int,pin:Optional[Pin]=None,timeout:Optional[float]=None) -> Dict[str,Dict[str,int]]:
+    """
+    Async counterpart of perf_sample_per_core_events, see rykit.cmd.arun_perf_read_stderr for timeout.
+    """
+    output = await arun_perf_read_stderr(_per_core_args(events),cmd,pin=pin,timeout=timeout)
+    return interpret_per_core_events(output,events,socket)
+def interpret_per_core_matrix(output:str,events:List[str],topology:Optional[Topology]=None) -> CounterMatrix:
+    """
+    Parse `perf stat --per-core -x ;` output into an event x socket x core matrix.
+
+    Cores outside the topology's axes (offline cores, a topology read from
+    another sysfs root) are skipped with a warning.
+
+    Args:
+        output (str): Raw stderr output from perf.
+        events (List[str]): List of event names to extract.
+        topology (Optional[Topology]): Used to size the socket/core axes,
+                                       defaults to get_topology().
+
+    Returns:
+        CounterMatrix: Counter values, NaN for cores perf did not report.
+
+    Raises:
+        ValueError: If a core ID appears on two dies of one socket, which
+                    the socket x core axes cannot tell apart.
+    """
+    topo = get_topology() if topology is None else topology
+    cores = sorted({core for pkg in topo.packages for core in topo.core_ids(pkg)})
+    mat = CounterMatrix(events, topo.packages, cores)
+    sockets, core_set = set(topo.packages), set(cores)
+    index = index_perf_stat(output)
+    # (socket, core) -> die it was reported on
+    dies: Dict[Tuple[int,int],int] = {}
+    skipped = set()
+    with span(POSTPROCESS, events=len(events)):
+        for event in events:
+            for line in lookup_event(index, event):
+                if line.agg is None or line.value is None:
+                    continue
+                m = _PER_CORE_UNIT.match(line.agg)
+                if m is None:
+                    continue
+                socket, die, core = int(m.group(1)), int(m.group(2) or 0), int(m.group(3))
+                if dies.setdefault((socket, core), die) != die:
+                    raise ValueError(f"core {core} is reported on dies {dies[(socket, core)]} and {die} of socket {socket}, use interpret_per_core_events")
+                if socket not in sockets or core not in core_set:
+                    skipped.add(line.agg)
+                    continue
+                mat.set(event, socket, core, line.value)
+    if skipped:
+        logger.warning("skipped per-core counts of %s: not in the topology", ", ".join(sorted(skipped)))
+    return mat
+def perf_sample_per_core_matrix(cmd:str,events:List[str],pin:Optional[Pin]=None,sudo:bool=True) -> CounterMatrix:
+    """
+    Run perf per-core sampling on all sockets and return an array-backed result.
+
+    Args:
+        cmd (str): Command to run under perf.
+        events (List[str]): List of core event names.
+        pin (Optional[Pin]): CPU/memory binding for cmd (see linux_tools.native_pin_cpu).
+        sudo (bool): Whether to run command as sudo
+
+    Returns:
+        CounterMatrix: event x socket x core counter values.
+    """
+    output = run_perf_read_stderr(_per_core_args(events),cmd,sudo=sudo,pin=pin)
+    return interpret_per_core_matrix(output,events)
+async def aperf_sample_per_core_matrix(cmd:str,events:List[str],pin:Optional[Pin]=None,timeout:Optional[float]=None) -> CounterMatrix:
+    """
+    Async counterpart of perf_sample_per_core_matrix.
+    """
+    output = await arun_perf_read_stderr(_per_core_args(events),cmd,pin=pin,timeout=timeout)
+    return interpret_per_core_matrix(output,events)
+def perf_normalize_per_core_events(cmd:str,events:List[str],socket:int,pin:Optional[Pin]=None) -> Dict[str,Dict[str,float]]:
+    if "cycles" not in events:
+        events = events + ["cycles"]
+    res = perf_sample_per_core_matrix(cmd,events,pin=pin)
+    return res.normalize("cycles").as_dict(socket)
 
 
 
@@ -141,7 +237,7 @@ def add_zeroes_to_eventcode(eventcode: str, zeroct: int):
     raw_hex_str = eventcode.split("0x")[1]
     return "0x" + ("0" * zeroct) + raw_hex_str
 
-def perf_sample_core_events(cmd: str, core_events: List[str], sudo:bool=True) -> Dict[str, int]:
+def perf_sample_core_events(cmd: str, core_events: List[str], sudo:bool=True, pin:Optional[Pin]=None, validate:bool=True, backend:str="perf", bytes_as_lines:bool=True) -> Dict[str, int]:
     """
     Run perf sampling for core events.
 
@@ -149,20 +245,51 @@ def perf_sample_core_events(cmd: str, core_events: List[str], sudo:bool=True) ->
         cmd (str): Command to run under perf.
         core_events (List[str]): List of core event names.
         sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for cmd (see linux_tools.native_pin_cpu).
+        validate (bool): Check the events against the PMU catalog before running cmd.
+        backend (str): "perf" runs the perf binary, "syscall" opens the
+                       counters with perf_event_open in this process (no
+                       sudo, see rykit.perf_syscall).
+        bytes_as_lines (bool): See interpret_core_events.
 
     Returns:
         Dict[str,int]: Mapping of event name -> event counter value.
     """
+    if validate:
+        validate_events(core_events)
+
+    if backend == "syscall":
+        readings = syscall_sample_events(cmd, core_events, pin=pin)
+        return {e: _core_value(r.value, r.unit, bytes_as_lines) for e, r in readings.items()}
+    elif backend != "perf":
+        raise ValueError(f"backend must be one of {BACKENDS} (passed {backend})")
+
+    event_flags = [arg for e in core_events for arg in ("-e", e)]
+
+    perf_args = ["stat", "-x", ";"] + event_flags
+    output = run_perf_read_stderr(perf_args, cmd, sudo=sudo, pin=pin)
+    return interpret_core_events(output, core_events, bytes_as_lines)
+async def aperf_sample_core_events(cmd: str, core_events: List[str], sudo:bool=True, pin:Optional[Pin]=None, validate:bool=True, timeout:Optional[float]=None) -> Dict[str, int]:
+    """
+    Async counterpart of perf_sample_core_events.
+
+    Args:
+        timeout (Optional[float]): Seconds after which perf and cmd are
+                                   stopped and CommandTimeout is raised.
+
+    Raises:
+        CommandTimeout: If timeout elapsed; interpret_core_events(e.output, ...)
+                        recovers the counts gathered so far.
+    """
+    if validate:
+        validate_events(core_events)
 
-    event_flags = [f"-e {e}" for e in core_events]
-    event_flag_str = " ".join(event_flags)
+    event_flags = [arg for e in core_events for arg in ("-e", e)]
 
-    full_cmd = f"perf stat {event_flag_str} {cmd}"
-    if sudo:
-        full_cmd = "sudo " + full_cmd
-    output = run_command_read_stderr(full_cmd)
+    perf_args = ["stat", "-x", ";"] + event_flags
+    output = await arun_perf_read_stderr(perf_args, cmd, sudo=sudo, pin=pin, timeout=timeout)
     return interpret_core_events(output, core_events)
-def perf_sample_core_event(cmd: str, core_event: str, sudo:bool=True) -> int:
+def perf_sample_core_event(cmd: str, core_event: str, sudo:bool=True, pin:Optional[Pin]=None) -> int:
     """
     Run perf sampling for core event.
 
@@ -170,8 +297,9 @@ def perf_sample_core_event(cmd: str, core_event: str, sudo:bool=True) -> int:
         cmd (str): Command to run under perf.
         core_event (str):  core event name.
         sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for cmd.
 
     Returns:
         int: core event value 
     """
-    return perf_sample_core_events(cmd,[core_event],sudo=sudo)[core_event]
+    return perf_sample_core_events(cmd,[core_event],sudo=sudo,pin=pin)[core_event]
@@ -1,21 +1,222 @@
-from typing import Dict, List, Tuple
-from rykit.perf_sample import perf_sample_core_events,interpret_umask,get_perf_event_paranoid
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from rykit.affinity import Pin
+from rykit.cmd import arun_perf_read_stderr, run_perf_read_stderr
+from rykit.perf_parse import index_perf_stat, lookup_event
+from rykit.instrument import POSTPROCESS, span
+from rykit.perf_matrix import CounterMatrix
+from rykit.perf_catalog import validate_events
+from rykit.topology import Topology, get_topology
+from rykit.perf_sample import interpret_umask,get_perf_event_paranoid
+from rykit.perf_schedule import aperf_sample_scheduled, perf_sample_scheduled
+from rykit.perf_attach import AttachTarget, perf_attach_scheduled
+def create_amd_df_event(event: str, umask: str) -> str:
+    """
+    Create a perf event string for an AMD data fabric event.
+
+    Args:
+        event (str): Event code in hexadecimal.
+        umask (str): Umask in binary string form.
+
+    Returns:
+        str: Perf event string, e.g. "amd_df/event=0x7,umask=0x38/".
+    """
+    return f"amd_df/event={event},umask={interpret_umask(umask)}/"
+def create_amd_l3_event(event: str, umask: str) -> str:
+    """
+    Create a perf event string for an AMD L3 (CCX) event.
+
+    Args:
+        event (str): Event code in hexadecimal.
+        umask (str): Umask in binary string form.
+
+    Returns:
+        str: Perf event string, e.g. "amd_l3/event=0x4,umask=0xff/".
+    """
+    return f"amd_l3/event={event},umask={interpret_umask(umask)}/"
+class AmdUncoreResult(NamedTuple):
+    """
+    Per-instance AMD uncore counts from one `perf stat -a -A` run.
+
+    amd_l3 has one counter instance per L3 (CCX), amd_df one per socket;
+    perf reads each instance on one CPU of its cpumask, which is mapped
+    back to the instance through the sysfs topology.
+
+    Attributes:
+        counts (CounterMatrix): event x socket x domain counter values, the
+            domain axis holding L3 cache IDs (amd_l3) or package IDs (amd_df).
+            NaN for instances perf did not report.
+        domain_cpus (Dict[int,List[int]]): Domain ID -> CPUs sharing that
+            instance (the CPUs sharing the L3 for amd_l3).
+        reader_cpu (Dict[int,int]): Domain ID -> CPU perf reported the instance on.
+    """
+    counts: CounterMatrix
+    domain_cpus: Dict[int, List[int]]
+    reader_cpu: Dict[int, int]
+    def by_domain(self, event: str) -> Dict[str, int]:
+        """Return domain ID (as str) -> counter value of event, like the per-CHA dicts."""
+        res: Dict[str, int] = {}
+        for socket in self.counts.sockets:
+            for domain, value in self.counts.as_dict(socket)[event].items():
+                res[domain] = int(value)
+        return res
+def _l3_domain(topo: Topology) -> Tuple[Callable[[int], int], Dict[int, List[int]]]:
+    groups = topo.cache_groups("L3")
+    assert groups, "no L3 cache information in sysfs"
+    return (lambda cpu: topo.cache_id(cpu, "L3")), groups
+def _df_domain(topo: Topology) -> Tuple[Callable[[int], int], Dict[int, List[int]]]:
+    return topo.package_of, {pkg: topo.package_cpus(pkg) for pkg in topo.packages}
+def interpret_amd_uncore_instances(
+        output: str, events: List[str], pmu: str="amd_l3", topology: Optional[Topology]=None
+) -> AmdUncoreResult:
+    """
+    Parse `perf stat -a -A -x ;` output of amd_l3 or amd_df events into
+    per-instance counts.
+
+    Args:
+        output (str): Raw stderr output from perf.
+        events (List[str]): Perf event strings to extract.
+        pmu (str): "amd_l3" (domains are L3/CCX instances) or "amd_df" (sockets).
+        topology (Optional[Topology]): Defaults to get_topology().
+
+    Returns:
+        AmdUncoreResult: Counts per instance with its sharing CPUs.
+    """
+    topo = get_topology() if topology is None else topology
+    domain_of, groups = _l3_domain(topo) if pmu == "amd_l3" else _df_domain(topo)
+    mat = CounterMatrix(events, topo.packages, sorted(groups))
+    reader: Dict[int, int] = {}
+    index = index_perf_stat(output)
+    with span(POSTPROCESS, events=len(events)):
+        for event in events:
+            for line in lookup_event(index, event):
+                if line.agg is None or not line.agg.startswith("CPU") or line.value is None:
+                    continue
+                cpu = int(line.agg[3:])
+                domain = domain_of(cpu)
+                # an instance is a single counter: if perf reports it on several
+                # CPUs of its domain they all read the same value, keep the first
+                if reader.setdefault(domain, cpu) != cpu:
+                    continue
+                mat.set(event, topo.package_of(cpu), domain, line.value)
+    return AmdUncoreResult(mat, {d: groups[d] for d in sorted(groups)}, reader)
+def _instance_args(events: List[str]) -> List[str]:
+    args = ["stat", "-a", "-A", "-x", ";"]
+    for e in events:
+        args += ["-e", e]
+    return args + ["--"]
+def _instance_events(unc_events: List[Tuple[str, str]], pmu: str, sudo: bool, validate: bool) -> List[str]:
+    assert pmu in ("amd_l3", "amd_df"), f"unsupported pmu {pmu}"
+    create = create_amd_l3_event if pmu == "amd_l3" else create_amd_df_event
+    events = _amd_df_events(unc_events, sudo, create)
+    if validate:
+        validate_events(events)
+    return events
+def perf_sample_amd_uncore_instances(
+        cmd: str, unc_events: List[Tuple[str, str]], pmu: str="amd_l3", sudo: bool=True,
+        pin: Optional[Pin]=None, validate: bool=True
+) -> AmdUncoreResult:
+    """
+    Count amd_l3 (per CCX) or amd_df (per socket) events per counter instance
+    in a single perf run.
+
+    Events beyond the per-instance counter limit are multiplexed by perf
+    rather than split into passes, so all instances are read over the same
+    run; check pct_enabled if that matters.
+
+    Args:
+        cmd (str): Command to run under perf.
+        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        pmu (str): "amd_l3" or "amd_df".
+        sudo (bool): Whether to run command as sudo
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        validate (bool): Check the events against the PMUs in sysfs first.
+
+    Returns:
+        AmdUncoreResult: event x socket x CCX (or socket) matrix, CCX -> CPUs
+            sharing its L3, and the CPU each instance was read on.
+
+    Example:
+        res = perf_sample_amd_uncore_instances("./bench", [("0x4", "11111111")])
+        res.by_domain(res.counts.events[0])  # {"0": ..., "1": ...} per L3
+    """
+    events = _instance_events(unc_events, pmu, sudo, validate)
+    output = run_perf_read_stderr(_instance_args(events), cmd, sudo=sudo, pin=pin)
+    return interpret_amd_uncore_instances(output, events, pmu)
+async def aperf_sample_amd_uncore_instances(
+        cmd: str, unc_events: List[Tuple[str, str]], pmu: str="amd_l3", sudo: bool=True,
+        pin: Optional[Pin]=None, validate: bool=True, timeout: Optional[float]=None
+) -> AmdUncoreResult:
+    """
+    Async counterpart of perf_sample_amd_uncore_instances.
+
+    Args:
+        timeout (Optional[float]): Seconds allowed, see rykit.cmd.arun_perf_read_stderr.
+    """
+    events = _instance_events(unc_events, pmu, sudo, validate)
+    output = await arun_perf_read_stderr(_instance_args(events), cmd, sudo=sudo, pin=pin, timeout=timeout)
+    return interpret_amd_uncore_instances(output, events, pmu)
 def perf_sample_amd_uncore_event_many(
-        cmd: str, unc_events: List[Tuple[str, str]], sudo: bool=True
+        cmd: str, unc_events: List[Tuple[str, str]], sudo: bool=True, mode: str="sequential",
+        pin: Optional[Pin]=None, backend: str="perf"
 ) -> Dict[str, int]:
     """
     Run perf sampling for multiple uncore events.
 
+    Events beyond the data fabric counter limit are split into passes
+    (or multiplexed), see rykit.perf_schedule.perf_sample_scheduled.
+
     Args:
         cmd (str): Command to run under perf.
         unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        sudo (bool): Whether to run command as sudo
+        mode (str): "sequential" or "multiplex".
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        backend (str): "perf" or "syscall" (perf_event_open, needs perf event paranoid <= 0).
 
     Returns:
         Dict[str,Dict[str,int]]: Mapping of event code -> event counter value.
     """
 
+    events = _amd_df_events(unc_events,sudo and backend != "syscall")
+    res = perf_sample_scheduled(cmd,events,mode=mode,sudo=sudo,pin=pin,backend=backend)
+    return {event:int(ctr) for event,ctr in res.counts.items()}
+async def aperf_sample_amd_uncore_event_many(
+        cmd: str, unc_events: List[Tuple[str, str]], sudo: bool=True, mode: str="sequential",
+        pin: Optional[Pin]=None, timeout: Optional[float]=None
+) -> Dict[str, int]:
+    """
+    Async counterpart of perf_sample_amd_uncore_event_many.
+
+    Args:
+        timeout (Optional[float]): Seconds allowed per pass, see rykit.cmd.arun_perf_read_stderr.
+    """
+    events = _amd_df_events(unc_events,sudo)
+    res = await aperf_sample_scheduled(cmd,events,mode=mode,sudo=sudo,pin=pin,timeout=timeout)
+    return {event:int(ctr) for event,ctr in res.counts.items()}
+def perf_attach_amd_uncore_event_many(
+        unc_events: List[Tuple[str, str]], duration: float, sudo: bool=True, mode: str="sequential",
+        cpus: Optional[List[int]]=None
+) -> Dict[str, int]:
+    """
+    Count data fabric events system-wide for duration seconds, without
+    launching anything (see rykit.perf_attach).
+
+    Args:
+        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        duration (float): Seconds per window (per pass in "sequential" mode).
+        sudo (bool): Whether to run perf as sudo
+        mode (str): "sequential" or "multiplex".
+        cpus (Optional[List[int]]): CPUs to count on, None for all.
+
+    Returns:
+        Dict[str,int]: Mapping of event string -> event counter value.
+    """
+    events = _amd_df_events(unc_events,sudo)
+    res = perf_attach_scheduled(AttachTarget(system_wide=True,cpus=cpus),events,duration,mode=mode,sudo=sudo)
+    return {event:int(ctr) for event,ctr in res.counts.items()}
+def _amd_df_events(
+        unc_events: List[Tuple[str, str]], sudo: bool, create: Callable[[str, str], str]=create_amd_df_event
+) -> List[str]:
     paranoid = get_perf_event_paranoid()
     assert sudo or (paranoid <= 0), f"amd uncore sampling requires sudo or perf event paranoid of <= 0 (current is {paranoid})"
-
-    events = [f"amd_df/event={event},umask={interpret_umask(umask)}/" for event,umask in unc_events]
-    return perf_sample_core_events(cmd,events,sudo=sudo)
+    return [create(event,umask) for event,umask in unc_events]
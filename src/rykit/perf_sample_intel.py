@@ -1,7 +1,13 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from rykit.affinity import Pin
 from rykit.perf_sample import interpret_umask, add_zeroes_to_eventcode
+from rykit.perf_parse import CHA_EVENT, index_perf_stat
+from rykit.instrument import POSTPROCESS, span
+from rykit.perf_schedule import aperf_sample_scheduled, perf_sample_scheduled
+from rykit.perf_interval import IntervalRecord, perf_stream_interval
+from rykit.perf_attach import AttachTarget, perf_attach_scheduled
+from rykit.perf_steady import SteadyStateResult, perf_sample_until_steady
 from rykit.intel_tools import get_cha_count
-from rykit.cmd import run_command_read_stderr
 
 
 
@@ -21,44 +27,23 @@ def create_unc_cha_event(chanum: int, event: str, hexmask: str) -> str:
     return f"uncore_cha_{chanum}/event={event},umask={hexmask}/"
 
 
-def create_unc_cha_events(event: str, hexmask: str) -> List[str]:
+def create_unc_cha_events(event: str, hexmask: str, sysfs_root: str = "/sys") -> List[str]:
     """
     Create perf event strings for all CHAs on the system.
 
     Args:
         event (str): Event code in hexadecimal.
         hexmask (str): Umask in hexadecimal.
+        sysfs_root (str): Root of the sysfs tree the CHAs are counted in.
 
     Returns:
         List[str]: Perf event strings for each CHA.
     """
 
-    num_chas = get_cha_count()
+    num_chas = get_cha_count(sysfs_root)
     return [create_unc_cha_event(chanum, event, hexmask) for chanum in range(num_chas)]
 
 
-def build_perf_sample_uncore_cmd(
-    program_cmd: str, unc_events: List[Tuple[str, str]]
-) -> str:
-    """
-    Build a perf command that samples multiple uncore events.
-
-    Args:
-        program_cmd (str): Command to run under perf.
-        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
-
-    Returns:
-        str: The full perf command string.
-    """
-    events: List[str] = []
-    for event, mask in unc_events:
-        hexmask = interpret_umask(mask)
-        events += create_unc_cha_events(event, hexmask)
-    event_args: List[str] = [f"-e {e}" for e in events]
-    event_arg_str = " ".join(event_args)
-    return f"sudo perf stat -a {event_arg_str} -- {program_cmd}"
-
-
 def interpret_uncore_event(output: str, event: str) -> Dict[str, int]:
     """
     Parse perf output for a single uncore event across CHAs.
@@ -70,30 +55,7 @@ def interpret_uncore_event(output: str, event: str) -> Dict[str, int]:
     Returns:
         Dict[str,int]: Mapping of CHA index (as str) -> event counter value.
     """
-    infix = "uncore_cha_"
-    number_suffix = f"/event={event}"
-    result: Dict[str, int] = {}
-    for line in output.split("\n"):
-        # check to ensure this is a cha line
-        if infix not in line or number_suffix not in line:
-            continue
-        # Example:
-        # ex:     8,795      uncore_cha_1/event=0xb3,umask=0x8/
-
-        # remove name of event
-        # ex ->:      8,795
-        count_str_with_commas = line.split(infix)[0]
-
-        # remove ,
-        # ex ->:      8795
-        count_str = count_str_with_commas.replace(",", "")
-
-        count = int(count_str)
-
-        # chanum comes right after infix
-        chanum = line.split(infix)[1].split(number_suffix)[0]
-        result[chanum] = count
-    return result
+    return interpret_uncore_event_many(output, [event])[event]
 
 
 def interpret_uncore_event_many(
@@ -110,25 +72,124 @@ def interpret_uncore_event_many(
         Dict[str,Dict[str,int]]: Mapping of event code ->
              CHA index (as str) -> event counter value.
     """
-    return {e: interpret_uncore_event(output, e) for e in events}
+    counts: Dict[str, Union[int, float]] = {}
+    for name, lines in index_perf_stat(output).items():
+        if lines[-1].value is not None:
+            counts[name] = lines[-1].value
+    return interpret_uncore_counts(counts, events)
+
+
+def interpret_uncore_counts(
+    counts: Dict[str, Union[int, float]], events: List[str]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Regroup counts keyed by full CHA event string into per-CHA dicts.
+
+    Args:
+        counts (Dict[str,Union[int,float]]): Perf event string -> counter value,
+            e.g. ScheduledResult.counts.
+        events (List[str]): List of event codes in hexadecimal.
+
+    Returns:
+        Dict[str,Dict[str,int]]: Mapping of event code ->
+             CHA index (as str) -> event counter value.
+    """
+    result: Dict[str, Dict[str, int]] = {e: {} for e in events}
+    with span(POSTPROCESS, events=len(counts)):
+        # one regex match per distinct event string, looked up by exact code
+        for name, count in counts.items():
+            m = CHA_EVENT.match(name)
+            if m is None or m.group(2) not in result:
+                continue
+            result[m.group(2)][m.group(1)] = int(count)
+    return result
 
 
 def perf_sample_uncore_event_many(
-    program_cmd: str, unc_events: List[Tuple[str, str]]
+    program_cmd: str,
+    unc_events: List[Tuple[str, str]],
+    mode: str = "sequential",
+    pin: Optional[Pin] = None,
+    backend: str = "perf",
 ) -> Dict[str, Dict[str, int]]:
     """
     Run perf sampling for multiple uncore events.
 
+    Any number of events may be passed: when they exceed the CHA counter
+    limit they are split into passes (or multiplexed), see
+    rykit.perf_schedule.perf_sample_scheduled.
+
     Args:
         program_cmd (str): Command to run under perf.
         unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        mode (str): "sequential" or "multiplex".
+        pin (Optional[Pin]): CPU/memory binding for program_cmd.
+        backend (str): "perf" or "syscall" (perf_event_open on each CHA PMU's cpumask).
 
     Returns:
         Dict[str,Dict[str,int]]: Mapping of event code ->
             CHA index (as str) -> event counter value.
     """
+    events, cha_events = _uncore_cha_events(program_cmd, unc_events)
+    res = perf_sample_scheduled(
+        program_cmd, cha_events, mode=mode, system_wide=True, pin=pin, backend=backend
+    )
+
+    return interpret_uncore_counts(res.counts, events)
+
+
+async def aperf_sample_uncore_event_many(
+    program_cmd: str,
+    unc_events: List[Tuple[str, str]],
+    mode: str = "sequential",
+    pin: Optional[Pin] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Async counterpart of perf_sample_uncore_event_many.
+
+    Args:
+        timeout (Optional[float]): Seconds allowed per pass, see
+                                   rykit.cmd.arun_perf_read_stderr.
+    """
+    events, cha_events = _uncore_cha_events(program_cmd, unc_events)
+    res = await aperf_sample_scheduled(
+        program_cmd, cha_events, mode=mode, system_wide=True, pin=pin, timeout=timeout
+    )
+    return interpret_uncore_counts(res.counts, events)
+
+
+def perf_attach_uncore_event_many(
+    unc_events: List[Tuple[str, str]],
+    duration: float,
+    mode: str = "sequential",
+    cpus: Optional[List[int]] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Count uncore events system-wide for duration seconds, without launching
+    anything (see rykit.perf_attach).
+
+    Args:
+        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        duration (float): Seconds per window (per pass in "sequential" mode).
+        mode (str): "sequential" or "multiplex".
+        cpus (Optional[List[int]]): CPUs to count on, None for all.
+
+    Returns:
+        Dict[str,Dict[str,int]]: Mapping of event code ->
+            CHA index (as str) -> event counter value.
+    """
+    events, cha_events = _uncore_cha_events("", unc_events)
+    res = perf_attach_scheduled(
+        AttachTarget(system_wide=True, cpus=cpus), cha_events, duration, mode=mode
+    )
+    return interpret_uncore_counts(res.counts, events)
+
+
+def _uncore_cha_events(
+    program_cmd: str, unc_events: List[Tuple[str, str]]
+) -> Tuple[List[str], List[str]]:
     assert isinstance(program_cmd, str), "cmd must be passed as string (passed non-str)"
-    assert len(unc_events) <= 4, "can only run upto 4 uncore events at once"
 
     events = [e for e, _ in unc_events]
     if len(events) != len(set(events)):
@@ -140,13 +201,60 @@ def perf_sample_uncore_event_many(
         assert isinstance(mask, str), "mask must be a binary string (passed non-str)"
         assert set(mask) <= {"0", "1"}, f"mask must be a binary string (passed {mask})"
 
-    cmd = build_perf_sample_uncore_cmd(program_cmd, unc_events)
+    cha_events: List[str] = []
+    for event, mask in unc_events:
+        cha_events += create_unc_cha_events(event, interpret_umask(mask))
+    return events, cha_events
+
 
-    output = run_command_read_stderr(cmd)
+def perf_stream_uncore_event_many(
+    program_cmd: str,
+    unc_events: List[Tuple[str, str]],
+    interval_ms: int = 1000,
+    pin: Optional[Pin] = None,
+) -> Iterator[IntervalRecord]:
+    """
+    Stream per-interval, per-CHA counts for multiple uncore events.
+
+    Args:
+        program_cmd (str): Command to run under perf.
+        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        interval_ms (int): Print interval in milliseconds.
+        pin (Optional[Pin]): CPU/memory binding for program_cmd.
+
+    Yields:
+        IntervalRecord: Records with event set to the event code and unit
+            set to the CHA index (as str).
+    """
+    _, cha_events = _uncore_cha_events(program_cmd, unc_events)
+    return perf_stream_interval(program_cmd, cha_events, interval_ms, system_wide=True, pin=pin)
 
-    events = [unce[0] for unce in unc_events]
 
-    return interpret_uncore_event_many(output, events)
+def perf_uncore_event_many_until_steady(
+    program_cmd: str,
+    unc_events: List[Tuple[str, str]],
+    interval_ms: int = 1000,
+    **kwargs,
+) -> SteadyStateResult:
+    """
+    Run program_cmd until the summed CHA rates of every event are steady,
+    then stop it (see rykit.perf_steady.perf_sample_until_steady for the
+    window/rel_tol/min_warmup/max_duration keyword arguments).
+
+    Args:
+        program_cmd (str): Command to run under perf, e.g. an open-ended load generator.
+        unc_events (List[Tuple[str,str]]): List of (event, binary umask) pairs.
+        interval_ms (int): Interval length in milliseconds.
+
+    Returns:
+        SteadyStateResult: rates keyed by event code, unit_rates by event
+            code -> CHA index (as str).
+    """
+    events, cha_events = _uncore_cha_events(program_cmd, unc_events)
+    kwargs.setdefault("watch", events)
+    return perf_sample_until_steady(
+        program_cmd, cha_events, interval_ms=interval_ms, system_wide=True, **kwargs
+    )
 
 
 def perf_sample_uncore_event(program_cmd: str, event: str, mask: str) -> Dict[str, int]:
@@ -168,7 +276,11 @@ def perf_sample_uncore_event(program_cmd: str, event: str, mask: str) -> Dict[st
 
 
 def perf_sample_uncore_event_many_named_masks(
-    cmd: str, eventcode: str, masks: Dict[str, str]
+    cmd: str,
+    eventcode: str,
+    masks: Dict[str, str],
+    mode: str = "sequential",
+    pin: Optional[Pin] = None,
 ) -> Dict[str, Dict[str, int]]:
     # create a list of unique eventcodes for each mask by adding zeroes to RHS (ie 0xF, 0x0F, 0x00F, ...) so that we have U  UID for event info from perf
     name_to_code: dict[str, str] = {
@@ -182,7 +294,7 @@ def perf_sample_uncore_event_many_named_masks(
     ]
 
     res_by_event_code: Dict[str, Dict[str, int]] = perf_sample_uncore_event_many(
-        cmd, uncore_events
+        cmd, uncore_events, mode=mode, pin=pin
     )
     # convert keys from eventcode to eventname
     res_by_event_name: Dict[str, Dict[str, int]] = {
@@ -0,0 +1,317 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Union
+from rykit.affinity import Pin
+from rykit.cmd import arun_perf_read_stderr, run_perf_read_stderr
+from rykit.perf_parse import index_perf_stat
+from rykit.instrument import POSTPROCESS, span
+from rykit.perf_catalog import validate_events
+from rykit.perf_syscall import BACKENDS, CounterReading, syscall_sample_events
+
+# Programmable counters available per PMU instance. Fixed counters are not
+# counted so these are safe lower bounds (Intel core loses half of its 8
+# general purpose counters to the sibling hyperthread).
+DEFAULT_COUNTER_LIMITS: Dict[str, int] = {
+    "cpu": 4,
+    "uncore_cha": 4,
+    "amd_df": 4,
+    "amd_l3": 6,
+}
+
+# Software events are not backed by hardware counters and never need a pass.
+SOFTWARE_EVENTS = {
+    "task-clock",
+    "cpu-clock",
+    "page-faults",
+    "faults",
+    "minor-faults",
+    "major-faults",
+    "context-switches",
+    "cs",
+    "cpu-migrations",
+    "migrations",
+    "alignment-faults",
+    "emulation-faults",
+    "duration_time",
+}
+
+_PMU_INSTANCE_SUFFIX = re.compile(r"_\d+$")
+
+
+class EventMeta(NamedTuple):
+    """
+    Per-event bookkeeping reported by perf alongside a counter value.
+
+    Attributes:
+        run_time (int): Nanoseconds the event was actually counting.
+        pct_enabled (float): Percentage of enabled time the event was running
+                             (100.0 unless it was multiplexed).
+        pass_index (int): Which workload run produced the value.
+    """
+
+    run_time: int
+    pct_enabled: float
+    pass_index: int
+
+
+class ScheduledResult(NamedTuple):
+    """
+    Merged result of running an event list as one or more perf passes.
+
+    Attributes:
+        counts (Dict[str,Union[int,float]]): Perf event string -> counter value.
+            Multiplexed values are already scaled by perf.
+        meta (Dict[str,EventMeta]): Perf event string -> run/enabled metadata.
+        passes (List[List[str]]): The event groups that were run.
+    """
+
+    counts: Dict[str, Union[int, float]]
+    meta: Dict[str, EventMeta]
+    passes: List[List[str]]
+
+
+def pmu_of(event: str) -> str:
+    """
+    Return the PMU instance an event string is counted on.
+
+    Args:
+        event (str): Perf event string, e.g. "cycles" or "uncore_cha_3/event=0xb3,umask=0x8/".
+
+    Returns:
+        str: PMU instance name ("cpu", "software", "uncore_cha_3", "amd_df", ...).
+    """
+    if event.split(":")[0] in SOFTWARE_EVENTS:
+        return "software"
+    if "/" not in event:
+        return "cpu"
+    return event.split("/")[0]
+
+
+def counter_limit(pmu: str, limits: Optional[Dict[str, int]] = None) -> Optional[int]:
+    """
+    Return the number of counters of a PMU instance, or None if unlimited.
+
+    Instance suffixes are ignored so "uncore_cha_12" uses the "uncore_cha" limit.
+    """
+    if pmu == "software":
+        return None
+    limits = DEFAULT_COUNTER_LIMITS if limits is None else limits
+    if pmu in limits:
+        return limits[pmu]
+    family = _PMU_INSTANCE_SUFFIX.sub("", pmu)
+    if family in limits:
+        return limits[family]
+    return limits["cpu"] if "cpu" in limits else None
+
+
+def schedule_events(
+    events: List[str], limits: Optional[Dict[str, int]] = None
+) -> List[List[str]]:
+    """
+    Pack events into the fewest groups that fit every PMU's counter limit.
+
+    Each PMU instance's events are cut into chunks of its limit and chunk i
+    of every PMU goes into group i, so the number of groups is the maximum
+    over PMUs of ceil(events / limit), which is optimal. Per-CHA expansions of
+    the same (event, umask) land in the same group since every CHA sees the
+    same ordering.
+
+    Args:
+        events (List[str]): Perf event strings, duplicates are ignored.
+        limits (Optional[Dict[str,int]]): Counters per PMU family, defaults to
+                                          DEFAULT_COUNTER_LIMITS.
+
+    Returns:
+        List[List[str]]: Groups of events, each runnable in one perf pass.
+    """
+    by_pmu: Dict[str, List[str]] = {}
+    unlimited: List[str] = []
+    seen = set()
+    for event in events:
+        if event in seen:
+            continue
+        seen.add(event)
+        pmu = pmu_of(event)
+        if counter_limit(pmu, limits) is None:
+            unlimited.append(event)
+        else:
+            by_pmu.setdefault(pmu, []).append(event)
+
+    groups: List[List[str]] = []
+    for pmu, pmu_events in by_pmu.items():
+        limit = counter_limit(pmu, limits)
+        assert limit is not None and limit > 0, f"counter limit for {pmu} must be positive"
+        for i in range(0, len(pmu_events), limit):
+            idx = i // limit
+            if idx == len(groups):
+                groups.append([])
+            groups[idx] += pmu_events[i : i + limit]
+
+    if len(groups) == 0:
+        groups.append([])
+    # software events ride along in the first pass
+    groups[0] = unlimited + groups[0]
+    return groups
+
+
+def interpret_csv_events(output: str, pass_index: int = 0) -> ScheduledResult:
+    """
+    Parse `perf stat -x ;` output into counts and metadata keyed by event string.
+
+    Lines for events perf could not count ("<not counted>", "<not supported>")
+    are skipped.
+    """
+    counts: Dict[str, Union[int, float]] = {}
+    meta: Dict[str, EventMeta] = {}
+    index = index_perf_stat(output)
+    with span(POSTPROCESS, events=len(index)):
+        for event, lines in index.items():
+            line = lines[-1]
+            if line.value is None:
+                continue
+            counts[event] = line.value
+            meta[event] = EventMeta(
+                run_time=line.run_time,
+                pct_enabled=line.pct_enabled,
+                pass_index=pass_index,
+            )
+    return ScheduledResult(counts=counts, meta=meta, passes=[])
+
+
+def readings_to_result(readings: Dict[str, CounterReading], pass_index: int = 0) -> ScheduledResult:
+    """
+    Convert perf_event_open readings to the result interpret_csv_events gives.
+    """
+    counts: Dict[str, Union[int, float]] = {}
+    meta: Dict[str, EventMeta] = {}
+    for event, r in readings.items():
+        counts[event] = r.value
+        meta[event] = EventMeta(
+            run_time=r.time_running,
+            pct_enabled=100.0 * r.time_running / r.time_enabled if r.time_enabled else 100.0,
+            pass_index=pass_index,
+        )
+    return ScheduledResult(counts=counts, meta=meta, passes=[])
+
+
+def build_perf_stat_args(events: List[str], system_wide: bool = False) -> List[str]:
+    """
+    Build `perf stat -x ;` arguments counting events over a command.
+    """
+    args = ["stat", "-x", ";"]
+    if system_wide:
+        args.append("-a")
+    for e in events:
+        args += ["-e", e]
+    return args + ["--"]
+
+
+def perf_sample_scheduled(
+    cmd: str,
+    events: List[str],
+    mode: str = "sequential",
+    system_wide: bool = False,
+    sudo: bool = True,
+    limits: Optional[Dict[str, int]] = None,
+    pin: Optional[Pin] = None,
+    validate: bool = True,
+    backend: str = "perf",
+) -> ScheduledResult:
+    """
+    Count any number of core/uncore events over cmd, splitting them across
+    passes or multiplexing as needed.
+
+    Args:
+        cmd (str): Command to run under perf.
+        events (List[str]): Perf event strings (core, uncore_cha_N/..., amd_df/..., ...).
+        mode (str): "sequential" runs the workload once per scheduled group,
+                    "multiplex" runs it once with all events and lets perf
+                    time-share counters and scale the results.
+        system_wide (bool): Count on all CPUs (-a), required for uncore events.
+        sudo (bool): Whether to run command as sudo.
+        limits (Optional[Dict[str,int]]): Counters per PMU family.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        validate (bool): Check the events against the PMU catalog before
+                         launching anything (see rykit.perf_catalog).
+        backend (str): "perf" runs the perf binary, "syscall" opens the
+                       counters with perf_event_open (sudo is ignored, see
+                       rykit.perf_syscall).
+
+    Returns:
+        ScheduledResult: Merged counts and per-event run/enabled metadata.
+
+    Raises:
+        ValueError: If mode is not "sequential" or "multiplex", backend is
+                    unknown, or an event is invalid.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS} (passed {backend})")
+    passes = plan_passes(events, mode, limits, validate)
+    counts: Dict[str, Union[int, float]] = {}
+    meta: Dict[str, EventMeta] = {}
+    for pass_index, group in enumerate(passes):
+        if backend == "syscall":
+            readings = syscall_sample_events(cmd, group, system_wide=system_wide, pin=pin)
+            res = readings_to_result(readings, pass_index)
+        else:
+            output = run_perf_read_stderr(
+                build_perf_stat_args(group, system_wide=system_wide), cmd, sudo=sudo, pin=pin
+            )
+            res = interpret_csv_events(output, pass_index)
+        counts.update(res.counts)
+        meta.update(res.meta)
+    return ScheduledResult(counts=counts, meta=meta, passes=passes)
+
+
+async def aperf_sample_scheduled(
+    cmd: str,
+    events: List[str],
+    mode: str = "sequential",
+    system_wide: bool = False,
+    sudo: bool = True,
+    limits: Optional[Dict[str, int]] = None,
+    pin: Optional[Pin] = None,
+    validate: bool = True,
+    timeout: Optional[float] = None,
+) -> ScheduledResult:
+    """
+    Async counterpart of perf_sample_scheduled.
+
+    Args:
+        timeout (Optional[float]): Seconds allowed per pass, see
+                                   rykit.cmd.arun_perf_read_stderr.
+
+    Raises:
+        CommandTimeout: If a pass runs past timeout.
+    """
+    passes = plan_passes(events, mode, limits, validate)
+    counts: Dict[str, Union[int, float]] = {}
+    meta: Dict[str, EventMeta] = {}
+    for pass_index, group in enumerate(passes):
+        output = await arun_perf_read_stderr(
+            build_perf_stat_args(group, system_wide=system_wide), cmd, sudo=sudo, pin=pin,
+            timeout=timeout,
+        )
+        res = interpret_csv_events(output, pass_index)
+        counts.update(res.counts)
+        meta.update(res.meta)
+    return ScheduledResult(counts=counts, meta=meta, passes=passes)
+
+
+def plan_passes(
+    events: List[str], mode: str = "sequential", limits: Optional[Dict[str, int]] = None,
+    validate: bool = True,
+) -> List[List[str]]:
+    """
+    Return the event groups perf_sample_scheduled runs, one per pass.
+
+    Raises:
+        ValueError: If mode is not "sequential" or "multiplex", or an event
+                    is invalid.
+    """
+    if validate:
+        validate_events(events)
+    if mode == "sequential":
+        return schedule_events(events, limits)
+    if mode == "multiplex":
+        return [list(dict.fromkeys(events))]
+    raise ValueError(f"mode must be 'sequential' or 'multiplex' (passed {mode})")
@@ -0,0 +1,187 @@
+import math
+import statistics
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from rykit.affinity import Pin
+from rykit.perf_sample import perf_sample_core_events, perf_sample_per_core_events
+from rykit.perf_sample_intel import perf_sample_uncore_event_many
+
+
+class EventStats(NamedTuple):
+    """
+    Summary of repeated measurements of one counter.
+
+    Attributes:
+        mean (float): Sample mean.
+        stddev (float): Sample standard deviation (0 for a single run).
+        ci_low (float): Lower bound of the confidence interval of the mean.
+        ci_high (float): Upper bound of the confidence interval of the mean.
+        rel_ci (float): CI half width divided by |mean| (inf if the mean is 0
+                        and the samples vary).
+        samples (List[float]): Raw per-run values.
+    """
+
+    mean: float
+    stddev: float
+    ci_low: float
+    ci_high: float
+    rel_ci: float
+    samples: List[float]
+
+
+def t_critical(confidence: float, df: int) -> float:
+    """
+    Two-sided Student t critical value.
+
+    Exact for df 1 and 2, Hill's (1970) expansion of the normal quantile
+    otherwise (error well under 1% for df >= 3).
+
+    Args:
+        confidence (float): Confidence level, e.g. 0.95.
+        df (int): Degrees of freedom (runs - 1).
+    """
+    assert 0 < confidence < 1, f"confidence must be in (0,1) (passed {confidence})"
+    assert df >= 1, "need at least two samples for a confidence interval"
+    p = 1 - (1 - confidence) / 2
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) * math.sqrt(2 / (4 * p * (1 - p)))
+    z = statistics.NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z ** 3 + z) / (4 * df)
+        + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+        + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+        + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4)
+    )
+
+
+def summarize(samples: List[float], confidence: float = 0.95) -> EventStats:
+    """
+    Compute mean, stddev and a t-based confidence interval for samples.
+    """
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return EventStats(mean, 0.0, -math.inf, math.inf, math.inf, list(samples))
+    stddev = statistics.stdev(samples, mean)
+    half = t_critical(confidence, len(samples) - 1) * stddev / math.sqrt(len(samples))
+    if half == 0:
+        rel = 0.0
+    elif mean == 0:
+        rel = math.inf
+    else:
+        rel = half / abs(mean)
+    return EventStats(mean, stddev, mean - half, mean + half, rel, list(samples))
+
+
+def _flatten(res: Any, prefix: Tuple = ()) -> Dict[Tuple, float]:
+    if hasattr(res, "to_dict"):
+        res = res.to_dict()
+    if isinstance(res, dict):
+        flat: Dict[Tuple, float] = {}
+        for k, v in res.items():
+            flat.update(_flatten(v, prefix + (k,)))
+        return flat
+    return {prefix: float(res)}
+
+
+def _unflatten(flat: Dict[Tuple, EventStats]) -> Union[EventStats, Dict]:
+    if () in flat:
+        return flat[()]
+    root: Dict = {}
+    for path, stats in flat.items():
+        node = root
+        for k in path[:-1]:
+            node = node.setdefault(k, {})
+        node[path[-1]] = stats
+    return root
+
+
+def repeat_until_confident(
+    sample: Callable[[], Any],
+    target_rel_ci: float = 0.02,
+    confidence: float = 0.95,
+    min_runs: int = 3,
+    max_runs: int = 30,
+    time_budget: Optional[float] = None,
+) -> Union[EventStats, Dict]:
+    """
+    Re-run a measurement until every counter's confidence interval is tight.
+
+    Runs stop as soon as each counter's CI half width is within
+    target_rel_ci of its mean, or when max_runs or time_budget is reached.
+    Counters missing from some runs are summarized over the runs that have them.
+
+    Args:
+        sample (Callable[[],Any]): Performs one run, returning a number or a
+            (nested) dict of numbers, e.g. lambda: perf_sample_core_events(...).
+            Objects with a to_dict() method (CounterMatrix) are accepted.
+        target_rel_ci (float): Relative CI half width to reach, e.g. 0.02 for +-2%.
+        confidence (float): Confidence level of the interval.
+        min_runs (int): Runs performed before stopping is considered (>= 2).
+        max_runs (int): Hard cap on runs.
+        time_budget (Optional[float]): Seconds after which no new run is started.
+
+    Returns:
+        Union[EventStats,Dict]: The same nesting as sample()'s result with
+            EventStats leaves.
+    """
+    assert 2 <= min_runs <= max_runs, "need 2 <= min_runs <= max_runs"
+    start = time.monotonic()
+    samples: Dict[Tuple, List[float]] = {}
+    runs = 0
+    while runs < max_runs:
+        for key, value in _flatten(sample()).items():
+            samples.setdefault(key, []).append(value)
+        runs += 1
+        if runs >= min_runs:
+            stats = {k: summarize(v, confidence) for k, v in samples.items()}
+            if all(s.rel_ci <= target_rel_ci for s in stats.values()):
+                break
+        if time_budget is not None and time.monotonic() - start >= time_budget:
+            break
+    return _unflatten({k: summarize(v, confidence) for k, v in samples.items()})
+
+
+def perf_repeat_core_events(
+    cmd: str, core_events: List[str], sudo: bool = True, pin: Optional[Pin] = None, **kwargs
+) -> Dict[str, EventStats]:
+    """
+    perf_sample_core_events repeated until confident, see repeat_until_confident
+    for the stopping keyword arguments.
+
+    Returns:
+        Dict[str,EventStats]: Mapping of event name -> statistics.
+    """
+    return repeat_until_confident(  # type: ignore
+        lambda: perf_sample_core_events(cmd, core_events, sudo=sudo, pin=pin), **kwargs
+    )
+
+
+def perf_repeat_per_core_events(
+    cmd: str, events: List[str], socket: int, pin: Optional[Pin] = None, **kwargs
+) -> Dict[str, Dict[str, EventStats]]:
+    """
+    perf_sample_per_core_events repeated until confident.
+
+    Returns:
+        Dict[str,Dict[str,EventStats]]: Mapping of event name -> core ID (as str) -> statistics.
+    """
+    return repeat_until_confident(  # type: ignore
+        lambda: perf_sample_per_core_events(cmd, events, socket, pin=pin), **kwargs
+    )
+
+
+def perf_repeat_uncore_event_many(
+    program_cmd: str, unc_events: List[Tuple[str, str]], pin: Optional[Pin] = None, **kwargs
+) -> Dict[str, Dict[str, EventStats]]:
+    """
+    perf_sample_uncore_event_many repeated until confident.
+
+    Returns:
+        Dict[str,Dict[str,EventStats]]: Mapping of event code -> CHA index (as str) -> statistics.
+    """
+    return repeat_until_confident(  # type: ignore
+        lambda: perf_sample_uncore_event_many(program_cmd, unc_events, pin=pin), **kwargs
+    )
@@ -0,0 +1,266 @@
+import math
+import statistics
+from collections import deque
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+from rykit.affinity import Pin
+from rykit.perf_interval import IntervalRecord, perf_stream_interval
+from rykit.perf_metrics import DURATION_EVENT, Metric, evaluate, required_events, resolve_metrics
+
+
+class SteadyStateResult(NamedTuple):
+    """
+    Counter rates over the window in which a workload was judged steady.
+
+    Attributes:
+        converged (bool): Whether the steady-state criterion was met; False
+            if the workload exited or max_duration passed first (the values
+            then cover the last window).
+        rates (Dict[str,float]): Event -> per-second rate summed over units
+            (CHAs, cores), averaged over the window.
+        unit_rates (Dict[str,Dict[str,float]]): Event -> unit -> per-second
+            rate, for per-unit streams (CHA index, core); empty otherwise.
+        metrics (Dict[str,float]): Metric name -> mean over the window.
+        warmup (float): Seconds skipped before the window started.
+        stopped_at (float): Timestamp of the last interval used.
+        intervals (int): Intervals in the window.
+    """
+
+    converged: bool
+    rates: Dict[str, float]
+    unit_rates: Dict[str, Dict[str, float]]
+    metrics: Dict[str, float]
+    warmup: float
+    stopped_at: float
+    intervals: int
+
+
+def _slope(values: Sequence[float]) -> float:
+    # least squares slope against 0..n-1
+    n = len(values)
+    mean_x = (n - 1) / 2
+    mean_y = math.fsum(values) / n
+    num = math.fsum((i - mean_x) * (v - mean_y) for i, v in enumerate(values))
+    den = math.fsum((i - mean_x) ** 2 for i in range(n))
+    return num / den if den else 0.0
+
+
+class SteadyStateDetector:
+    """
+    Windowed steady-state criterion over per-interval series.
+
+    After min_warmup intervals, the last window values of every watched
+    series must have a coefficient of variation (stddev / |mean|) at most
+    rel_tol, and their least squares trend across the window must move
+    the mean by at most rel_tol. Warmup is whatever precedes the first
+    window passing both tests, so ramps and phase changes are skipped.
+    Memory is window values per series.
+
+    Attributes:
+        window (int): Intervals per window (>= 2).
+        rel_tol (float): Tolerance of both tests, e.g. 0.02 for 2%.
+        min_warmup (int): Intervals always discarded first.
+    """
+
+    def __init__(self, window: int = 5, rel_tol: float = 0.02, min_warmup: int = 1):
+        assert window >= 2, "window needs at least 2 intervals"
+        self.window = window
+        self.rel_tol = rel_tol
+        self.min_warmup = min_warmup
+        self.seen = 0
+        self.series: Dict[str, Deque[float]] = {}
+
+    def add(self, values: Dict[str, float]) -> bool:
+        """
+        Add one interval of watched values and return whether the current
+        window is steady. NaN values (idle denominators) are never steady.
+        """
+        self.seen += 1
+        if self.seen <= self.min_warmup:
+            return False
+        for key, value in values.items():
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = deque(maxlen=self.window)
+            series.append(value)
+        return self.steady()
+
+    def steady(self) -> bool:
+        if not self.series:
+            return False
+        for series in self.series.values():
+            if len(series) < self.window or any(v != v for v in series):
+                return False
+            mean = statistics.fmean(series)
+            if mean == 0:
+                # an idle counter is steady only if it stays at zero
+                if any(v != 0 for v in series):
+                    return False
+                continue
+            if statistics.stdev(series) / abs(mean) > self.rel_tol:
+                return False
+            if abs(_slope(series) * (self.window - 1)) / abs(mean) > self.rel_tol:
+                return False
+        return True
+
+
+def _intervals(records: Iterable[IntervalRecord]) -> Iterable[Tuple[float, List[IntervalRecord]]]:
+    # group records by timestamp; an interval is complete when the next one
+    # starts, since its size can vary (perf drops <not counted> lines)
+    ts: Optional[float] = None
+    batch: List[IntervalRecord] = []
+    for record in records:
+        if ts is not None and record.timestamp != ts:
+            yield ts, batch
+            batch = []
+        ts = record.timestamp
+        batch.append(record)
+    if batch:
+        assert ts is not None
+        yield ts, batch
+
+
+def detect_steady_state(
+    records: Iterable[IntervalRecord],
+    watch: Optional[List[str]] = None,
+    metrics: Sequence[Union[Metric, str]] = (),
+    window: int = 5,
+    rel_tol: float = 0.02,
+    min_warmup: int = 1,
+    max_duration: Optional[float] = None,
+) -> SteadyStateResult:
+    """
+    Consume an interval stream until the watched series converge.
+
+    The stream is abandoned as soon as the criterion is met; for generators
+    from perf_stream_interval this closes them, which stops perf and the
+    workload.
+
+    Args:
+        records (Iterable[IntervalRecord]): Interval stream.
+        watch (Optional[List[str]]): Event and/or metric names tested for
+            convergence. Events are per-second rates summed over units.
+            Defaults to the metrics if any are given, else all events.
+        metrics (Sequence[Union[Metric,str]]): Metrics evaluated per interval
+            on the summed counts (see rykit.perf_metrics).
+        window (int): Intervals per window.
+        rel_tol (float): Tolerance, see SteadyStateDetector.
+        min_warmup (int): Intervals always skipped.
+        max_duration (Optional[float]): Stop unconverged after this many
+            seconds of stream time.
+
+    Returns:
+        SteadyStateResult: Rates and metrics averaged over the final window.
+    """
+    metrics = resolve_metrics(metrics)
+    detector = SteadyStateDetector(window, rel_tol, min_warmup)
+    # the last window of everything, for the result
+    totals_window: Deque[Dict[str, float]] = deque(maxlen=window)
+    units_window: Deque[Dict[Tuple[str, str], float]] = deque(maxlen=window)
+    metrics_window: Deque[Dict[str, float]] = deque(maxlen=window)
+    starts_window: Deque[float] = deque(maxlen=window)
+    prev_ts = 0.0
+    ts = 0.0
+    converged = False
+    try:
+        for ts, batch in _intervals(records):
+            seconds = ts - prev_ts
+            if seconds <= 0:
+                # repeated or out of order timestamp, no time to divide by
+                continue
+            starts_window.append(prev_ts)
+            prev_ts = ts
+            totals: Dict[str, float] = {}
+            per_unit: Dict[Tuple[str, str], float] = {}
+            for r in batch:
+                totals[r.event] = totals.get(r.event, 0.0) + r.value
+                if r.unit is not None:
+                    per_unit[(r.event, r.unit)] = r.value / seconds
+            rates = {e: v / seconds for e, v in totals.items()}
+            values = evaluate(metrics, totals, seconds) if metrics else {}
+            totals_window.append(rates)
+            units_window.append(per_unit)
+            metrics_window.append(values)
+            names = watch if watch is not None else (list(values) if metrics else list(rates))
+            watched = {n: values[n] if n in values else rates.get(n, math.nan) for n in names}
+            if detector.add(watched):
+                converged = True
+                break
+            if max_duration is not None and ts >= max_duration:
+                break
+    finally:
+        close = getattr(records, "close", None)
+        if close is not None:
+            close()
+    return SteadyStateResult(
+        converged=converged,
+        rates=_mean_dicts(totals_window),
+        unit_rates=_nest(_mean_dicts(units_window)),
+        metrics=_mean_dicts(metrics_window),
+        warmup=starts_window[0] if starts_window else 0.0,
+        stopped_at=ts,
+        intervals=len(totals_window),
+    )
+
+
+def _mean_dicts(window: Iterable[Dict]) -> Dict:
+    sums: Dict = {}
+    counts: Dict = {}
+    for d in window:
+        for k, v in d.items():
+            sums[k] = sums.get(k, 0.0) + v
+            counts[k] = counts.get(k, 0) + 1
+    return {k: sums[k] / counts[k] for k in sums}
+
+
+def _nest(flat: Dict[Tuple[str, str], float]) -> Dict[str, Dict[str, float]]:
+    res: Dict[str, Dict[str, float]] = {}
+    for (event, unit), v in flat.items():
+        res.setdefault(event, {})[unit] = v
+    return res
+
+
+def perf_sample_until_steady(
+    cmd: str,
+    events: List[str],
+    metrics: Sequence[Union[Metric, str]] = (),
+    watch: Optional[List[str]] = None,
+    interval_ms: int = 1000,
+    window: int = 5,
+    rel_tol: float = 0.02,
+    min_warmup: int = 1,
+    max_duration: Optional[float] = None,
+    system_wide: bool = False,
+    sudo: bool = True,
+    pin: Optional[Pin] = None,
+) -> SteadyStateResult:
+    """
+    Run cmd under interval counting and stop it once it reaches steady state.
+
+    Replaces bounding open-ended load generators with `timeout N`: the run
+    ends after warmup plus one steady window, or at max_duration.
+
+    Args:
+        cmd (str): Command to run under perf (may run forever).
+        events (List[str]): Perf event strings; events needed by metrics are added.
+        metrics (Sequence[Union[Metric,str]]): Metrics to evaluate and, by
+            default, to watch (e.g. ["ipc"]).
+        watch (Optional[List[str]]): Names tested for convergence, see detect_steady_state.
+        interval_ms (int): Interval length in milliseconds.
+        window (int): Intervals that must agree.
+        rel_tol (float): Relative tolerance of the variance and trend tests.
+        min_warmup (int): Intervals always skipped.
+        max_duration (Optional[float]): Seconds after which the run is
+            stopped without converging.
+        system_wide (bool): Count on all CPUs, required for uncore events.
+        sudo (bool): Whether to run perf as sudo.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+
+    Returns:
+        SteadyStateResult: Steady-state rates, per-unit rates and metrics.
+
+    Example:
+        res = perf_sample_until_steady("./loadgen", ["instructions", "cycles"], metrics=["ipc"])
+    """
+    events = [e for e in required_events(metrics, events) if e != DURATION_EVENT]
+    records = perf_stream_interval(cmd, events, interval_ms, system_wide=system_wide, sudo=sudo, pin=pin)
+    return detect_steady_state(records, watch, metrics, window, rel_tol, min_warmup, max_duration)
@@ -0,0 +1,464 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+from rykit.affinity import Pin
+from rykit.perf_catalog import validate_events
+from rykit.perf_schedule import EventMeta, ScheduledResult, counter_limit, perf_sample_scheduled, pmu_of, schedule_events
+from rykit.topology import get_topology
+
+# events counted by warmup runs, whose results are discarded
+WARMUP_EVENTS = ["task-clock"]
+
+ORDERS = ("interleave", "grouped", "shuffle")
+
+
+class SweepPoint(NamedTuple):
+    """
+    One cell of a parameter grid: a command, its pinning and the events
+    wanted for it.
+
+    Attributes:
+        params (Dict[str,Any]): Grid parameters that produced the point.
+        cmd (str): Command to run under perf.
+        events (List[str]): Perf event strings to count.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        system_wide (bool): Count on all CPUs (-a), required for uncore events.
+        repeat (int): Replicate index; points differing only in it are
+                      measured by separate runs.
+    """
+
+    params: Dict[str, Any]
+    cmd: str
+    events: List[str]
+    pin: Optional[Pin] = None
+    system_wide: bool = False
+    repeat: int = 0
+
+
+class PlannedRun(NamedTuple):
+    """
+    One workload execution of a sweep plan.
+
+    Attributes:
+        key (str): Stable hash of cmd, pin, system_wide, repeat and events,
+                   used to checkpoint the run.
+        cmd (str): Command to run under perf.
+        events (List[str]): Perf event strings counted by this run, within
+                            the counter limits of every PMU.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+        system_wide (bool): Count on all CPUs (-a).
+        points (List[int]): Indices of the points this run provides counts for.
+        warmup (bool): Run only to warm caches; its counts are discarded.
+        repeat (int): Replicate index of the points it measures.
+    """
+
+    key: str
+    cmd: str
+    events: List[str]
+    pin: Optional[Pin]
+    system_wide: bool
+    points: List[int]
+    warmup: bool = False
+    repeat: int = 0
+
+
+class SweepPlan(NamedTuple):
+    """
+    Execution plan of a sweep.
+
+    Attributes:
+        points (List[SweepPoint]): The grid points, in input order.
+        runs (List[PlannedRun]): Workload executions, in execution order.
+        naive_runs (int): Executions needed when every point is measured on
+                          its own, for comparison.
+    """
+
+    points: List[SweepPoint]
+    runs: List[PlannedRun]
+    naive_runs: int
+
+
+class PointResult(NamedTuple):
+    """
+    Counts of one sweep point, gathered from the runs covering its events.
+
+    Attributes:
+        point (SweepPoint): The grid point.
+        result (ScheduledResult): Counts and metadata of the point's events;
+            passes holds the event groups of the runs that provided them.
+    """
+
+    point: SweepPoint
+    result: ScheduledResult
+
+
+def expand_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    Return the cartesian product of a parameter grid, last key varying fastest.
+
+    Example:
+        expand_grid({"threads": [1, 2], "node": [0, 1]})
+        # [{"threads": 1, "node": 0}, {"threads": 1, "node": 1}, ...]
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def sweep_points(
+    cmd: Union[str, Callable[[Dict[str, Any]], str]],
+    grid: Dict[str, Sequence[Any]],
+    events: Union[List[str], Dict[str, List[str]]],
+    pin: Optional[Union[Pin, Callable[[Dict[str, Any]], Optional[Pin]]]] = None,
+    system_wide: Optional[bool] = None,
+    repeats: int = 1,
+) -> List[SweepPoint]:
+    """
+    Build sweep points from a parameter grid.
+
+    Parameters used by neither cmd nor pin do not change what is run, so
+    repeated measurements need repeats rather than a grid axis (plan_sweep
+    rejects such axes).
+
+    Args:
+        cmd (Union[str,Callable]): Command template formatted with the
+            parameters (e.g. "./bench -t {threads}"), or a function of them.
+        grid (Dict[str,Sequence[Any]]): Parameter name -> values.
+        events (Union[List[str],Dict[str,List[str]]]): Events for every
+            point, or named event sets, which add an "events" axis to the grid.
+        pin (Optional[Union[Pin,Callable]]): Binding for every point, or a
+            function of the parameters (e.g. lambda p: native_pin_cpu(p["cpus"], p["node"])).
+        system_wide (Optional[bool]): Count on all CPUs. Defaults to True
+            for points with uncore events.
+        repeats (int): Measure every cell this many times, each in its own
+            runs (e.g. for rykit.perf_stats.summarize); adds a "repeat"
+            parameter when above 1.
+
+    Returns:
+        List[SweepPoint]: One point per grid cell.
+    """
+    if isinstance(events, dict):
+        grid = dict(grid, events=list(events))
+    points: List[SweepPoint] = []
+    for params in expand_grid(grid):
+        point_events = events[params["events"]] if isinstance(events, dict) else events
+        point_cmd = cmd(params) if callable(cmd) else cmd.format(**params)
+        point_pin = pin(params) if callable(pin) else pin
+        wide = system_wide
+        if wide is None:
+            wide = any(pmu_of(e) not in ("cpu", "software") for e in point_events)
+        for r in range(repeats):
+            point_params = dict(params, repeat=r) if repeats > 1 else params
+            points.append(SweepPoint(point_params, point_cmd, list(point_events), point_pin, wide, r))
+    return points
+
+
+def _pin_key(pin: Optional[Pin]) -> Any:
+    if pin is None:
+        return None
+    return [
+        None if pin.cpus is None else sorted(pin.cpus),
+        None if pin.mem_nodes is None else sorted(pin.mem_nodes),
+    ]
+
+
+def _run_key(cmd: str, pin: Optional[Pin], system_wide: bool, events: List[str], repeat: int = 0) -> str:
+    text = json.dumps([cmd, _pin_key(pin), system_wide, sorted(events), repeat])
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def _fits(events: List[str], limits: Optional[Dict[str, int]]) -> bool:
+    used: Dict[str, int] = {}
+    for e in events:
+        pmu = pmu_of(e)
+        limit = counter_limit(pmu, limits)
+        if limit is None:
+            continue
+        used[pmu] = used.get(pmu, 0) + 1
+        if used[pmu] > limit:
+            return False
+    return True
+
+
+def _pack(event_sets: List[List[str]], limits: Optional[Dict[str, int]]) -> List[List[str]]:
+    # first fit decreasing over whole event sets, so a point's events share
+    # a run; sets too big for one run are split by schedule_events. Falls
+    # back to scheduling the union when that needs fewer runs.
+    bins: List[List[str]] = []
+    for events in sorted(event_sets, key=len, reverse=True):
+        for b in bins:
+            merged = list(dict.fromkeys(b + events))
+            if _fits(merged, limits):
+                b[:] = merged
+                break
+        else:
+            if _fits(events, limits):
+                bins.append(list(events))
+            else:
+                bins += schedule_events(events, limits)
+    union = schedule_events(list(dict.fromkeys(e for events in event_sets for e in events)), limits)
+    return union if len(union) < len(bins) else bins
+
+
+def _order(groups: List[List[PlannedRun]], order: str, seed: int) -> List[PlannedRun]:
+    if order == "grouped":
+        return [run for group in groups for run in group]
+    if order == "interleave":
+        # round robin over configurations, so consecutive runs of the same
+        # configuration are separated by the others instead of always
+        # following a warm run of themselves
+        return [run for batch in itertools.zip_longest(*groups) for run in batch if run is not None]
+    if order == "shuffle":
+        runs = [run for group in groups for run in group]
+        random.Random(seed).shuffle(runs)
+        return runs
+    raise ValueError(f"order must be one of {ORDERS} (passed {order})")
+
+
+def plan_sweep(
+    points: List[SweepPoint],
+    limits: Optional[Dict[str, int]] = None,
+    order: str = "interleave",
+    warmup: bool = False,
+    seed: int = 0,
+    validate: bool = True,
+) -> SweepPlan:
+    """
+    Compute the fewest workload executions covering every point.
+
+    Points sharing a command, pinning, system_wide flag and repeat index are
+    one configuration: their event sets are packed together into runs within
+    the counter limits, so two event sets that fit the counters together
+    cost one run instead of two. Whole sets are kept in one run where that
+    costs no extra runs, otherwise the union is split with
+    rykit.perf_schedule.schedule_events.
+
+    Args:
+        points (List[SweepPoint]): Points to measure, e.g. from sweep_points.
+        limits (Optional[Dict[str,int]]): Counters per PMU family.
+        order (str): "interleave" alternates configurations run by run,
+            "grouped" runs each configuration's passes back to back,
+            "shuffle" randomizes the order (seeded, so resumes see the same plan).
+        warmup (bool): Start with one discarded run of every configuration,
+            so no measured run is the first, cold execution of its binary.
+        seed (int): Seed of the "shuffle" order.
+        validate (bool): Check every event against the PMU catalog first.
+
+    Returns:
+        SweepPlan: The runs in execution order.
+
+    Raises:
+        ValueError: If order is unknown, an event is invalid, or two points
+                    with different parameters would be measured by the same
+                    run (a grid axis used by neither cmd nor pin; use repeats).
+    """
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {ORDERS} (passed {order})")
+    if validate:
+        validate_events(list(dict.fromkeys(e for p in points for e in p.events)))
+    configs: Dict[Tuple[str, Any, bool, int], List[int]] = {}
+    for i, p in enumerate(points):
+        configs.setdefault((p.cmd, json.dumps(_pin_key(p.pin)), p.system_wide, p.repeat), []).append(i)
+
+    groups: List[List[PlannedRun]] = []
+    warmups: List[PlannedRun] = []
+    for indices in configs.values():
+        first = points[indices[0]]
+        owner: Dict[Tuple[str, ...], int] = {}
+        for i in indices:
+            j = owner.setdefault(tuple(dict.fromkeys(points[i].events)), i)
+            if points[j].params != points[i].params:
+                raise ValueError(
+                    f"points {points[j].params} and {points[i].params} run the same command, pin and events,"
+                    " so they would get identical counts; use sweep_points(repeats=...) for repetitions"
+                )
+        event_sets = list(owner)
+        packed = _pack([list(s) for s in event_sets], limits)
+        covered: List[List[int]] = [[] for _ in packed]
+        for i in indices:
+            wanted = set(points[i].events)
+            # a point reads every event from one run when a run has them all
+            whole = [r for r, events in enumerate(packed) if wanted.issubset(events)]
+            for r in whole[:1] or [r for r, events in enumerate(packed) if wanted.intersection(events)]:
+                covered[r].append(i)
+        group: List[PlannedRun] = []
+        for events, run_points in zip(packed, covered):
+            key = _run_key(first.cmd, first.pin, first.system_wide, events, first.repeat)
+            group.append(PlannedRun(key, first.cmd, events, first.pin, first.system_wide, run_points, False, first.repeat))
+        groups.append(group)
+        if warmup and first.repeat == 0:
+            key = _run_key(first.cmd, first.pin, first.system_wide, WARMUP_EVENTS)
+            warmups.append(PlannedRun(key, first.cmd, WARMUP_EVENTS, first.pin, first.system_wide, [], True))
+
+    naive = sum(len(schedule_events(p.events, limits)) for p in points)
+    # replicates go round by round, so repeats of a cell are spread out
+    groups.sort(key=lambda group: group[0].repeat)
+    return SweepPlan(points, warmups + _order(groups, order, seed), naive)
+
+
+class SweepCheckpoint:
+    """
+    Append-only record of finished sweep runs, one JSON line per run.
+
+    Every line is flushed and fsynced as soon as its run finishes, so an
+    interrupted sweep loses at most the run in flight. A truncated last
+    line is ignored on load. The file starts with the topology fingerprint
+    and refuses to resume on a differently shaped machine.
+
+    Attributes:
+        path (str): The checkpoint file.
+        done (Dict[str,ScheduledResult]): Run key -> its result.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, ScheduledResult] = {}
+        fingerprint = get_topology().fingerprint()
+        if os.path.exists(path):
+            with open(path) as f:
+                text = f.read()
+            if text and not text.endswith("\n"):
+                # terminate a line torn by a crash so the next entry starts clean
+                with open(path, "a") as f:
+                    f.write("\n")
+            lines = text.split("\n")
+            header = json.loads(lines[0]) if lines[0] else {}
+            if header.get("fingerprint", fingerprint) != fingerprint:
+                raise ValueError(
+                    f"checkpoint {path} was written on a different topology ({header['fingerprint']} != {fingerprint})"
+                )
+            for line in lines[1:]:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                meta = {e: EventMeta(*m) for e, m in entry["meta"].items()}
+                self.done[entry["key"]] = ScheduledResult(entry["counts"], meta, [entry["events"]])
+            if lines[0]:
+                return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._write({"fingerprint": fingerprint})
+
+    def _write(self, entry: Dict[str, Any]):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, run: PlannedRun, result: ScheduledResult):
+        """Record a finished run."""
+        self.done[run.key] = ScheduledResult(result.counts, result.meta, [run.events])
+        self._write(
+            {
+                "key": run.key,
+                "events": run.events,
+                "counts": result.counts,
+                "meta": {e: list(m) for e, m in result.meta.items()},
+            }
+        )
+
+
+def run_sweep(
+    plan: SweepPlan,
+    checkpoint: Optional[str] = None,
+    sudo: bool = True,
+    backend: str = "perf",
+) -> List[PointResult]:
+    """
+    Execute a sweep plan, skipping runs a previous attempt already finished.
+
+    A failing run raises after every earlier run was checkpointed; calling
+    run_sweep again with the same checkpoint continues from that run.
+    Warmup runs are repeated on resume unless their configuration is done.
+
+    Args:
+        plan (SweepPlan): Plan from plan_sweep.
+        checkpoint (Optional[str]): JSON lines file recording finished runs,
+                                    None to keep nothing.
+        sudo (bool): Whether to run perf as sudo.
+        backend (str): "perf" or "syscall", see rykit.perf_schedule.perf_sample_scheduled.
+
+    Returns:
+        List[PointResult]: One result per point, in point order.
+    """
+    store = SweepCheckpoint(checkpoint) if checkpoint is not None else None
+    done: Dict[str, ScheduledResult] = dict(store.done) if store is not None else {}
+    measured = [run for run in plan.runs if not run.warmup]
+    pending: Set[Tuple[str, str, bool]] = {
+        (run.cmd, json.dumps(_pin_key(run.pin)), run.system_wide) for run in measured if run.key not in done
+    }
+    for index, run in enumerate(plan.runs):
+        if run.key in done:
+            continue
+        if run.warmup:
+            if (run.cmd, json.dumps(_pin_key(run.pin)), run.system_wide) in pending:
+                perf_sample_scheduled(
+                    run.cmd, run.events, system_wide=run.system_wide, sudo=sudo, pin=run.pin,
+                    validate=False, backend=backend,
+                )
+            continue
+        # each run already fits the counters, so "multiplex" runs it as one pass
+        res = perf_sample_scheduled(
+            run.cmd, run.events, mode="multiplex", system_wide=run.system_wide, sudo=sudo, pin=run.pin,
+            validate=False, backend=backend,
+        )
+        meta = {e: m._replace(pass_index=index) for e, m in res.meta.items()}
+        res = ScheduledResult(res.counts, meta, [run.events])
+        done[run.key] = res
+        if store is not None:
+            store.add(run, res)
+
+    runs_of: Dict[int, List[PlannedRun]] = {}
+    for run in measured:
+        for i in run.points:
+            runs_of.setdefault(i, []).append(run)
+    results: List[PointResult] = []
+    for i, point in enumerate(plan.points):
+        counts: Dict[str, Union[int, float]] = {}
+        meta: Dict[str, EventMeta] = {}
+        passes: List[List[str]] = []
+        wanted = set(point.events)
+        for run in runs_of.get(i, []):
+            res = done[run.key]
+            counts.update((e, v) for e, v in res.counts.items() if e in wanted)
+            meta.update((e, m) for e, m in res.meta.items() if e in wanted)
+            passes.append(run.events)
+        results.append(PointResult(point, ScheduledResult(counts, meta, passes)))
+    return results
+
+
+def perf_sweep(
+    cmd: Union[str, Callable[[Dict[str, Any]], str]],
+    grid: Dict[str, Sequence[Any]],
+    events: Union[List[str], Dict[str, List[str]]],
+    pin: Optional[Union[Pin, Callable[[Dict[str, Any]], Optional[Pin]]]] = None,
+    checkpoint: Optional[str] = None,
+    order: str = "interleave",
+    warmup: bool = False,
+    system_wide: Optional[bool] = None,
+    repeats: int = 1,
+    sudo: bool = True,
+    limits: Optional[Dict[str, int]] = None,
+    backend: str = "perf",
+) -> List[PointResult]:
+    """
+    Plan and run a parameter sweep in one call (sweep_points, plan_sweep, run_sweep).
+
+    Returns:
+        List[PointResult]: One result per grid cell, in grid order.
+
+    Example:
+        chas = create_unc_cha_events("0x35", "0x21")
+        res = perf_sweep(
+            "./stream -t {threads}",
+            {"threads": [1, 2, 4], "node": [0, 1]},
+            {"cycles": ["cycles", "instructions"], "llc": chas},
+            pin=lambda p: native_pin_cpu(list(range(p["threads"])), p["node"]),
+            checkpoint="sweep.ckpt",
+        )
+    """
+    points = sweep_points(cmd, grid, events, pin, system_wide, repeats)
+    plan = plan_sweep(points, limits, order, warmup)
+    return run_sweep(plan, checkpoint, sudo, backend)
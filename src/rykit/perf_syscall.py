@@ -0,0 +1,597 @@
+import ctypes
+import errno
+import logging
+import os
+import platform
+import struct
+import subprocess
+import time
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from rykit.affinity import Pin, launch_pin
+from rykit.cmd import _check_returncode, _emit_process
+from rykit.instrument import context
+from rykit.perf_catalog import get_catalog
+from rykit.topology import get_topology, parse_range_list
+
+BACKENDS = ("perf", "syscall")
+
+logger = logging.getLogger(__name__)
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+PERF_TYPE_HW_CACHE = 3
+PERF_TYPE_RAW = 4
+
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+PERF_FORMAT_GROUP = 1 << 3
+
+PERF_EVENT_IOC_ENABLE = 0x2400
+PERF_EVENT_IOC_DISABLE = 0x2401
+PERF_EVENT_IOC_RESET = 0x2403
+PERF_IOC_FLAG_GROUP = 1
+
+PERF_FLAG_FD_CLOEXEC = 1 << 3
+
+# perf_event_attr flag bits
+_DISABLED = 1 << 0
+_INHERIT = 1 << 1
+_EXCLUDE_USER = 1 << 4
+_EXCLUDE_KERNEL = 1 << 5
+_EXCLUDE_HV = 1 << 6
+_ENABLE_ON_EXEC = 1 << 12
+
+# perf_event_open syscall numbers
+_SYS_PERF_EVENT_OPEN = {
+    "x86_64": 298,
+    "aarch64": 241,
+    "ppc64le": 319,
+    "ppc64": 319,
+    "s390x": 331,
+    "riscv64": 241,
+}
+
+# attr sizes the kernel understands (VER5 without config3, VER8 with it)
+_ATTR_SIZE_VER5 = 112
+_ATTR_SIZE_VER8 = 136
+
+_HW_EVENTS = {
+    "cycles": 0, "cpu-cycles": 0, "instructions": 1, "cache-references": 2,
+    "cache-misses": 3, "branches": 4, "branch-instructions": 4, "branch-misses": 5,
+    "bus-cycles": 6, "stalled-cycles-frontend": 7, "idle-cycles-frontend": 7,
+    "stalled-cycles-backend": 8, "idle-cycles-backend": 8, "ref-cycles": 9,
+}
+
+_SW_EVENTS = {
+    "cpu-clock": 0, "task-clock": 1, "page-faults": 2, "faults": 2,
+    "context-switches": 3, "cs": 3, "cpu-migrations": 4, "migrations": 4,
+    "minor-faults": 5, "major-faults": 6, "alignment-faults": 7,
+    "emulation-faults": 8, "dummy": 9, "bpf-output": 10,
+}
+
+# PMUs that count per task even if sysfs gives them a cpumask
+_TASK_PMUS = {"software", "tracepoint", "breakpoint", "kprobe", "uprobe"}
+
+# units perf prints for software events
+_SW_UNITS = {"cpu-clock": "msec", "task-clock": "msec"}
+
+_CACHE_IDS = {"L1-dcache": 0, "L1-icache": 1, "LLC": 2, "dTLB": 3, "iTLB": 4, "branch": 5, "node": 6}
+_CACHE_OPS = {
+    "loads": (0, 0), "load-misses": (0, 1), "stores": (1, 0), "store-misses": (1, 1),
+    "prefetches": (2, 0), "prefetch-misses": (2, 1),
+}
+
+
+class PerfEventAttr(ctypes.Structure):
+    """struct perf_event_attr, up to config3 (PERF_ATTR_SIZE_VER8)."""
+
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("size", ctypes.c_uint32),
+        ("config", ctypes.c_uint64),
+        ("sample_period", ctypes.c_uint64),
+        ("sample_type", ctypes.c_uint64),
+        ("read_format", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("wakeup_events", ctypes.c_uint32),
+        ("bp_type", ctypes.c_uint32),
+        ("config1", ctypes.c_uint64),
+        ("config2", ctypes.c_uint64),
+        ("branch_sample_type", ctypes.c_uint64),
+        ("sample_regs_user", ctypes.c_uint64),
+        ("sample_stack_user", ctypes.c_uint32),
+        ("clockid", ctypes.c_int32),
+        ("sample_regs_intr", ctypes.c_uint64),
+        ("aux_watermark", ctypes.c_uint32),
+        ("sample_max_stack", ctypes.c_uint16),
+        ("reserved_2", ctypes.c_uint16),
+        ("aux_sample_size", ctypes.c_uint32),
+        ("reserved_3", ctypes.c_uint32),
+        ("sig_data", ctypes.c_uint64),
+        ("config3", ctypes.c_uint64),
+    ]
+
+
+class EventSpec(NamedTuple):
+    """
+    An event string resolved to what perf_event_open needs.
+
+    Attributes:
+        name (str): The event string as passed by the caller.
+        type (int): perf_event_attr type (PMU type from sysfs for pmu/.../ events).
+        config (Dict[str,int]): Config word name -> value.
+        exclude (int): _EXCLUDE_* flag bits from :u/:k/:h modifiers.
+        pmu (Optional[str]): sysfs PMU name for pmu/.../ events.
+        scale (float): sysfs scale perf multiplies the count by.
+        unit (str): Unit perf prints for the value.
+    """
+
+    name: str
+    type: int
+    config: Dict[str, int]
+    exclude: int
+    pmu: Optional[str]
+    scale: float
+    unit: str
+
+
+class CounterReading(NamedTuple):
+    """
+    One counter read through read_format.
+
+    Attributes:
+        value (Union[int,float]): raw scaled for multiplexing (raw *
+                                  enabled / running) and by the sysfs
+                                  scale, as perf stat prints it.
+        raw (int): Count while the counter was running.
+        time_enabled (int): Nanoseconds the counter was enabled.
+        time_running (int): Nanoseconds the counter was on the PMU.
+        unit (str): Unit of value ("msec", "Bytes", ...) or "".
+    """
+
+    value: Union[int, float]
+    raw: int
+    time_enabled: int
+    time_running: int
+    unit: str
+
+
+def _sysfs_pmu(pmu: str, sysfs_root: str = "/sys") -> str:
+    return os.path.join(sysfs_root, "bus/event_source/devices", pmu)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _modifiers(event: str) -> Tuple[str, int]:
+    # "cycles:u" / "cpu/event=0x3c/k" -> (base, exclude bits)
+    if event.endswith("/"):
+        return event, 0
+    base, sep, mods = event.rpartition(":") if "/" not in event else event.rpartition("/")
+    if not sep or not mods or set(mods) - set("ukhGHp"):
+        return event, 0
+    if sep == "/":
+        base += "/"
+    exclude = 0
+    if "u" in mods or "k" in mods or "h" in mods:
+        exclude = _EXCLUDE_USER | _EXCLUDE_KERNEL | _EXCLUDE_HV
+        if "u" in mods:
+            exclude &= ~_EXCLUDE_USER
+        if "k" in mods:
+            exclude &= ~_EXCLUDE_KERNEL
+        if "h" in mods:
+            exclude &= ~_EXCLUDE_HV
+    return base, exclude
+
+
+def parse_event(event: str, sysfs_root: str = "/sys") -> EventSpec:
+    """
+    Resolve an event string the way perf does.
+
+    Understands perf's generic hardware/software/cache names, raw rNNNN
+    codes, "pmu/field=value,.../" and "pmu/alias/" (through the PMU
+    catalog) and perf list names, with :u/:k/:h modifiers.
+
+    Raises:
+        ValueError: If the event cannot be resolved.
+    """
+    base, exclude = _modifiers(event.strip())
+    if base in _HW_EVENTS:
+        return EventSpec(event, PERF_TYPE_HARDWARE, {"config": _HW_EVENTS[base]}, exclude, None, 1.0, "")
+    if base in _SW_EVENTS:
+        return EventSpec(
+            event, PERF_TYPE_SOFTWARE, {"config": _SW_EVENTS[base]}, exclude, None, 1.0,
+            _SW_UNITS.get(base, ""),
+        )
+    for cache, cache_id in _CACHE_IDS.items():
+        if base.startswith(cache + "-") and base[len(cache) + 1:] in _CACHE_OPS:
+            op, result = _CACHE_OPS[base[len(cache) + 1:]]
+            config = cache_id | (op << 8) | (result << 16)
+            return EventSpec(event, PERF_TYPE_HW_CACHE, {"config": config}, exclude, None, 1.0, "")
+    if base.startswith("r") and "/" not in base:
+        try:
+            return EventSpec(event, PERF_TYPE_RAW, {"config": int(base[1:], 16)}, exclude, None, 1.0, "")
+        except ValueError:
+            pass
+    catalog = get_catalog()
+    if "/" not in base:
+        resolved = catalog.resolve(base)
+        if resolved == base:
+            raise ValueError(f"cannot resolve event {event} for perf_event_open")
+        spec = parse_event(resolved, sysfs_root)
+        return spec._replace(name=event, exclude=exclude or spec.exclude)
+    pmu, _, rest = base.partition("/")
+    if pmu not in catalog.pmus:
+        raise ValueError(f"unknown PMU {pmu}")
+    scale, unit = 1.0, ""
+    alias = rest.rstrip("/")
+    if alias in catalog.aliases.get(pmu, {}):
+        dev = _sysfs_pmu(pmu, sysfs_root)
+        scale = float(_read(os.path.join(dev, "events", alias + ".scale")) or 1.0)
+        unit = _read(os.path.join(dev, "events", alias + ".unit")) or ""
+    return EventSpec(event, catalog.pmus[pmu], catalog.encode(base), exclude, pmu, scale, unit)
+
+
+def pmu_cpus(pmu: Optional[str], sysfs_root: str = "/sys") -> Optional[List[int]]:
+    """
+    Return the CPUs an uncore PMU's counters must be opened on (its sysfs
+    cpumask, typically one CPU per socket), or None for per-task PMUs.
+    """
+    if pmu is None:
+        return None
+    if pmu.startswith("cpu") or pmu in _TASK_PMUS:
+        return None
+    mask = _read(os.path.join(_sysfs_pmu(pmu, sysfs_root), "cpumask"))
+    if mask is None:
+        return None
+    return parse_range_list(mask)
+
+
+@lru_cache(maxsize=None)
+def _libc() -> ctypes.CDLL:
+    return ctypes.CDLL(None, use_errno=True)
+
+
+def syscall_available() -> bool:
+    """Return whether perf_event_open can be called on this architecture."""
+    return platform.machine() in _SYS_PERF_EVENT_OPEN
+
+
+def perf_event_open(attr: PerfEventAttr, pid: int, cpu: int, group_fd: int = -1, flags: int = 0) -> int:
+    """
+    Call perf_event_open(2).
+
+    Returns:
+        int: The new counter file descriptor.
+
+    Raises:
+        OSError: With the kernel's errno if the counter cannot be opened.
+    """
+    nr = _SYS_PERF_EVENT_OPEN.get(platform.machine())
+    if nr is None:
+        raise OSError(errno.ENOSYS, f"perf_event_open syscall number unknown for {platform.machine()}")
+    fd = _libc().syscall(
+        nr, ctypes.byref(attr), ctypes.c_int(pid), ctypes.c_int(cpu),
+        ctypes.c_int(group_fd), ctypes.c_ulong(flags | PERF_FLAG_FD_CLOEXEC),
+    )
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f"perf_event_open failed: {os.strerror(err)}")
+    return fd
+
+
+def _ioctl(fd: int, request: int, arg: int = 0):
+    if _libc().ioctl(ctypes.c_int(fd), ctypes.c_ulong(request), ctypes.c_ulong(arg)) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def _split_groups(events: List[str]) -> List[List[str]]:
+    # "{a,b}" entries become groups, everything else stands alone
+    groups: List[List[str]] = []
+    for e in events:
+        e = e.strip()
+        if e.startswith("{"):
+            body = e[1:e.rindex("}")]
+            members: List[str] = []
+            depth = 0
+            cur = ""
+            for ch in body:
+                if ch == "/":
+                    depth ^= 1
+                if ch == "," and depth == 0:
+                    members.append(cur)
+                    cur = ""
+                else:
+                    cur += ch
+            if cur:
+                members.append(cur)
+            groups.append(members)
+        else:
+            groups.append([e])
+    return groups
+
+
+def _check_unique(events: List[str]):
+    # readings are keyed by event string, so a repeat would overwrite the first
+    names = [n.strip() for group in _split_groups(events) for n in group]
+    repeated = sorted({n for n in names if names.count(n) > 1})
+    if repeated:
+        raise ValueError(
+            f"events {repeated} are passed more than once (alone and/or in groups), "
+            "readings are keyed by event string"
+        )
+
+
+class CounterGroup:
+    """
+    Counters opened directly with perf_event_open, no perf binary involved.
+
+    Each "{a,b,...}" entry of events is opened as a group (scheduled onto
+    the PMU together, read atomically); other events are opened alone.
+    Uncore events are opened on the CPUs of their PMU's cpumask and core
+    events on the task (or, if cpus is given, on every listed CPU); values
+    are summed across CPUs, as perf stat does by default.
+
+    Example (in-process, no PMU needed):
+        with CounterGroup(["task-clock", "page-faults"]) as c:
+            work()
+        c.readings["task-clock"].value
+
+    Attributes:
+        events (List[str]): Event strings as passed.
+        pid (int): Task to count (0 for this process), -1 for CPU-wide only.
+        cpus (Optional[List[int]]): CPUs to count core events on, None for
+                                    wherever the task runs.
+        inherit (bool): Also count children created after opening.
+        enable_on_exec (bool): Start counting at the task's next exec.
+        readings (Dict[str,CounterReading]): Final read() when used as a
+                                             context manager.
+    """
+
+    def __init__(
+        self,
+        events: List[str],
+        pid: int = 0,
+        cpus: Optional[List[int]] = None,
+        inherit: bool = True,
+        enable_on_exec: bool = False,
+        sysfs_root: str = "/sys",
+    ):
+        _check_unique(events)
+        self.events = events
+        self.pid = pid
+        self.cpus = cpus
+        self.inherit = inherit
+        self.enable_on_exec = enable_on_exec
+        self.sysfs_root = sysfs_root
+        # (specs, [(cpu, [fd per member])]) per group
+        self._groups: List[Tuple[List[EventSpec], List[Tuple[int, List[int]]]]] = []
+        self.readings: Dict[str, CounterReading] = {}
+
+    def _attr(self, spec: EventSpec, leader: bool, group: bool, task: bool, exclude: int) -> PerfEventAttr:
+        attr = PerfEventAttr()
+        attr.type = spec.type
+        attr.size = _ATTR_SIZE_VER8 if spec.config.get("config3") else _ATTR_SIZE_VER5
+        attr.config = spec.config.get("config", 0)
+        attr.config1 = spec.config.get("config1", 0)
+        attr.config2 = spec.config.get("config2", 0)
+        attr.config3 = spec.config.get("config3", 0)
+        attr.read_format = PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING
+        if group:
+            attr.read_format |= PERF_FORMAT_GROUP
+        flags = spec.exclude | exclude
+        if leader:
+            flags |= _DISABLED
+            if self.enable_on_exec and task:
+                flags |= _ENABLE_ON_EXEC
+        if self.inherit and task:
+            flags |= _INHERIT
+        attr.flags = flags
+        return attr
+
+    def _open_group(self, specs: List[EventSpec], pid: int, cpu: int, task: bool, exclude: int) -> List[int]:
+        fds: List[int] = []
+        try:
+            for i, spec in enumerate(specs):
+                attr = self._attr(spec, i == 0, len(specs) > 1, task, exclude)
+                fds.append(perf_event_open(attr, pid, cpu, fds[0] if fds else -1))
+        except BaseException:
+            for fd in fds:
+                os.close(fd)
+            raise
+        return fds
+
+    def open(self) -> "CounterGroup":
+        """
+        Open every counter, disabled (unless enable_on_exec).
+
+        Like perf, a permission error is retried counting user space only.
+
+        Raises:
+            OSError: If a counter cannot be opened (EACCES: lower
+                     /proc/sys/kernel/perf_event_paranoid or use CAP_PERFMON).
+            ValueError: If an event cannot be resolved.
+        """
+        try:
+            for names in _split_groups(self.events):
+                specs = [parse_event(n, self.sysfs_root) for n in names]
+                uncore_cpus = pmu_cpus(specs[0].pmu, self.sysfs_root)
+                if uncore_cpus is not None:
+                    placements = [(-1, cpu, False) for cpu in uncore_cpus]
+                elif self.cpus is not None:
+                    placements = [(self.pid, cpu, self.pid != -1) for cpu in self.cpus]
+                else:
+                    placements = [(self.pid, -1, True)]
+                opened: List[Tuple[int, List[int]]] = []
+                self._groups.append((specs, opened))
+                for pid, cpu, task in placements:
+                    try:
+                        fds = self._open_group(specs, pid, cpu, task, 0)
+                    except OSError as e:
+                        if e.errno not in (errno.EACCES, errno.EPERM) or not task:
+                            raise
+                        fds = self._open_group(specs, pid, cpu, task, _EXCLUDE_KERNEL | _EXCLUDE_HV)
+                    opened.append((cpu, fds))
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def _leaders(self) -> List[int]:
+        return [fds[0] for _, opened in self._groups for _, fds in opened]
+
+    def enable(self, cpu_wide_only: bool = False):
+        """
+        Start (or resume) counting.
+
+        Args:
+            cpu_wide_only (bool): Only enable counters bound to a CPU, which
+                                  can't use enable_on_exec.
+        """
+        for _, opened in self._groups:
+            for cpu, fds in opened:
+                if not cpu_wide_only or cpu != -1:
+                    _ioctl(fds[0], PERF_EVENT_IOC_ENABLE, PERF_IOC_FLAG_GROUP)
+
+    def disable(self):
+        """Stop counting; counts are kept."""
+        for fd in self._leaders():
+            _ioctl(fd, PERF_EVENT_IOC_DISABLE, PERF_IOC_FLAG_GROUP)
+
+    def reset(self):
+        """Zero the counts."""
+        for fd in self._leaders():
+            _ioctl(fd, PERF_EVENT_IOC_RESET, PERF_IOC_FLAG_GROUP)
+
+    def read(self) -> Dict[str, CounterReading]:
+        """
+        Read every counter, summed across CPUs and scaled like perf stat.
+
+        Returns:
+            Dict[str,CounterReading]: Event string -> reading. Events that
+                never ran (time_running 0) are left out, like "<not counted>".
+        """
+        res: Dict[str, CounterReading] = {}
+        for specs, opened in self._groups:
+            raw = [0] * len(specs)
+            enabled = [0] * len(specs)
+            running = [0] * len(specs)
+            for _, fds in opened:
+                if len(specs) > 1:
+                    n = len(specs)
+                    data = struct.unpack(f"{3 + n}Q", os.read(fds[0], 8 * (3 + n)))
+                    for i in range(n):
+                        raw[i] += data[3 + i]
+                        enabled[i] += data[1]
+                        running[i] += data[2]
+                else:
+                    value, ena, run = struct.unpack("3Q", os.read(fds[0], 24))
+                    raw[0] += value
+                    enabled[0] += ena
+                    running[0] += run
+            for i, spec in enumerate(specs):
+                if running[i] == 0:
+                    continue
+                value: Union[int, float] = raw[i]
+                if running[i] < enabled[i]:
+                    value = raw[i] * enabled[i] / running[i]
+                if spec.scale != 1.0:
+                    value = value * spec.scale
+                if spec.type == PERF_TYPE_SOFTWARE and spec.unit == "msec":
+                    # clocks count nanoseconds, perf prints milliseconds
+                    value = value / 1e6
+                res[spec.name] = CounterReading(value, raw[i], enabled[i], running[i], spec.unit)
+        return res
+
+    def close(self):
+        """Close every counter file descriptor."""
+        for _, opened in self._groups:
+            for _, fds in opened:
+                for fd in fds:
+                    os.close(fd)
+        self._groups = []
+
+    def __enter__(self) -> "CounterGroup":
+        self.open()
+        if not self.enable_on_exec:
+            self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.disable()
+            self.readings = self.read()
+        finally:
+            self.close()
+
+
+def syscall_sample_events(
+    cmd: str,
+    events: List[str],
+    system_wide: bool = False,
+    pin: Optional[Pin] = None,
+) -> Dict[str, CounterReading]:
+    """
+    Count events over cmd with perf_event_open instead of the perf binary.
+
+    cmd is started under `sh -c` and held before exec while the counters
+    are opened on it; task counters then start at the exec (enable_on_exec)
+    and CPU-wide/uncore counters are enabled right before it. Children of
+    cmd are counted, as with perf stat.
+
+    Args:
+        cmd (str): Command to run.
+        events (List[str]): Event strings, "{a,b}" for groups.
+        system_wide (bool): Count core events on all CPUs instead of the task.
+        pin (Optional[Pin]): CPU/memory binding for cmd.
+
+    Returns:
+        Dict[str,CounterReading]: Event string -> reading.
+
+    Raises:
+        CommandFailed: If cmd exits with a code other than 0 or 124.
+        ValueError: If an event is passed more than once.
+    """
+    _check_unique(events)
+    cmd, preexec_fn = launch_pin(pin, cmd)
+    logger.info("running cmd via perf_event_open: %s", cmd)
+    spawn_ns = time.monotonic_ns()
+    proc = subprocess.Popen(
+        ["sh", "-c", 'read _ && exec sh -c "$0" </dev/null', cmd],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        preexec_fn=preexec_fn,
+    )
+    assert proc.stdin is not None
+    counters = CounterGroup(
+        events,
+        pid=-1 if system_wide else proc.pid,
+        cpus=get_topology().cpus if system_wide else None,
+        enable_on_exec=not system_wide,
+    )
+    try:
+        counters.open()
+        counters.enable(cpu_wide_only=True)
+        # spawn covers the held child and opening the counters
+        exec_ns = time.monotonic_ns()
+        proc.stdin.write(b"\n")
+        proc.stdin.close()
+        returncode = proc.wait()
+        counters.disable()
+        readings = counters.read()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        counters.close()
+    with context(events=len(events)):
+        _emit_process(cmd, spawn_ns, exec_ns, 0, returncode, "syscall")
+    _check_returncode(returncode)
+    return readings
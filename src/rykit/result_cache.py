@@ -0,0 +1,376 @@
+import functools
+import hashlib
+import os
+import pickle
+import re
+import shlex
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from rykit.affinity import Pin
+from rykit.topology import get_topology
+
+# launchers skipped when looking for the measured binary in a command:
+# name -> (options taking a separate value, positional arguments before the command)
+_WRAPPERS: Dict[str, Tuple[set, int]] = {
+    "sudo": ({"-u", "-g", "-C", "-D", "-h", "-p", "-r", "-t", "-U", "-T"}, 0),
+    "env": ({"-u", "-C", "--unset", "--chdir"}, 0),
+    "nice": ({"-n", "--adjustment"}, 0),
+    "taskset": (set(), 1),  # the mask or cpu list
+    "numactl": ({"-C", "-N", "-m", "-i", "-p", "-P", "--physcpubind", "--cpunodebind", "--membind",
+                 "--interleave", "--preferred"}, 0),
+    "timeout": ({"-s", "-k", "--signal", "--kill-after"}, 1),  # the duration
+    "chrt": (set(), 1),  # the priority
+    "stdbuf": ({"-i", "-o", "-e"}, 0),
+    "time": ({"-f", "-o", "--format", "--output"}, 0),
+}
+
+# interpreters whose script, not the interpreter, is the measured program
+_INTERPRETER = re.compile(r"^(python[\d.]*|pypy[\d.]*|sh|bash|dash|zsh|perl|ruby|node|Rscript|julia)$")
+# interpreter options taking a separate value
+_INTERPRETER_OPTS = {"-W", "-X", "-Q", "-I", "-e", "-r"}
+
+# entries written between full directory scans when only a ttl bounds the cache
+EVICT_EVERY = 64
+
+# (path, mtime_ns, size) -> sha256, so unchanged binaries are hashed once per process
+_binary_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def default_cache_dir() -> str:
+    """Return $XDG_CACHE_HOME/rykit/results (~/.cache/rykit/results by default)."""
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "rykit", "results"
+    )
+
+
+def _program_tokens(cmd: str) -> List[str]:
+    # tokens from the program on, after launchers, their options and VAR=value
+    try:
+        tokens = shlex.split(cmd)
+    except ValueError:
+        tokens = cmd.split()
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if "=" in tok and not tok.startswith("-"):
+            i += 1
+            continue
+        name = os.path.basename(tok)
+        if name not in _WRAPPERS:
+            return tokens[i:]
+        opts, positional = _WRAPPERS[name]
+        i += 1
+        while i < len(tokens):
+            tok = tokens[i]
+            if tok == "--":
+                i += 1
+                break
+            if tok.startswith("-") and len(tok) > 1:
+                i += 2 if tok in opts else 1
+            elif positional > 0:
+                positional -= 1
+                i += 1
+            else:
+                break
+    return []
+
+
+def target_binary(cmd: str) -> Optional[str]:
+    """
+    Return the resolved path of the program cmd runs, skipping launchers
+    (numactl, taskset, env, ...), their options and arguments, and
+    VAR=value assignments.
+
+    Returns:
+        Optional[str]: Absolute path, or None if it cannot be found on PATH.
+    """
+    tokens = _program_tokens(cmd)
+    if not tokens:
+        return None
+    path = shutil.which(tokens[0])
+    return os.path.realpath(path) if path is not None else None
+
+
+def target_files(cmd: str) -> List[str]:
+    """
+    Return the files whose changes invalidate results of cmd: the program
+    and, for interpreters (python, bash, ...), the script they run.
+    """
+    binary = target_binary(cmd)
+    if binary is None:
+        return []
+    files = [binary]
+    tokens = _program_tokens(cmd)
+    if _INTERPRETER.match(os.path.basename(tokens[0])):
+        i = 1
+        while i < len(tokens):
+            tok = tokens[i]
+            if tok in ("-c", "-m", "-"):
+                # inline code or a module: no script file
+                break
+            if tok.startswith("-"):
+                i += 2 if tok in _INTERPRETER_OPTS else 1
+                continue
+            if os.path.isfile(tok):
+                files.append(os.path.realpath(tok))
+            break
+    return files
+
+
+def _file_fingerprint(path: str, hash_contents: bool) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    if not hash_contents:
+        return f"{path}:{st.st_mtime_ns}:{st.st_size}"
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = _binary_hashes.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _binary_hashes[key] = digest
+    return f"{path}:{digest}"
+
+
+def binary_fingerprint(cmd: str, hash_contents: bool = False) -> str:
+    """
+    Identify the version of the binary cmd runs (and of the script, for
+    interpreters, see target_files) by mtime and size, or by a sha256 of
+    the contents when hash_contents is set (survives touch/rebuilds that
+    produce identical output). Empty string if it cannot be resolved.
+    """
+    return ";".join(_file_fingerprint(path, hash_contents) for path in target_files(cmd))
+
+
+def _canonical(value: Any) -> str:
+    # stable text form for hashing: dict order and Pin list order don't matter
+    if isinstance(value, Pin):
+        return _canonical(
+            {
+                "cpus": None if value.cpus is None else sorted(value.cpus),
+                "mem_nodes": None if value.mem_nodes is None else sorted(value.mem_nodes),
+            }
+        )
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{_canonical(k)}:{_canonical(value[k])}" for k in sorted(value, key=repr)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_canonical(v) for v in value) + "]"
+    return repr(value)
+
+
+class ResultCache:
+    """
+    Opt-in persistent cache of measurement results, addressed by content.
+
+    An entry's key hashes the sampling function, command, events, pinning and
+    remaining arguments together with the topology fingerprint, kernel
+    version and target binary, so any change to the machine or the binary
+    misses instead of returning stale counters. Entries are pickled, one file
+    each, under cache_dir.
+
+    Attributes:
+        cache_dir (str): Directory holding the entries.
+        ttl (Optional[float]): Seconds an entry stays valid, None for forever.
+        max_entries (Optional[int]): Least recently used entries beyond this are evicted.
+        max_bytes (Optional[int]): Least recently used entries are evicted until
+                                   the cache is at most this size.
+        hash_binary (bool): Hash the target binary's contents instead of
+                            using its mtime and size.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        hash_binary: bool = False,
+    ):
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hash_binary = hash_binary
+        # (entries, bytes) as of the last full scan plus what put() added since;
+        # None until the first scan
+        self._usage: Optional[List[int]] = None
+        self._puts = 0
+
+    def key(self, fn: Callable, cmd: str, *args, **kwargs) -> str:
+        """
+        Return the hex key for fn(cmd, *args, **kwargs) on this machine.
+        """
+        parts = [
+            f"{fn.__module__}.{fn.__qualname__}",
+            cmd,
+            _canonical(args),
+            _canonical(kwargs),
+            get_topology().fingerprint(),
+            os.uname().release,
+            binary_fingerprint(cmd, self.hash_binary),
+        ]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".pkl")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Return the stored result for key, or default on a miss or expired entry.
+        """
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+            with open(path, "rb") as f:
+                created, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self._remove(path)
+            return default
+        # the file mtime tracks last use for LRU eviction
+        try:
+            os.utime(path, (st.st_atime, time.time()))
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: Any):
+        """
+        Store value under key, then evict entries beyond the size limits.
+
+        The cache directory is scanned only when the running entry/byte
+        count crosses a limit (or every EVICT_EVERY puts for ttl expiry),
+        not on every put.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so a crash never leaves a truncated entry behind
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((time.time(), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        if self.ttl is None and self.max_entries is None and self.max_bytes is None:
+            return
+        self._puts += 1
+        if self._usage is not None:
+            self._usage[0] += 1
+            self._usage[1] += os.path.getsize(path)
+        if (
+            self._usage is None
+            or (self.max_entries is not None and self._usage[0] > self.max_entries)
+            or (self.max_bytes is not None and self._usage[1] > self.max_bytes)
+            or (self.ttl is not None and self._puts >= EVICT_EVERY)
+        ):
+            self.evict()
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        Drop one entry, or every entry when key is None.
+        """
+        if key is not None:
+            self._remove(self._path(key))
+            return
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+    def call(self, fn: Callable, cmd: str, *args, force: bool = False, **kwargs) -> Any:
+        """
+        Return fn(cmd, *args, **kwargs), measuring only on a cache miss.
+
+        Args:
+            fn (Callable): Sampling function taking the command first, e.g.
+                           perf_sample_per_core_events.
+            cmd (str): Command to measure.
+            force (bool): Re-run and overwrite the stored result.
+
+        Example:
+            cache = ResultCache(ttl=7 * 24 * 3600)
+            res = cache.call(perf_sample_per_core_events, "./bench", ["cycles"], 0)
+        """
+        key = self.key(fn, cmd, *args, **kwargs)
+        if not force:
+            missing = object()
+            value = self.get(key, missing)
+            if value is not missing:
+                return value
+        value = fn(cmd, *args, **kwargs)
+        self.put(key, value)
+        return value
+
+    def cached(self, fn: Callable) -> Callable:
+        """
+        Wrap fn so calls go through call(); the wrapper accepts force=True.
+        """
+
+        @functools.wraps(fn)
+        def wrapper(cmd: str, *args, force: bool = False, **kwargs):
+            return self.call(fn, cmd, *args, force=force, **kwargs)
+
+        return wrapper
+
+    def evict(self):
+        """
+        Remove expired entries, then least recently used ones until within
+        max_entries and max_bytes.
+        """
+        if self.ttl is None and self.max_entries is None and self.max_bytes is None:
+            return
+        entries: List[Tuple[str, float, int]] = []
+        now = time.time()
+        for path, used, size in self._entries():
+            # mtime >= creation time, so only entries this old can be expired
+            if self.ttl is not None and now - used > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((path, used, size))
+        entries.sort(key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            path, _, size = entries.pop(0)
+            self._remove(path)
+            total -= size
+        self._usage = [len(entries), total]
+        self._puts = 0
+
+    def size(self) -> Tuple[int, int]:
+        """Return (number of entries, total bytes)."""
+        entries = list(self._entries())
+        return len(entries), sum(size for _, _, size in entries)
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for sub in os.listdir(self.cache_dir):
+            subdir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                if not name.endswith(".pkl"):
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
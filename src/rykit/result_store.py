@@ -0,0 +1,501 @@
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import compress
+from typing import Any, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+from rykit.perf_matrix import CounterMatrix
+from rykit.perf_schedule import ScheduledResult
+
+# column name -> array typecode, in on-disk order
+COLUMNS: Dict[str, str] = {
+    "run": "I",
+    "event": "I",
+    "unit": "i",
+    "value": "d",
+    "enabled": "Q",
+    "running": "Q",
+}
+
+# unit index of aggregated (not per-CHA/per-core) values
+AGGREGATE = -1
+
+# rows buffered in memory before a chunk is written
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+_MAGIC = b"RYKCHNK1"
+_HEADER_LEN = struct.Struct("<Q")
+_TRAILING_INT = re.compile(r"(\d+)$")
+_CORE_KEY = re.compile(r"^S(\d+)-D(\d+)-C(\d+)$")
+# perf --per-core keys are packed as flag | socket << 20 | die << 12 | core
+_CORE_FLAG = 1 << 30
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def unit_index(unit: Optional[str]) -> int:
+    """
+    Map a unit key of the dict results ("12", "S0-D0-C3", "CPU7", None) to
+    the stored unit index: its number, AGGREGATE for None. Per-core keys
+    keep socket, die and core, so S0-D0-C3 and S1-D0-C3 stay distinct;
+    unit_key() maps indices back.
+
+    Raises:
+        ValueError: If the key has no index, several indices in another
+                    layout, or a per-core field out of range.
+    """
+    if unit is None:
+        return AGGREGATE
+    m = _CORE_KEY.match(unit)
+    if m is not None:
+        socket, die, core = map(int, m.groups())
+        if socket >= 1 << 10 or die >= 1 << 8 or core >= 1 << 12:
+            raise ValueError(f"unit {unit!r} is out of range for the per-core encoding")
+        return _CORE_FLAG | socket << 20 | die << 12 | core
+    numbers = re.findall(r"\d+", unit)
+    if len(numbers) > 1:
+        raise ValueError(f"unit {unit!r} has more than one index")
+    m = _TRAILING_INT.search(unit)
+    if m is None:
+        raise ValueError(f"unit {unit!r} has no index")
+    return int(m.group(1))
+
+
+def unit_key(index: int) -> str:
+    """Inverse of unit_index for to_dict: "total", "S0-D0-C3" or the number as str."""
+    if index == AGGREGATE:
+        return "total"
+    if index & _CORE_FLAG:
+        return f"S{(index >> 20) & 0x3FF}-D{(index >> 12) & 0xFF}-C{index & 0xFFF}"
+    return str(index)
+
+
+class ChunkInfo(NamedTuple):
+    """
+    Header of one chunk file, used to skip chunks without reading columns.
+
+    Attributes:
+        path (str): Chunk file.
+        rows (int): Number of rows.
+        run_min (int): Smallest run ID in the chunk.
+        run_max (int): Largest run ID in the chunk.
+        events (frozenset): Event IDs present in the chunk.
+        offsets (Dict[str,int]): Column name -> byte offset in the file.
+        byteorder (str): Byte order the columns were written in ("little"/"big").
+    """
+
+    path: str
+    rows: int
+    run_min: int
+    run_max: int
+    events: frozenset
+    offsets: Dict[str, int]
+    byteorder: str
+
+
+def _write_chunk(path: str, columns: Dict[str, array]):
+    rows = len(columns["run"])
+    offsets: Dict[str, int] = {}
+    header = {
+        "rows": rows,
+        "run_min": min(columns["run"]),
+        "run_max": max(columns["run"]),
+        "events": sorted(set(columns["event"])),
+        "byteorder": sys.byteorder,
+        "offsets": offsets,
+    }
+    # offsets depend on the header length, which depends on the offsets;
+    # reserve room by sizing the header with placeholder offsets first
+    for name in COLUMNS:
+        offsets[name] = 1 << 62
+    start = _align(len(_MAGIC) + _HEADER_LEN.size + len(json.dumps(header)))
+    for name, code in COLUMNS.items():
+        offsets[name] = start
+        start = _align(start + rows * array(code).itemsize)
+    blob = json.dumps(header).encode()
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_MAGIC + _HEADER_LEN.pack(len(blob)) + blob)
+            for name in COLUMNS:
+                f.write(b"\0" * (offsets[name] - f.tell()))
+                columns[name].tofile(f)
+        # a chunk becomes visible only once complete
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _read_chunk_info(path: str) -> ChunkInfo:
+    with open(path, "rb") as f:
+        magic = f.read(len(_MAGIC))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a result store chunk")
+        (length,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(length))
+    return ChunkInfo(
+        path=path,
+        rows=header["rows"],
+        run_min=header["run_min"],
+        run_max=header["run_max"],
+        events=frozenset(header["events"]),
+        offsets=header["offsets"],
+        byteorder=header["byteorder"],
+    )
+
+
+class ResultStore:
+    """
+    Append-only columnar store for measurement sweeps.
+
+    Every counter value is one row of typed columns (see COLUMNS): run ID,
+    event ID, unit index (CHA, core or CPU; AGGREGATE for totals), value and
+    enabled/running nanoseconds. Rows are written in chunks of fixed-width
+    binary columns that are memory-mapped on read, so scans touch only the
+    projected columns and skip chunks whose run/event ranges cannot match.
+    Run parameters (the sweep configuration) live in runs.jsonl and event
+    strings in events.txt, both small and loaded eagerly.
+
+    Only one process may write a store at a time; readers may run
+    concurrently with the writer and see every flushed chunk.
+
+    Attributes:
+        path (str): Store directory.
+        chunk_rows (int): Rows buffered before a chunk is written.
+
+    Example:
+        with ResultStore("sweep.rks") as store:
+            for threads in (1, 2, 4):
+                res = perf_sample_uncore_event_many(f"./bench {threads}", [("0x35", "1")])
+                store.append_units({"threads": threads}, res)
+        totals = ResultStore("sweep.rks").totals("0x35", by=["threads"])
+    """
+
+    def __init__(self, path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        os.makedirs(os.path.join(path, "chunks"), exist_ok=True)
+        self._runs: List[Dict[str, Any]] = []
+        self._events: List[str] = []
+        self._event_ids: Dict[str, int] = {}
+        self._load_tables()
+        self._buffer = {name: array(code) for name, code in COLUMNS.items()}
+
+    def _load_tables(self):
+        runs_path = os.path.join(self.path, "runs.jsonl")
+        if os.path.exists(runs_path):
+            with open(runs_path) as f:
+                self._runs = [json.loads(line)["params"] for line in f if line.strip()]
+        events_path = os.path.join(self.path, "events.txt")
+        if os.path.exists(events_path):
+            with open(events_path) as f:
+                self._events = [line.rstrip("\n") for line in f]
+        self._event_ids = {e: i for i, e in enumerate(self._events)}
+
+    # writing
+
+    def add_run(self, params: Mapping[str, Any]) -> int:
+        """
+        Register a run (one configuration of the sweep) and return its ID.
+
+        Args:
+            params (Mapping[str,Any]): JSON serializable parameters, e.g.
+                                       {"cmd": "./bench", "threads": 4}.
+        """
+        run = len(self._runs)
+        with open(os.path.join(self.path, "runs.jsonl"), "a") as f:
+            f.write(json.dumps({"run": run, "params": dict(params)}, sort_keys=True) + "\n")
+        self._runs.append(dict(params))
+        return run
+
+    def event_id(self, event: str) -> int:
+        """Return the ID of an event string, registering it if new."""
+        eid = self._event_ids.get(event)
+        if eid is None:
+            assert "\n" not in event, "event strings cannot contain newlines"
+            eid = len(self._events)
+            with open(os.path.join(self.path, "events.txt"), "a") as f:
+                f.write(event + "\n")
+            self._events.append(event)
+            self._event_ids[event] = eid
+        return eid
+
+    def append(
+        self,
+        run: int,
+        event: str,
+        unit: int,
+        value: float,
+        enabled: int = 0,
+        running: int = 0,
+    ):
+        """Buffer one row, writing a chunk when chunk_rows are buffered."""
+        buf = self._buffer
+        buf["run"].append(run)
+        buf["event"].append(self.event_id(event))
+        buf["unit"].append(unit)
+        buf["value"].append(value)
+        buf["enabled"].append(enabled)
+        buf["running"].append(running)
+        if len(buf["run"]) >= self.chunk_rows:
+            self.flush()
+
+    def append_counts(
+        self, params: Mapping[str, Any], result: Union[ScheduledResult, Mapping[str, Union[int, float]]]
+    ) -> int:
+        """
+        Store aggregate counts (perf_sample_core_events, ScheduledResult) as a new run.
+
+        Returns:
+            int: The run ID.
+        """
+        run = self.add_run(params)
+        if isinstance(result, ScheduledResult):
+            for event, value in result.counts.items():
+                meta = result.meta.get(event)
+                running = 0 if meta is None else meta.run_time
+                enabled = running if meta is None or meta.pct_enabled == 0 else int(running * 100.0 / meta.pct_enabled)
+                self.append(run, event, AGGREGATE, value, enabled, running)
+        else:
+            for event, value in result.items():
+                self.append(run, event, AGGREGATE, value)
+        return run
+
+    def append_units(self, params: Mapping[str, Any], result: Mapping[str, Mapping[str, Union[int, float]]]) -> int:
+        """
+        Store event -> unit -> value results (per-CHA, per-core, per-instance
+        dicts) as a new run.
+
+        Returns:
+            int: The run ID.
+        """
+        run = self.add_run(params)
+        for event, per_unit in result.items():
+            for unit, value in per_unit.items():
+                self.append(run, event, unit_index(unit), value)
+        return run
+
+    def append_matrix(self, params: Mapping[str, Any], matrix: CounterMatrix) -> List[int]:
+        """
+        Store a per-core CounterMatrix as one run per socket (params plus
+        "socket"), with core IDs as unit indices. NaN cells are skipped.
+
+        Returns:
+            List[int]: The run IDs, in matrix.sockets order.
+        """
+        return [self.append_units(dict(params, socket=s), matrix.as_dict(s)) for s in matrix.sockets]
+
+    def flush(self):
+        """Write buffered rows as a new chunk."""
+        rows = len(self._buffer["run"])
+        if rows == 0:
+            return
+        chunk_dir = os.path.join(self.path, "chunks")
+        index = len([n for n in os.listdir(chunk_dir) if n.endswith(".chunk")])
+        _write_chunk(os.path.join(chunk_dir, f"{index:08d}.chunk"), self._buffer)
+        self._buffer = {name: array(code) for name, code in COLUMNS.items()}
+
+    def close(self):
+        """Flush remaining rows."""
+        self.flush()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # reading
+
+    @property
+    def events(self) -> List[str]:
+        """Event strings, indexed by event ID."""
+        return list(self._events)
+
+    def runs(self, where: Optional[Mapping[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Return run ID -> parameters of runs matching where.
+
+        Args:
+            where (Optional[Mapping[str,Any]]): Parameter -> required value, a
+                list/tuple/set of accepted values, or a predicate. Runs
+                missing a parameter never match it.
+        """
+        res: Dict[int, Dict[str, Any]] = {}
+        for run, params in enumerate(self._runs):
+            if where is None or all(_matches(params, k, v) for k, v in where.items()):
+                res[run] = params
+        return res
+
+    def chunks(self) -> List[ChunkInfo]:
+        """Return the headers of all written chunks, oldest first."""
+        chunk_dir = os.path.join(self.path, "chunks")
+        names = sorted(n for n in os.listdir(chunk_dir) if n.endswith(".chunk"))
+        return [_read_chunk_info(os.path.join(chunk_dir, n)) for n in names]
+
+    def scan(
+        self,
+        columns: Optional[List[str]] = None,
+        where: Optional[Mapping[str, Any]] = None,
+        events: Optional[List[str]] = None,
+    ) -> Iterator[Dict[str, array]]:
+        """
+        Yield the selected columns chunk by chunk.
+
+        Columns are read from memory maps; only the projected columns (plus
+        run/event when filtering) are touched and chunks whose run range or
+        event set cannot match are skipped without reading their columns.
+
+        Args:
+            columns (Optional[List[str]]): Columns to return, default all of COLUMNS.
+            where (Optional[Mapping[str,Any]]): Run parameter filter, see runs().
+            events (Optional[List[str]]): Only rows of these events.
+
+        Yields:
+            Dict[str,array]: Column name -> values of the matching rows of one chunk.
+        """
+        columns = list(COLUMNS) if columns is None else columns
+        for name in columns:
+            if name not in COLUMNS:
+                raise ValueError(f"unknown column {name}, columns are {list(COLUMNS)}")
+        run_ids = None if where is None else set(self.runs(where))
+        event_ids = None
+        if events is not None:
+            event_ids = {self._event_ids[e] for e in events if e in self._event_ids}
+        if (run_ids is not None and not run_ids) or (event_ids is not None and not event_ids):
+            return
+        for info in self.chunks():
+            if run_ids is not None and not any(info.run_min <= r <= info.run_max for r in run_ids):
+                continue
+            if event_ids is not None and info.events.isdisjoint(event_ids):
+                continue
+            yield _read_columns(info, columns, run_ids, event_ids)
+        # rows not yet flushed are visible to the writer's own reads
+        if len(self._buffer["run"]) > 0:
+            yield _filter(dict(self._buffer), columns, run_ids, event_ids)
+
+    def load(
+        self,
+        columns: Optional[List[str]] = None,
+        where: Optional[Mapping[str, Any]] = None,
+        events: Optional[List[str]] = None,
+    ) -> Dict[str, array]:
+        """
+        Return the selected columns of all matching rows, see scan().
+        """
+        columns = list(COLUMNS) if columns is None else columns
+        res = {name: array(COLUMNS[name]) for name in columns}
+        for chunk in self.scan(columns, where, events):
+            for name in columns:
+                res[name].extend(chunk[name])
+        return res
+
+    def totals(
+        self,
+        event: str,
+        by: Optional[List[str]] = None,
+        where: Optional[Mapping[str, Any]] = None,
+        reduce: Callable[[List[float]], float] = sum,
+    ) -> Dict[Tuple, float]:
+        """
+        Sum an event over units within each run, then reduce runs grouped by parameters.
+
+        Args:
+            event (str): Event string as stored.
+            by (Optional[List[str]]): Parameters to group runs by, default the run ID.
+            where (Optional[Mapping[str,Any]]): Run parameter filter, see runs().
+            reduce (Callable[[List[float]],float]): Combines the per-run totals
+                of a group, e.g. statistics.mean for repeated runs.
+
+        Returns:
+            Dict[Tuple,float]: Tuple of the by parameter values (or (run,)) -> value.
+        """
+        per_run: Dict[int, float] = {}
+        for chunk in self.scan(["run", "value"], where, [event]):
+            for run, value in zip(chunk["run"], chunk["value"]):
+                per_run[run] = per_run.get(run, 0.0) + value
+        groups: Dict[Tuple, List[float]] = {}
+        for run, total in per_run.items():
+            params = self._runs[run]
+            key = (run,) if by is None else tuple(params.get(p) for p in by)
+            groups.setdefault(key, []).append(total)
+        return {key: reduce(values) for key, values in groups.items()}
+
+    def to_dict(self, run: int) -> Dict[str, Dict[str, float]]:
+        """
+        Rebuild the event -> unit (as str) -> value dict of one run; aggregate
+        values are under the unit key "total".
+        """
+        res: Dict[str, Dict[str, float]] = {}
+        for chunk in self.scan(["run", "event", "unit", "value"]):
+            for eid, unit, value, r in zip(chunk["event"], chunk["unit"], chunk["value"], chunk["run"]):
+                if r == run:
+                    res.setdefault(self._events[eid], {})[unit_key(unit)] = value
+        return res
+
+
+def _matches(params: Mapping[str, Any], key: str, want: Any) -> bool:
+    if key not in params:
+        return False
+    have = params[key]
+    if callable(want):
+        return bool(want(have))
+    if isinstance(want, (list, tuple, set, frozenset)):
+        return have in want
+    return have == want
+
+
+def _filter(
+    columns: Dict[str, Any],
+    names: List[str],
+    run_ids: Optional[set],
+    event_ids: Optional[set],
+) -> Dict[str, array]:
+    mask = None
+    if run_ids is not None:
+        mask = array("b", map(run_ids.__contains__, columns["run"]))
+    if event_ids is not None:
+        emask = array("b", map(event_ids.__contains__, columns["event"]))
+        mask = emask if mask is None else array("b", map(min, mask, emask))
+    if mask is None:
+        return {name: array(COLUMNS[name], columns[name]) for name in names}
+    return {name: array(COLUMNS[name], compress(columns[name], mask)) for name in names}
+
+
+def _read_columns(
+    info: ChunkInfo,
+    names: List[str],
+    run_ids: Optional[set],
+    event_ids: Optional[set],
+) -> Dict[str, array]:
+    needed = set(names)
+    if run_ids is not None:
+        needed.add("run")
+    if event_ids is not None:
+        needed.add("event")
+    if info.byteorder != sys.byteorder:
+        raise ValueError(f"{info.path} was written on a {info.byteorder} endian machine")
+    if info.rows == 0:
+        return {name: array(COLUMNS[name]) for name in names}
+    with open(info.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        base = memoryview(mm)
+        views = {}
+        try:
+            for name in needed:
+                code = COLUMNS[name]
+                start = info.offsets[name]
+                views[name] = base[start : start + info.rows * array(code).itemsize].cast(code)
+            # only the filtered result is copied out of the map
+            return _filter(views, names, run_ids, event_ids)
+        finally:
+            # the map cannot be closed while views into it exist
+            for view in views.values():
+                view.release()
+            base.release()
@@ -0,0 +1,241 @@
+import glob
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_range_list(s: str) -> List[int]:
+    """
+    Convert a string representing ranges into a list of integers.
+
+    Args:
+        s (str): Range string, e.g., "0-3,5,7-8". Empty strings (as found
+                 in sysfs for memory-only NUMA nodes) yield an empty list.
+
+    Returns:
+        List[int]: Expanded list of integers from the range string.
+    """
+    result = []
+    for part in s.strip().split(","):
+        if part == "":
+            continue
+        if "-" in part:
+            start, end = map(int, part.split("-"))
+            result.extend(range(start, end + 1))
+        else:
+            result.append(int(part))
+    return result
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cache_name(level: str, cache_type: str) -> str:
+    # matches the NAME column of `lscpu -C` (L1d, L1i, L2, L3)
+    suffix = {"Data": "d", "Instruction": "i"}.get(cache_type, "")
+    return f"L{level}{suffix}"
+
+
+class Topology:
+    """
+    Snapshot of the CPU/NUMA/cache topology read from sysfs.
+
+    All lookups are served from indexes built once by refresh(), so no
+    subprocess (lscpu) is needed per query. Use get_topology() to share a
+    single instance per process.
+
+    Attributes:
+        sysfs_root (str): Root of the sysfs tree (normally "/sys").
+        cpus (List[int]): Online CPU IDs in ascending order.
+        nodes (List[int]): NUMA node IDs in ascending order.
+        packages (List[int]): Physical package (socket) IDs in ascending order.
+    """
+
+    def __init__(self, sysfs_root: str = "/sys"):
+        self.sysfs_root = sysfs_root
+        self.refresh()
+
+    def refresh(self) -> "Topology":
+        """
+        Re-read sysfs and rebuild every index (e.g. after CPU hotplug).
+
+        Returns:
+            Topology: self, to allow chaining.
+
+        Raises:
+            RuntimeError: If no CPUs are found under sysfs_root.
+        """
+        cpu_dir = os.path.join(self.sysfs_root, "devices/system/cpu")
+        node_dir = os.path.join(self.sysfs_root, "devices/system/node")
+
+        online = _read(os.path.join(cpu_dir, "online"))
+        if online is not None:
+            cpus = parse_range_list(online)
+        else:
+            cpus = sorted(
+                int(os.path.basename(p)[3:])
+                for p in glob.glob(os.path.join(cpu_dir, "cpu[0-9]*"))
+            )
+        if len(cpus) == 0:
+            raise RuntimeError(f"no cpus found under {cpu_dir}")
+        self.cpus: List[int] = cpus
+
+        # NUMA nodes, falling back to a single node on non-NUMA kernels
+        self._node_cpus: Dict[int, List[int]] = {}
+        for path in glob.glob(os.path.join(node_dir, "node[0-9]*")):
+            node = int(os.path.basename(path)[4:])
+            cpulist = _read(os.path.join(path, "cpulist")) or ""
+            self._node_cpus[node] = parse_range_list(cpulist)
+        if len(self._node_cpus) == 0:
+            self._node_cpus[0] = list(cpus)
+        self.nodes: List[int] = sorted(self._node_cpus)
+        self._cpu_node: Dict[int, int] = {
+            cpu: node for node, ncpus in self._node_cpus.items() for cpu in ncpus
+        }
+
+        self._cpu_package: Dict[int, int] = {}
+        self._cpu_core: Dict[int, Tuple[int, int]] = {}
+        self._core_cpus: Dict[Tuple[int, int], List[int]] = {}
+        self._package_cpus: Dict[int, List[int]] = {}
+        # cache name -> cache id -> cpus sharing it
+        self._cache_groups: Dict[str, Dict[int, List[int]]] = {}
+        self._cpu_cache_id: Dict[Tuple[int, str], int] = {}
+        self._cache_info: Dict[str, Dict[str, str]] = {}
+
+        for cpu in cpus:
+            topo = os.path.join(cpu_dir, f"cpu{cpu}", "topology")
+            package = int(_read(os.path.join(topo, "physical_package_id")) or 0)
+            core_id = int(_read(os.path.join(topo, "core_id")) or cpu)
+            self._cpu_package[cpu] = package
+            self._cpu_core[cpu] = (package, core_id)
+            self._core_cpus.setdefault((package, core_id), []).append(cpu)
+            self._package_cpus.setdefault(package, []).append(cpu)
+            self._read_caches(cpu, os.path.join(cpu_dir, f"cpu{cpu}", "cache"))
+
+        self.packages: List[int] = sorted(self._package_cpus)
+        return self
+
+    def _read_caches(self, cpu: int, cache_dir: str):
+        for index in glob.glob(os.path.join(cache_dir, "index[0-9]*")):
+            level = _read(os.path.join(index, "level"))
+            cache_type = _read(os.path.join(index, "type"))
+            shared = _read(os.path.join(index, "shared_cpu_list"))
+            if level is None or cache_type is None or shared is None:
+                continue
+            name = _cache_name(level, cache_type)
+            sharing = parse_range_list(shared)
+            # the id file is missing on some older kernels, use the lowest sharer
+            cache_id = int(_read(os.path.join(index, "id")) or min(sharing, default=cpu))
+            self._cpu_cache_id[(cpu, name)] = cache_id
+            self._cache_groups.setdefault(name, {})[cache_id] = sharing
+            if name not in self._cache_info:
+                self._cache_info[name] = {
+                    "level": level,
+                    "type": cache_type,
+                    "size": _read(os.path.join(index, "size")) or "",
+                    "ways": _read(os.path.join(index, "ways_of_associativity")) or "",
+                    "sets": _read(os.path.join(index, "number_of_sets")) or "",
+                    "coherency-size": _read(os.path.join(index, "coherency_line_size")) or "",
+                }
+
+    def node_of(self, cpu: int) -> int:
+        """
+        Return the NUMA node a CPU belongs to.
+
+        Raises:
+            ValueError: If the cpu is not online.
+        """
+        try:
+            return self._cpu_node[cpu]
+        except KeyError:
+            raise ValueError(f"{cpu} not in any socket")
+
+    def node_cpus(self, node: int) -> List[int]:
+        """
+        Return the CPU IDs belonging to a NUMA node.
+
+        Raises:
+            ValueError: If the node does not exist.
+        """
+        try:
+            return self._node_cpus[node]
+        except KeyError:
+            raise ValueError(f"NUMA node {node} does not exist (nodes are {self.nodes})")
+
+    def package_of(self, cpu: int) -> int:
+        """Return the physical package (socket) ID of a CPU."""
+        return self._cpu_package[cpu]
+
+    def package_cpus(self, package: int) -> List[int]:
+        """Return the CPU IDs belonging to a physical package."""
+        return self._package_cpus[package]
+
+    def core_of(self, cpu: int) -> Tuple[int, int]:
+        """Return the (package, core_id) pair of a CPU, as perf --per-core reports it."""
+        return self._cpu_core[cpu]
+
+    def core_ids(self, package: int) -> List[int]:
+        """Return the sorted core IDs present in a physical package."""
+        return sorted(core for pkg, core in self._core_cpus if pkg == package)
+
+    def smt_siblings(self, cpu: int) -> List[int]:
+        """Return all hardware threads sharing a physical core with cpu (including itself)."""
+        return self._core_cpus[self._cpu_core[cpu]]
+
+    def cache_names(self) -> List[str]:
+        """Return the cache names present, e.g. ["L1d", "L1i", "L2", "L3"]."""
+        return sorted(self._cache_info)
+
+    def cache_info(self, name: str) -> Dict[str, str]:
+        """Return the static properties (level, type, size, ways, ...) of a cache."""
+        return self._cache_info[name]
+
+    def cache_id(self, cpu: int, name: str) -> int:
+        """Return the ID of the cache instance of the given name used by cpu."""
+        return self._cpu_cache_id[(cpu, name)]
+
+    def cache_sharing(self, cpu: int, name: str) -> List[int]:
+        """Return the CPUs sharing the given cache (e.g. "L3") with cpu."""
+        return self._cache_groups[name][self._cpu_cache_id[(cpu, name)]]
+
+    def cache_groups(self, name: str) -> Dict[int, List[int]]:
+        """Return a mapping of cache instance ID -> CPUs sharing that instance."""
+        return self._cache_groups.get(name, {})
+
+    def fingerprint(self) -> str:
+        """
+        Return a short stable hash of the topology (cpus, nodes, cores, caches),
+        used to tell apart results measured on differently shaped machines.
+        """
+        parts = [
+            repr(sorted(self._cpu_node.items())),
+            repr(sorted(self._cpu_core.items())),
+            repr(sorted((k, sorted(v.items())) for k, v in self._cache_groups.items())),
+            repr(sorted((k, sorted(v.items())) for k, v in self._cache_info.items())),
+        ]
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+_topologies: Dict[str, Topology] = {}
+
+
+def get_topology(sysfs_root: str = "/sys") -> Topology:
+    """
+    Return the process-wide Topology for a sysfs root, building it on first use.
+
+    Args:
+        sysfs_root (str): Root of the sysfs tree, overridable for fixture trees.
+
+    Returns:
+        Topology: The memoized topology. Call .refresh() on it to re-read sysfs.
+    """
+    topo = _topologies.get(sysfs_root)
+    if topo is None:
+        topo = Topology(sysfs_root)
+        _topologies[sysfs_root] = topo
+    return topo
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from synthetic import Shape, make_sysfs  # noqa: E402
+
+
+@pytest.fixture
+def shape() -> Shape:
+    return Shape("tiny", 2, 4, 4, 2)
+
+
+@pytest.fixture
+def sysfs(tmp_path, shape) -> str:
+    root = str(tmp_path / "sys")
+    make_sysfs(root, shape)
+    return root
@@ -0,0 +1,119 @@
+"""
+Synthetic machines, sysfs trees and perf output shared by the tests and
+benchmarks/bench_rykit.py. No PMU, perf binary or root access is needed.
+"""
+
+import os
+import random
+from typing import List, NamedTuple
+
+
+class Shape(NamedTuple):
+    """Synthetic machine: sockets x cores_per_socket x 2 threads, CHAs and events."""
+
+    name: str
+    sockets: int
+    cores_per_socket: int
+    chas: int
+    events: int
+
+
+def event_codes(n: int) -> List[str]:
+    return [f"0x{0x30 + i:x}" for i in range(n)]
+
+
+def core_event_names(n: int) -> List[str]:
+    return [f"cpu/event=0x{0x10 + i:x},umask=0x1/" for i in range(n)]
+
+
+def uncore_output(shape: Shape, rng: random.Random) -> str:
+    # perf stat -a -x ; over every CHA of every event
+    lines = []
+    for code in event_codes(shape.events):
+        for cha in range(shape.chas):
+            lines.append(
+                f"{rng.randrange(1 << 32)};;uncore_cha_{cha}/event={code},umask=0x1/;{rng.randrange(1 << 30)};100.00;;"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def per_core_output(shape: Shape, rng: random.Random) -> str:
+    lines = []
+    for event in core_event_names(shape.events):
+        for s in range(shape.sockets):
+            for c in range(shape.cores_per_socket):
+                lines.append(f"S{s}-D0-C{c};2;{rng.randrange(1 << 40)};;{event};{rng.randrange(1 << 30)};100.00;;")
+    return "\n".join(lines) + "\n"
+
+
+def interval_output(shape: Shape, rng: random.Random, intervals: int = 10) -> str:
+    lines = []
+    for i in range(intervals):
+        ts = f"{i + 1:.9f}"
+        for code in event_codes(shape.events):
+            for cha in range(shape.chas):
+                lines.append(f"{ts};{rng.randrange(1 << 24)};;uncore_cha_{cha}/event={code},umask=0x1/;{rng.randrange(1 << 30)};100.00;;")
+    return "\n".join(lines) + "\n"
+
+
+def make_sysfs(root: str, shape: Shape):
+    # devices/system/{cpu,node} with 2 threads per core, one L3 per socket,
+    # private L1/L2 per core, plus devices/uncore_cha_N
+    def write(path: str, text: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+    cores = shape.sockets * shape.cores_per_socket
+    cpus = 2 * cores
+    cpu_dir = os.path.join(root, "devices/system/cpu")
+    write(os.path.join(cpu_dir, "online"), f"0-{cpus - 1}")
+    for cpu in range(cpus):
+        core = cpu % cores
+        socket = core // shape.cores_per_socket
+        siblings = f"{core},{core + cores}"
+        base = os.path.join(cpu_dir, f"cpu{cpu}")
+        write(os.path.join(base, "topology/physical_package_id"), str(socket))
+        write(os.path.join(base, "topology/core_id"), str(core % shape.cores_per_socket))
+        first = socket * shape.cores_per_socket
+        last = first + shape.cores_per_socket - 1
+        caches = [
+            ("1", "Data", siblings, core, "48K"),
+            ("1", "Instruction", siblings, core, "32K"),
+            ("2", "Unified", siblings, core, "2048K"),
+            ("3", "Unified", f"{first}-{last},{first + cores}-{last + cores}", socket, "105M"),
+        ]
+        for i, (level, kind, shared, cid, size) in enumerate(caches):
+            index = os.path.join(base, f"cache/index{i}")
+            write(os.path.join(index, "level"), level)
+            write(os.path.join(index, "type"), kind)
+            write(os.path.join(index, "shared_cpu_list"), shared)
+            write(os.path.join(index, "id"), str(cid))
+            write(os.path.join(index, "size"), size)
+    for socket in range(shape.sockets):
+        first = socket * shape.cores_per_socket
+        last = first + shape.cores_per_socket - 1
+        write(os.path.join(root, f"devices/system/node/node{socket}/cpulist"), f"{first}-{last},{first + cores}-{last + cores}")
+    for cha in range(shape.chas):
+        os.makedirs(os.path.join(root, f"devices/uncore_cha_{cha}"), exist_ok=True)
+
+
+def lscpu_output(shape: Shape) -> str:
+    cpus = 2 * shape.sockets * shape.cores_per_socket
+    fields = {
+        "Architecture": "x86_64",
+        "CPU(s)": str(cpus),
+        "Thread(s) per core": "2",
+        "Core(s) per socket": str(shape.cores_per_socket),
+        "Socket(s)": str(shape.sockets),
+        "NUMA node(s)": str(shape.sockets),
+        "L3 cache": f"{105 * shape.sockets} MiB ({shape.sockets} instances)",
+    }
+    return "\n".join(f"{k}:{' ' * (33 - len(k))}{v}" for k, v in fields.items()) + "\n"
+
+
+def lscpu_cache_output(shape: Shape) -> str:
+    rows = ["NAME ONE-SIZE ALL-SIZE WAYS TYPE        LEVEL SETS PHY-LINE COHERENCY-SIZE"]
+    rows.append(f"L1d       48K  {48 * shape.sockets * shape.cores_per_socket}K   12 Data            1   64        1             64")
+    rows.append(f"L3       105M  {105 * shape.sockets}M   15 Unified         3 114688      1             64")
+    return "\n".join(rows) + "\n"
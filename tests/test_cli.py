@@ -0,0 +1,23 @@
+import pytest
+
+from rykit import cli
+from rykit.cmd import CommandFailed, CommandTimeout
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        CommandFailed(1),
+        CommandTimeout("./bench", 5),
+        RuntimeError("perf daemon closed the connection"),
+        FileNotFoundError(2, "No such file or directory", "perf"),
+    ],
+)
+def test_errors_are_reported_without_traceback(monkeypatch, capsys, error):
+    def fail(args, out):
+        raise error
+
+    monkeypatch.setattr(cli, "_stat", fail)
+    assert cli.main(["stat", "-e", "cycles", "--", "true"]) == 1
+    err = capsys.readouterr().err
+    assert err == f"rykit: error: {error}\n"
@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+from rykit.perf_catalog import PerfCatalog, parse_format
+
+
+@pytest.fixture
+def catalog() -> PerfCatalog:
+    cpu_fields = {"event": parse_format("config:0-7"), "umask": parse_format("config:8-15")}
+    cha_fields = {"event": parse_format("config:0-7"), "umask": parse_format("config:8-15,32-55")}
+    return PerfCatalog(
+        pmus={"cpu": 4, "uncore_cha_0": 30, "uncore_cha_1": 31, "uncore_imc_0": 40},
+        formats={"cpu": cpu_fields, "uncore_cha_0": cha_fields, "uncore_cha_1": cha_fields, "uncore_imc_0": cpu_fields},
+        aliases={"cpu": {"mem-loads": "event=0xcd,umask=0x1"}, "uncore_cha_0": {}, "uncore_cha_1": {}, "uncore_imc_0": {}},
+        named={"l2_rqsts.miss": "cpu/event=0x24,umask=0x3f/"},
+    )
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        "cycles",
+        "CYCLES",
+        "cycles:u",
+        "instructions:ppp",
+        "L1-dcache-load-misses",
+        "l1-dcache-prefetches",
+        "LLC-load-misses",
+        "dTLB-stores",
+        "r01c2",
+        "r1a8:u",
+        "sched:sched_switch",
+        "L2_RQSTS.MISS",
+        "mem-loads",
+        "cpu/event=0xc0,umask=0x1/",
+        "cpu/mem-loads/",
+        "cpu/event=0x3c,name=cyc,period=1000/",
+        "uncore_cha_0/event=0xb3,umask=0x8/",
+        "uncore_cha/event=0x1/",
+        "uncore_imc/event=0x4,umask=0x3/",
+        "{cycles,instructions}",
+    ],
+)
+def test_accepts(catalog, event):
+    assert catalog.check(event) == []
+
+
+def test_unknown_name_only_warns(catalog, caplog):
+    with caplog.at_level(logging.WARNING, logger="rykit.perf_catalog"):
+        assert catalog.check("not_an_event_xyz") == []
+    assert "not_an_event_xyz" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "event, problem",
+    [
+        ("cpux/event=0x1/", "unknown PMU cpux"),
+        ("uncore_ch/event=0x1/", "unknown PMU uncore_ch"),
+        ("uncore_imc/event=0x100/", "does not fit in 8 bits"),
+        ("cpu/evnt=0x1/", "cpu has no field or event evnt"),
+        ("cpu/event=0x100/", "does not fit in 8 bits"),
+        ("cpu/umask=zz/", "not an integer"),
+    ],
+)
+def test_rejects(catalog, event, problem):
+    problems = catalog.check(event)
+    assert len(problems) == 1 and problem in problems[0]
+
+
+def test_validate_lists_every_problem(catalog):
+    with pytest.raises(ValueError) as e:
+        catalog.validate(["cycles", "cpux/event=0x1/", "cpu/event=0x100/"])
+    assert "cpux" in str(e.value) and "8 bits" in str(e.value)
+
+
+def test_resolve(catalog):
+    assert catalog.resolve("l2_rqsts.miss") == "cpu/event=0x24,umask=0x3f/"
+    assert catalog.resolve("L2_RQSTS.MISS") == "cpu/event=0x24,umask=0x3f/"
+    assert catalog.resolve("cpu/mem-loads/") == "cpu/event=0xcd,umask=0x1/"
+
+
+def test_encode_instanceless_pmu(catalog):
+    assert catalog.encode("uncore_cha/event=0x1,umask=0x100/") == {"config": 0x1 | (1 << 32)}
+
+
+def test_json_round_trip(catalog):
+    again = PerfCatalog.from_json(catalog.to_json())
+    assert again.formats == catalog.formats
+    assert again.check("cpu/event=0x100/") == catalog.check("cpu/event=0x100/")
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from rykit.cmd import CommandFailed, CommandTimeout, arun_perf_read_stderr, run_perf_read_stderr, stream_perf_stdout
+from rykit.perf_daemon import PerfDaemon, _connect, daemon_running, stream_job
+
+# stands in for perf: skips its arguments up to --, runs the workload and,
+# like perf stat, prints a count on exit and on SIGINT
+FAKE_PERF = """#!/bin/sh
+while [ $# -gt 0 ] && [ "$1" != "--" ]; do shift; done
+[ "$1" = "--" ] && shift
+trap : INT
+echo "starting" >&2
+"$@"
+rc=$?
+echo "456;;cycles;100;100.00;;" >&2
+exit $rc
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    perf = tmp_path / "perf"
+    perf.write_text(FAKE_PERF)
+    perf.chmod(0o755)
+    path = str(tmp_path / "daemon.sock")
+    server = PerfDaemon(path, perf=str(perf))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("RYKIT_PERF_DAEMON", path)
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_streams_stderr(daemon, tmp_path):
+    assert daemon_running(daemon)
+    lines = stream_job(["stat", "-x", ";", "-e", "cycles", "--"], "echo out; echo err >&2", daemon)
+    assert list(lines) == ["starting", "err", "456;;cycles;100;100.00;;"]
+    # workloads keep their shell syntax and the caller's cwd
+    out = tmp_path / "out.txt"
+    os.chdir(tmp_path)
+    run_perf_read_stderr(["stat", "--"], "echo hi > out.txt && echo ok >&2")
+    assert out.read_text() == "hi\n"
+
+
+def test_nonzero_exit_raises_command_failed(daemon):
+    with pytest.raises(CommandFailed) as e:
+        run_perf_read_stderr(["stat", "--"], "exit 3")
+    assert e.value.returncode == 3
+    assert "456;;cycles" in e.value.output
+    # 124 is a timeout inside the workload firing as intended
+    assert "456;;cycles" in run_perf_read_stderr(["stat", "--"], "exit 124")
+
+
+def test_disconnect_stops_the_job(daemon, tmp_path):
+    pidfile = tmp_path / "pid"
+    lines = stream_job(["stat", "--"], f"echo $$ > {pidfile}; sleep 30", daemon)
+    assert next(lines) == "starting"
+    while not pidfile.exists() or not pidfile.read_text().strip():
+        time.sleep(0.01)
+    pid = int(pidfile.read_text())
+    lines.close()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+    pytest.fail("workload still running after the client disconnected")
+
+
+def test_async_timeout_keeps_final_counts(daemon):
+    async def run():
+        return await arun_perf_read_stderr(["stat", "--"], "sleep 30", timeout=0.5)
+
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout) as e:
+        asyncio.run(run())
+    assert time.monotonic() - start < 10
+    assert "starting" in e.value.output
+    assert "456;;cycles" in e.value.output
+
+
+def test_ignores_socket_writable_by_others(daemon):
+    os.chmod(daemon, 0o666)
+    try:
+        assert _connect(daemon) is None
+    finally:
+        os.chmod(daemon, stat.S_IRUSR | stat.S_IWUSR)
+    assert _connect(daemon) is not None
+
+
+def test_ignores_non_socket(tmp_path):
+    path = tmp_path / "not-a-socket"
+    path.write_text("")
+    os.chmod(str(path), 0o600)
+    assert _connect(str(path)) is None
+
+
+def test_streams_stdout(daemon, tmp_path):
+    # stands in for perf script, which reports on stdout: the fake perf runs
+    # whatever follows its --
+    script = tmp_path / "script"
+    script.write_text("#!/bin/sh\necho sample1\necho sample2\necho noise >&2\n")
+    script.chmod(0o755)
+    assert list(stream_perf_stdout(["script", "--", str(script)])) == ["sample1", "sample2"]
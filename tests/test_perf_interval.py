@@ -0,0 +1,24 @@
+import random
+
+from synthetic import event_codes, interval_output
+
+from rykit.perf_interval import IntervalRecord, build_perf_interval_args, interpret_interval_line
+
+
+def test_interval_lines(shape):
+    lines = interval_output(shape, random.Random(0), intervals=2).splitlines()
+    records = [interpret_interval_line(line) for line in lines]
+    assert len(records) == 2 * shape.events * shape.chas
+    first = records[0]
+    assert (first.timestamp, first.event, first.unit) == (1.0, event_codes(1)[0], "0")
+    assert records[-1].timestamp == 2.0
+    assert interpret_interval_line("1.0;<not counted>;;cycles;0;0.00;;") is None
+    assert interpret_interval_line("1.5;S0-D0-C2;2;9;;cycles;1;100.00;;") == IntervalRecord(1.5, "cycles", "S0-D0-C2", 9)
+
+
+def test_interval_args():
+    args = build_perf_interval_args(["cycles", "instructions"], 100, system_wide=True)
+    assert args[:1] == ["stat"]
+    assert "-I" in args and args[args.index("-I") + 1] == "100"
+    assert "-a" in args
+    assert args.count("-e") == 2
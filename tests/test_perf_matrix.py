@@ -0,0 +1,48 @@
+import logging
+import math
+import random
+
+import pytest
+from synthetic import core_event_names, per_core_output
+
+from rykit.perf_matrix import CounterMatrix
+from rykit.perf_parse import parse_perf_stat_line
+from rykit.perf_sample import interpret_per_core_matrix
+from rykit.topology import Topology
+
+
+def test_per_core_matrix(sysfs, shape):
+    output = per_core_output(shape, random.Random(0))
+    events = core_event_names(shape.events)
+    mat = interpret_per_core_matrix(output, events, Topology(sysfs))
+    assert mat.shape == (shape.events, shape.sockets, shape.cores_per_socket)
+    for line in map(parse_perf_stat_line, output.splitlines()):
+        socket, core = int(line.agg[1]), int(line.agg.rsplit("C", 1)[1])
+        assert mat.get(line.event, socket, core) == line.value
+
+
+def test_cores_outside_the_topology_are_skipped(sysfs, caplog):
+    output = "S0-D0-C1;2;10;;cycles;1;100.00;;\nS0-D0-C99;2;20;;cycles;1;100.00;;\nS7-C0;2;30;;cycles;1;100.00;;\n"
+    with caplog.at_level(logging.WARNING, logger="rykit.perf_sample"):
+        mat = interpret_per_core_matrix(output, ["cycles"], Topology(sysfs))
+    assert mat.get("cycles", 0, 1) == 10
+    assert mat.total("cycles") == 10
+    assert "S0-D0-C99" in caplog.text and "S7-C0" in caplog.text
+
+
+def test_same_core_on_two_dies_is_rejected(sysfs):
+    output = "S0-D0-C1;2;10;;cycles;1;100.00;;\nS0-D1-C1;2;20;;cycles;1;100.00;;\n"
+    with pytest.raises(ValueError):
+        interpret_per_core_matrix(output, ["cycles"], Topology(sysfs))
+
+
+def test_ratio_with_zero_denominators():
+    mat = CounterMatrix(["instructions", "cycles"], [0], [0, 1, 2, 3])
+    for core, (ins, cyc) in enumerate([(10, 5), (3, 0), (0, -0.0), (8, 4)]):
+        mat.set("instructions", 0, core, ins)
+        mat.set("cycles", 0, core, cyc)
+    ipc = mat.ratio("instructions", "cycles")
+    values = list(ipc.plane("instructions/cycles"))
+    assert values[0] == 2.0 and values[3] == 2.0
+    assert math.isnan(values[1]) and math.isnan(values[2])
+    assert mat.normalize("cycles").get("cycles", 0, 0) == 1.0
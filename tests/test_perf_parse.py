@@ -0,0 +1,44 @@
+import random
+
+from synthetic import event_codes, uncore_output
+
+from rykit.perf_parse import base_event, index_perf_stat, lookup_event, parse_perf_stat_line
+from rykit.perf_sample_intel import interpret_uncore_event_many
+
+
+def test_parse_csv_line():
+    line = parse_perf_stat_line("123456;;cycles;2000;50.00;;")
+    assert line.value == 123456
+    assert line.event == "cycles"
+    assert line.agg is None and line.timestamp is None
+    assert line.run_time == 2000 and line.pct_enabled == 50.0
+
+
+def test_parse_not_counted_and_headers():
+    assert parse_perf_stat_line("<not counted>;;instructions;0;0.00;;").value is None
+    assert parse_perf_stat_line("# started on Mon") is None
+    assert parse_perf_stat_line("   ") is None
+
+
+def test_parse_per_core_and_interval_prefixes():
+    line = parse_perf_stat_line("S1-D0-C3;2;77;;cycles;100;100.00;;")
+    assert (line.agg, line.value, line.event) == ("S1-D0-C3", 77, "cycles")
+    line = parse_perf_stat_line("2.000100;CPU5;42;;instructions;100;100.00;;")
+    assert (line.timestamp, line.agg, line.value) == (2.0001, "CPU5", 42)
+
+
+def test_index_and_lookup_modified_names():
+    index = index_perf_stat("10;;cycles:u;1;100.00;;\n20;;instructions;1;100.00;;\n")
+    assert base_event("cycles:u") == "cycles"
+    assert [l.value for l in lookup_event(index, "cycles")] == [10]
+    assert [l.value for l in lookup_event(index, "instructions")] == [20]
+    assert lookup_event(index, "branches") == []
+
+
+def test_uncore_output(shape):
+    output = uncore_output(shape, random.Random(0))
+    codes = event_codes(shape.events)
+    res = interpret_uncore_event_many(output, codes)
+    assert sorted(res) == sorted(codes)
+    for per_cha in res.values():
+        assert sorted(per_cha, key=int) == [str(c) for c in range(shape.chas)]
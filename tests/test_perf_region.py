@@ -0,0 +1,112 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from rykit.perf_region import PerfRegions, interpret_region_output, perf_sample_regions
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# stands in for `perf stat --delay=-1 --control fifo:ctl,ack -I ...`: runs the
+# workload and, for every enable/disable read from ctl, prints one interval
+# block (task-clock = msec counted since the previous toggle) and acks
+FAKE_PERF = """#!{python}
+import os, subprocess, sys, threading, time
+args = sys.argv[1:]
+ctl, ack = args[args.index("--control") + 1][len("fifo:"):].split(",")
+events = [args[i + 1] for i, a in enumerate(args) if a == "-e"]
+ack_fd = os.open(ack, os.O_WRONLY)
+ctl_f = os.fdopen(os.open(ctl, os.O_RDWR), "r")
+start = last = time.monotonic()
+counting = False
+
+def control():
+    global counting, last
+    for line in ctl_f:
+        now = time.monotonic()
+        msec = (now - last) * 1e3 if counting else 0.0
+        counting, last = line.strip() == "enable", now
+        for event in events:
+            print("%.9f;%.3f;msec;%s;100;100.00;;" % (now - start, msec, event), file=sys.stderr, flush=True)
+        os.write(ack_fd, b"ack\\n")
+
+threading.Thread(target=control, daemon=True).start()
+sys.exit(subprocess.call(args[args.index("--") + 1:]))
+"""
+
+# a workload marking two regions, one of them twice
+WORKLOAD = """
+import time
+from rykit.perf_region import region
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+spin(0.05)
+with region("busy"):
+    spin(0.2)
+with region("idle"):
+    pass
+with region("busy"):
+    spin(0.1)
+"""
+
+
+def test_interpret_pairs_disables_with_blocks():
+    lines = [
+        "0.1;0;msec;task-clock;1;100.00;;",
+        "0.3;200;msec;task-clock;1;100.00;;",
+        "0.3;5;;context-switches;1;100.00;;",
+        "0.4;0;msec;task-clock;1;100.00;;",
+        "0.5;<not counted>;msec;task-clock;0;0.00;;",
+    ]
+    regions = interpret_region_output(lines, ["enable", "disable a", "enable", "disable b"])
+    assert regions == [("a", {"task-clock": 200, "context-switches": 5}), ("b", {})]
+    with pytest.raises(RuntimeError):
+        interpret_region_output(lines[:2], ["enable", "disable a", "enable", "disable b"])
+
+
+@pytest.fixture
+def fake_perf(tmp_path, monkeypatch):
+    perf = tmp_path / "perf"
+    perf.write_text(FAKE_PERF.format(python=sys.executable))
+    perf.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("PYTHONPATH", SRC)
+    # no daemon: the fake is only found on the local path
+    monkeypatch.setenv("RYKIT_PERF_DAEMON", str(tmp_path / "no-daemon.sock"))
+
+
+def test_workload_regions(fake_perf):
+    roi = PerfRegions(["task-clock"], cmd=f"{sys.executable} -c '{WORKLOAD}'", sudo=False, validate=False)
+    with roi:
+        pass
+    assert [name for name, _ in roi.regions] == ["busy", "idle", "busy"]
+    busy = roi.results()["busy"]["task-clock"]
+    assert 250 <= busy < 2000
+    assert roi.results()["idle"]["task-clock"] < 50
+
+
+def test_in_process_regions(fake_perf):
+    import time
+
+    with PerfRegions(["task-clock", "context-switches"], sudo=False, validate=False) as roi:
+        time.sleep(0.05)
+        with roi.region("sleep"):
+            time.sleep(0.1)
+    counts = roi.results()["sleep"]
+    assert set(counts) == {"task-clock", "context-switches"}
+    assert counts["task-clock"] >= 90
+
+
+@pytest.mark.skipif(shutil.which("perf") is None, reason="needs perf >= 5.10")
+def test_real_perf_software_events(monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", SRC)
+    res = perf_sample_regions(
+        f"{sys.executable} -c '{WORKLOAD}'", ["task-clock", "context-switches"], sudo=False
+    )
+    assert set(res) == {"busy", "idle"}
+    assert set(res["busy"]) == {"task-clock", "context-switches"}
+    assert res["busy"]["task-clock"] >= 250
+    assert res["idle"]["task-clock"] < res["busy"]["task-clock"]
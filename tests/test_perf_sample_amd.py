@@ -0,0 +1,17 @@
+from rykit.perf_sample_amd import interpret_amd_uncore_instances
+from rykit.topology import Topology
+
+EVENT = "amd_l3/event=0x4,umask=0xff/"
+
+
+def test_l3_instances(sysfs, shape):
+    cores = shape.sockets * shape.cores_per_socket
+    # every CPU of an L3 reads the same counter; perf renamed the event with :u
+    output = "".join(
+        f"CPU{cpu};{100 + cpu // shape.cores_per_socket % shape.sockets};;{EVENT}:u;1;100.00;;\n"
+        for cpu in range(2 * cores)
+    )
+    res = interpret_amd_uncore_instances(output, [EVENT], "amd_l3", Topology(sysfs))
+    assert sorted(res.reader_cpu.values()) == [0, shape.cores_per_socket]
+    assert res.counts.total(EVENT, 0) == 100
+    assert res.counts.total(EVENT, 1) == 101
@@ -0,0 +1,77 @@
+from typing import Dict, List
+
+import pytest
+
+from rykit.perf_interval import IntervalRecord
+from rykit.perf_steady import SteadyStateDetector, _intervals, detect_steady_state
+
+
+def stream(rates: List[Dict[str, float]], units: int = 2, step: float = 1.0) -> List[IntervalRecord]:
+    # one record per event and unit per interval; rates are per second totals
+    records = []
+    for i, per_event in enumerate(rates):
+        ts = (i + 1) * step
+        for event, rate in per_event.items():
+            for unit in range(units):
+                records.append(IntervalRecord(ts, event, str(unit), rate * step / units))
+    return records
+
+
+def test_detector_needs_a_full_flat_window():
+    det = SteadyStateDetector(window=3, rel_tol=0.01, min_warmup=1)
+    assert not det.add({"x": 50.0})  # warmup
+    assert not det.add({"x": 100.0})
+    assert not det.add({"x": 100.0})
+    assert det.add({"x": 100.0})
+
+
+def test_converges_and_reports_window_means():
+    records = stream([{"a": 10.0}] + [{"a": 100.0}] * 10)
+    res = detect_steady_state(records, window=3, rel_tol=0.01)
+    assert res.converged
+    assert res.rates["a"] == pytest.approx(100.0)
+    assert res.unit_rates["a"] == {"0": pytest.approx(50.0), "1": pytest.approx(50.0)}
+    assert res.intervals == 3
+    assert res.stopped_at < 11.0
+
+
+def test_closes_the_stream_when_converged():
+    closed = []
+
+    def gen():
+        try:
+            yield from stream([{"a": 1.0}] * 100)
+        finally:
+            closed.append(True)
+
+    assert detect_steady_state(gen(), window=3).converged
+    assert closed == [True]
+
+
+def test_drifting_series_does_not_converge():
+    records = stream([{"a": 100.0 * (1.1 ** i)} for i in range(20)])
+    res = detect_steady_state(records, window=4, rel_tol=0.02, max_duration=15.0)
+    assert not res.converged
+    assert res.stopped_at == 15.0
+
+
+def test_short_first_interval():
+    # perf drops <not counted> lines, so the first interval can have fewer
+    # records than the rest; it must not swallow records of the next one
+    records = stream([{"a": 100.0, "b": 5.0}] * 6)
+    first = [r for r in records if r.timestamp == 1.0 and r.event == "a"]
+    rest = [r for r in records if r.timestamp > 1.0]
+    grouped = list(_intervals(first + rest))
+    assert [ts for ts, _ in grouped] == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert [len(batch) for _, batch in grouped] == [2, 4, 4, 4, 4, 4]
+    res = detect_steady_state(first + rest, window=3, rel_tol=0.01)
+    assert res.converged
+    assert res.rates == {"a": pytest.approx(100.0), "b": pytest.approx(5.0)}
+
+
+def test_repeated_timestamp_is_skipped():
+    records = stream([{"a": 100.0}] * 6)
+    records.insert(2, IntervalRecord(0.0, "a", "0", 1.0))
+    res = detect_steady_state(records, window=3, rel_tol=0.01)
+    assert res.converged
+    assert res.rates["a"] == pytest.approx(100.0)
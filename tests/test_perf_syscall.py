@@ -0,0 +1,21 @@
+import pytest
+
+from rykit.perf_syscall import CounterGroup, syscall_sample_events
+
+
+@pytest.mark.parametrize("events", [["{cycles,instructions}", "cycles"], ["task-clock", "task-clock"]])
+def test_repeated_events_are_rejected(events):
+    with pytest.raises(ValueError):
+        syscall_sample_events("true", events)
+    with pytest.raises(ValueError):
+        CounterGroup(events)
+
+
+def test_software_group():
+    try:
+        with CounterGroup(["task-clock", "{page-faults,context-switches}"]) as c:
+            sum(range(100000))
+    except OSError as e:
+        pytest.skip(f"perf_event_open is not permitted here: {e}")
+    assert set(c.readings) <= {"task-clock", "page-faults", "context-switches"}
+    assert c.readings["task-clock"].value > 0
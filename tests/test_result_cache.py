@@ -0,0 +1,25 @@
+import inspect
+
+from rykit.result_cache import ResultCache
+
+
+def sample(cmd, events, runs=1):
+    """Fake sampler."""
+    sample.calls += 1
+    return {e: len(cmd) * runs for e in events}
+
+
+sample.calls = 0
+
+
+def test_cached_keeps_metadata_and_reuses_results(tmp_path):
+    wrapped = ResultCache(cache_dir=str(tmp_path)).cached(sample)
+    assert wrapped.__name__ == "sample"
+    assert wrapped.__doc__ == "Fake sampler."
+    assert str(inspect.signature(wrapped)) == "(cmd, events, runs=1)"
+    before = sample.calls
+    assert wrapped("true", ["cycles"]) == {"cycles": 4}
+    assert wrapped("true", ["cycles"]) == {"cycles": 4}
+    assert sample.calls == before + 1
+    wrapped("true", ["cycles"], force=True)
+    assert sample.calls == before + 2
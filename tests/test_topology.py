@@ -0,0 +1,44 @@
+from synthetic import make_sysfs
+
+from rykit.intel_tools import get_cha_count
+from rykit.topology import Topology, parse_range_list
+
+
+def test_parse_range_list():
+    assert parse_range_list("0-3,8,10-11") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_range_list("") == []
+
+
+def test_cpus_packages_and_cores(sysfs, shape):
+    topo = Topology(sysfs)
+    cores = shape.sockets * shape.cores_per_socket
+    assert topo.cpus == list(range(2 * cores))
+    assert topo.packages == list(range(shape.sockets))
+    assert topo.nodes == list(range(shape.sockets))
+    # cpu N and N + cores are SMT siblings of the same physical core
+    assert topo.core_of(1) == topo.core_of(1 + cores) == (0, 1)
+    assert topo.smt_siblings(1) == [1, 1 + cores]
+    assert topo.core_ids(1) == list(range(shape.cores_per_socket))
+    assert topo.node_of(shape.cores_per_socket) == 1
+
+
+def test_caches(sysfs, shape):
+    topo = Topology(sysfs)
+    assert topo.cache_names() == ["L1d", "L1i", "L2", "L3"]
+    cores = shape.sockets * shape.cores_per_socket
+    l3 = topo.cache_groups("L3")
+    assert sorted(l3) == list(range(shape.sockets))
+    assert l3[0] == [0, 1, 2, 3, cores, cores + 1, cores + 2, cores + 3]
+    assert topo.cache_id(cores - 1, "L3") == shape.sockets - 1
+
+
+def test_fingerprint_follows_sysfs(tmp_path, shape):
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    make_sysfs(a, shape)
+    make_sysfs(b, shape._replace(cores_per_socket=2))
+    assert Topology(a).fingerprint() != Topology(b).fingerprint()
+    assert Topology(a).fingerprint() == Topology(a).fingerprint()
+
+
+def test_cha_count(sysfs, shape):
+    assert get_cha_count(sysfs) == shape.chas